@@ -1,17 +1,16 @@
-from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.db import transaction
-from django.apps import apps
 
-from .services import record_order_paid
+from ctrlstore.apps.order.signals import order_paid
 
-Order = apps.get_model("order", "Order")
+from .services import record_order_paid
 
 
-@receiver(post_save, sender=Order)
-def handle_order_paid(sender, instance: Order, created: bool, **kwargs):
+@receiver(order_paid)
+def handle_order_paid(sender, order, **kwargs):
     """
-    Cuando una orden cambia a 'paid', registramos ventas al commit de la transacción.
+    Registra las ventas de la orden pagada.
+
+    ``order_paid`` se envía una sola vez por orden y ya tras el commit de la transacción
+    que la pasó a 'paid', así que no hace falta revisar el estado en cada ``save()``.
     """
-    if instance.status == "paid":
-        transaction.on_commit(lambda: record_order_paid(instance.id))
+    record_order_paid(order.id)
@@ -6,6 +6,8 @@ import hashlib
 from datetime import timedelta
 from django.utils import timezone
 
+from ctrlstore.apps.common.http import get_client_ip
+
 from .models import ProductSalesAggregate, ProcessedOrder, ProductView, ProductViewAggregate
 
 Product = apps.get_model("catalog", "Product")
@@ -68,13 +70,6 @@ def _ensure_session_key(request):
     return request.session.session_key
 
 
-def _get_client_ip(request):
-    xff = request.META.get("HTTP_X_FORWARDED_FOR")
-    if xff:
-        return xff.split(",")[0].strip()
-    return request.META.get("REMOTE_ADDR")
-
-
 def _ua_hash(request):
     ua = (request.META.get("HTTP_USER_AGENT") or "").strip()
     return hashlib.sha256(ua.encode("utf-8")).hexdigest()[:40]
@@ -86,7 +81,7 @@ def record_product_view(request, product):
     """
     session_key = _ensure_session_key(request)
     user = request.user if getattr(request, "user", None) and request.user.is_authenticated else None
-    ip = _get_client_ip(request)
+    ip = get_client_ip(request) or None
     uah = _ua_hash(request)
 
     now = timezone.now()
@@ -1,3 +1,41 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Invoice, InvoiceLine, InvoiceNumberBlock, InvoiceSeries
+
+
+@admin.register(InvoiceSeries)
+class InvoiceSeriesAdmin(admin.ModelAdmin):
+    list_display = ("code", "prefix", "next_number", "updated_at")
+    readonly_fields = ("next_number",)
+
+
+@admin.register(InvoiceNumberBlock)
+class InvoiceNumberBlockAdmin(admin.ModelAdmin):
+    list_display = ("series", "start", "end", "next_number", "leased_by", "leased_until")
+    list_filter = ("series",)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class InvoiceLineInline(admin.TabularInline):
+    model = InvoiceLine
+    extra = 0
+    can_delete = False
+    fields = ("product_name", "category_name", "quantity", "unit_price", "line_total")
+    readonly_fields = fields
+
+
+@admin.register(Invoice)
+class InvoiceAdmin(admin.ModelAdmin):
+    list_display = ("code", "customer_email", "total_amount", "currency", "issued_at")
+    list_filter = ("series",)
+    search_fields = ("code", "customer_email")
+    inlines = [InvoiceLineInline]
+
+    def has_change_permission(self, request, obj=None):
+        # Las facturas emitidas son inmutables
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,177 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("catalog", "0004_producttombstone_product_updated_at_index"),
+        ("order", "0004_shippingrate"),
+        ("payment", "0002_paymentevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceSeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("code", models.CharField(max_length=10, unique=True)),
+                ("prefix", models.CharField(max_length=10)),
+                ("next_number", models.PositiveBigIntegerField(default=1)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Serie de facturación",
+                "verbose_name_plural": "Series de facturación",
+            },
+        ),
+        migrations.CreateModel(
+            name="Invoice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("number", models.PositiveBigIntegerField()),
+                ("code", models.CharField(max_length=32, unique=True)),
+                ("customer_name", models.CharField(max_length=120)),
+                ("customer_email", models.EmailField(max_length=254)),
+                ("currency", models.CharField(default="COP", max_length=6)),
+                ("subtotal_amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("shipping_amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("total_amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("issued_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="invoices",
+                        to="order.order",
+                    ),
+                ),
+                (
+                    "payment",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="invoice",
+                        to="payment.payment",
+                    ),
+                ),
+                (
+                    "series",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="invoices",
+                        to="billing.invoiceseries",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["series", "number"],
+            },
+        ),
+        migrations.CreateModel(
+            name="InvoiceLine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("invoice_code", models.CharField(max_length=32)),
+                ("issued_at", models.DateTimeField()),
+                ("currency", models.CharField(max_length=6)),
+                ("customer_email", models.EmailField(max_length=254)),
+                ("product_name", models.CharField(max_length=120)),
+                ("category_name", models.CharField(max_length=80)),
+                ("quantity", models.PositiveIntegerField()),
+                ("unit_price", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("line_total", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "invoice",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="lines",
+                        to="billing.invoice",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="catalog.product",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["invoice", "id"],
+                "indexes": [
+                    models.Index(fields=["issued_at"], name="billing_inv_issued__e2708b_idx")
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="InvoiceNumberBlock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("start", models.PositiveBigIntegerField()),
+                ("end", models.PositiveBigIntegerField()),
+                ("next_number", models.PositiveBigIntegerField()),
+                ("leased_by", models.CharField(blank=True, max_length=120)),
+                ("leased_until", models.DateTimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "series",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="blocks",
+                        to="billing.invoiceseries",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["series", "start"],
+                "indexes": [
+                    models.Index(
+                        fields=["series", "next_number", "end"],
+                        name="billing_inv_series__17fe70_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("series", "start"), name="billing_block_unique_start"
+                    )
+                ],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["issued_at"], name="billing_inv_issued__60a8ee_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="invoice",
+            constraint=models.UniqueConstraint(
+                fields=("series", "number"), name="billing_invoice_unique_number"
+            ),
+        ),
+    ]
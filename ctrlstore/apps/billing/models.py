@@ -1,3 +1,133 @@
+from __future__ import annotations
+
+from typing import Any
+
 from django.db import models
+from django.utils import timezone
+
+
+class InvoiceSeries(models.Model):
+    """
+    Serie de facturación con su contador.
+
+    ``next_number`` es la fila contador: los workers toman de aquí bloques de números
+    (ver ``InvoiceNumberBlock``) en lugar de bloquearla por cada factura.
+    """
+
+    code = models.CharField(max_length=10, unique=True)
+    prefix = models.CharField(max_length=10)
+    next_number = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Serie de facturación"
+        verbose_name_plural = "Series de facturación"
+
+    def __str__(self) -> str:
+        return f"{self.code} ({self.prefix})"
+
+
+class InvoiceNumberBlock(models.Model):
+    """
+    Rango ``[start, end)`` de números pre-asignado a un worker.
+
+    El worker consume su bloque bloqueando solo esta fila, así varios workers emiten
+    facturas sin esperar el mismo lock. Si el worker muere, su arrendamiento vence y
+    otro worker termina de consumir el bloque: ningún número queda sin usar.
+    """
+
+    series = models.ForeignKey(InvoiceSeries, on_delete=models.PROTECT, related_name="blocks")
+    start = models.PositiveBigIntegerField()
+    end = models.PositiveBigIntegerField()
+    next_number = models.PositiveBigIntegerField()
+    leased_by = models.CharField(max_length=120, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["series", "start"]
+        constraints = [
+            models.UniqueConstraint(fields=["series", "start"], name="billing_block_unique_start"),
+        ]
+        indexes = [models.Index(fields=["series", "next_number", "end"])]
+
+    def __str__(self) -> str:
+        return f"{self.series.code} [{self.start}, {self.end})"
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self.next_number >= self.end
+
+
+class Invoice(models.Model):
+    """Factura emitida para un pago capturado. Número único y consecutivo por serie."""
+
+    series = models.ForeignKey(InvoiceSeries, on_delete=models.PROTECT, related_name="invoices")
+    number = models.PositiveBigIntegerField()
+    code = models.CharField(max_length=32, unique=True)  # prefijo + número, p. ej. FE-00000042
+
+    payment = models.OneToOneField("payment.Payment", on_delete=models.PROTECT, related_name="invoice")
+    order = models.ForeignKey("order.Order", on_delete=models.PROTECT, related_name="invoices")
+
+    customer_name = models.CharField(max_length=120)
+    customer_email = models.EmailField()
+    currency = models.CharField(max_length=6, default="COP")
+    subtotal_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    shipping_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    issued_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["series", "number"]
+        constraints = [
+            models.UniqueConstraint(fields=["series", "number"], name="billing_invoice_unique_number"),
+        ]
+        indexes = [models.Index(fields=["issued_at"])]
+
+    def __str__(self) -> str:
+        return self.code
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        if not self._state.adding:
+            raise ValueError("Una factura emitida no se modifica")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args: Any, **kwargs: Any):
+        raise ValueError("Una factura emitida no se elimina")
+
+
+class InvoiceLine(models.Model):
+    """
+    Línea del libro de facturación, copiada del OrderItem al emitir la factura.
+
+    Es de solo inserción y trae desnormalizados los datos de la factura y del producto
+    para que reportes y exportes tributarios lean solo esta tabla.
+    """
+
+    invoice = models.ForeignKey(Invoice, on_delete=models.PROTECT, related_name="lines")
+    invoice_code = models.CharField(max_length=32)
+    issued_at = models.DateTimeField()
+    currency = models.CharField(max_length=6)
+    customer_email = models.EmailField()
+
+    product = models.ForeignKey("catalog.Product", on_delete=models.SET_NULL, null=True, related_name="+")
+    product_name = models.CharField(max_length=120)
+    category_name = models.CharField(max_length=80)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        ordering = ["invoice", "id"]
+        indexes = [models.Index(fields=["issued_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.invoice_code} – {self.product_name} x{self.quantity}"
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        if not self._state.adding:
+            raise ValueError("Las líneas de factura no se modifican")
+        super().save(*args, **kwargs)
 
-# Create your models here.
+    def delete(self, *args: Any, **kwargs: Any):
+        raise ValueError("Las líneas de factura no se eliminan")
@@ -0,0 +1,201 @@
+"""
+Servicios de facturación.
+Implementa la lógica de negocio siguiendo el principio "Thin Views, Fat Services".
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Invoice, InvoiceLine, InvoiceNumberBlock, InvoiceSeries
+
+logger = logging.getLogger(__name__)
+
+# Bloque arrendado por cada hilo: {series_id: block_id}
+_leases = threading.local()
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class InvoiceNumberingService:
+    """
+    Numeración consecutiva y sin huecos por serie.
+
+    Cada worker arrienda un bloque de ``BILLING_NUMBER_BLOCK_SIZE`` números tomado de la
+    fila contador de la serie y lo consume bloqueando solo la fila del bloque. El número
+    se asigna en la misma transacción que crea la factura: si esta se revierte, el número
+    vuelve al bloque. Los bloques de workers inactivos vencen a los
+    ``BILLING_BLOCK_LEASE_SECONDS`` y otro worker los termina, del menor al mayor.
+
+    Con bloques de tamaño 1 los números además siguen el orden de emisión.
+    """
+
+    @staticmethod
+    def block_size() -> int:
+        return max(int(getattr(settings, "BILLING_NUMBER_BLOCK_SIZE", 20)), 1)
+
+    @staticmethod
+    def lease_ttl() -> timedelta:
+        return timedelta(seconds=getattr(settings, "BILLING_BLOCK_LEASE_SECONDS", 300))
+
+    @staticmethod
+    def get_series(code: Optional[str] = None) -> InvoiceSeries:
+        """Serie ``code`` (``BILLING_DEFAULT_SERIES`` por defecto), creada si no existe."""
+        code = code or getattr(settings, "BILLING_DEFAULT_SERIES", "FE")
+        series, _ = InvoiceSeries.objects.get_or_create(code=code, defaults={"prefix": code})
+        return series
+
+    @staticmethod
+    def _claim_block(series: InvoiceSeries, worker: str, now) -> InvoiceNumberBlock:
+        """Arrienda un bloque huérfano con números pendientes o reserva uno nuevo."""
+        leased_until = now + InvoiceNumberingService.lease_ttl()
+
+        # Primero se terminan los bloques propios o de workers que ya no los usan
+        orphan = (
+            InvoiceNumberBlock.objects.select_for_update(skip_locked=True)
+            .filter(series=series, next_number__lt=F("end"))
+            .filter(Q(leased_by=worker) | Q(leased_until__isnull=True) | Q(leased_until__lt=now))
+            .order_by("start")
+            .first()
+        )
+        if orphan is not None:
+            orphan.leased_by = worker
+            orphan.leased_until = leased_until
+            orphan.save(update_fields=["leased_by", "leased_until"])
+            return orphan
+
+        # Lock breve de la fila contador solo para reservar el rango
+        counter = InvoiceSeries.objects.select_for_update().get(pk=series.pk)
+        start = counter.next_number
+        end = start + InvoiceNumberingService.block_size()
+        InvoiceSeries.objects.filter(pk=series.pk).update(next_number=end, updated_at=now)
+        return InvoiceNumberBlock.objects.create(
+            series=series,
+            start=start,
+            end=end,
+            next_number=start,
+            leased_by=worker,
+            leased_until=leased_until,
+        )
+
+    @staticmethod
+    def next_number(series: InvoiceSeries) -> int:
+        """
+        Siguiente número de la serie para este worker.
+
+        Debe llamarse dentro de la transacción que crea la factura.
+
+        Returns:
+            Número asignado
+        """
+        if not transaction.get_connection().in_atomic_block:
+            raise RuntimeError("next_number debe ejecutarse dentro de transaction.atomic()")
+
+        worker = _worker_id()
+        now = timezone.now()
+        held = getattr(_leases, "blocks", None)
+        if held is None:
+            held = _leases.blocks = {}
+
+        block = None
+        if series.pk in held:
+            block = (
+                InvoiceNumberBlock.objects.select_for_update()
+                .filter(pk=held[series.pk], leased_by=worker, next_number__lt=F("end"))
+                .first()
+            )
+        if block is None:
+            block = InvoiceNumberingService._claim_block(series, worker, now)
+
+        number = block.next_number
+        InvoiceNumberBlock.objects.filter(pk=block.pk).update(
+            next_number=F("next_number") + 1,
+            leased_until=now + InvoiceNumberingService.lease_ttl(),
+        )
+        held[series.pk] = block.pk
+        return number
+
+    @staticmethod
+    def release_blocks() -> int:
+        """Libera los bloques de este worker (p. ej. al apagarse) para que otro los termine."""
+        _leases.blocks = {}
+        return InvoiceNumberBlock.objects.filter(
+            leased_by=_worker_id(), next_number__lt=F("end")
+        ).update(leased_until=None)
+
+
+class InvoiceService:
+    """Emisión de facturas y su libro de líneas."""
+
+    @staticmethod
+    def format_code(series: InvoiceSeries, number: int) -> str:
+        return f"{series.prefix}-{number:08d}"
+
+    @staticmethod
+    def issue_for_payment(payment, series_code: Optional[str] = None) -> Invoice:
+        """
+        Emite la factura de un pago capturado copiando sus items al libro.
+
+        Si el pago ya tiene factura, la retorna sin emitir otra.
+
+        Args:
+            payment: Pago capturado
+            series_code: Serie a usar (la por defecto si no se indica)
+
+        Returns:
+            Factura del pago
+        """
+        existing = Invoice.objects.filter(payment=payment).first()
+        if existing is not None:
+            return existing
+
+        order = payment.order
+        items = list(order.items.select_related("product__category").order_by("id"))
+        series = InvoiceNumberingService.get_series(series_code)
+
+        with transaction.atomic():
+            number = InvoiceNumberingService.next_number(series)
+            invoice = Invoice.objects.create(
+                series=series,
+                number=number,
+                code=InvoiceService.format_code(series, number),
+                payment=payment,
+                order=order,
+                customer_name=order.full_name,
+                customer_email=order.email,
+                currency=payment.currency,
+                subtotal_amount=order.subtotal_amount,
+                shipping_amount=order.shipping_amount,
+                total_amount=order.total_amount,
+            )
+            InvoiceLine.objects.bulk_create([
+                InvoiceLine(
+                    invoice=invoice,
+                    invoice_code=invoice.code,
+                    issued_at=invoice.issued_at,
+                    currency=invoice.currency,
+                    customer_email=invoice.customer_email,
+                    product=it.product,
+                    product_name=it.product.name,
+                    category_name=it.product.category.name,
+                    quantity=it.quantity,
+                    unit_price=it.unit_price,
+                    line_total=it.line_total,
+                )
+                for it in items
+            ])
+
+        logger.info(f"Factura {invoice.code} emitida para el pago {payment.id}")
+        return invoice
@@ -1,3 +1,116 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ctrlstore.apps.catalog.models import Category, Product
+from ctrlstore.apps.order.models import Order, OrderItem
+from ctrlstore.apps.payment.models import Payment
+from ctrlstore.apps.payment.services import AuthResult, capture_payment
+
+from . import services
+from .models import Invoice, InvoiceLine, InvoiceNumberBlock, InvoiceSeries
+from .services import InvoiceNumberingService, InvoiceService
+
+User = get_user_model()
+
+
+@override_settings(BILLING_NUMBER_BLOCK_SIZE=3)
+class InvoiceNumberingTests(TestCase):
+    """Pruebas de la numeración por bloques."""
+
+    def setUp(self):
+        services._leases.blocks = {}
+        self.series = InvoiceNumberingService.get_series("FE")
+
+    def _next(self):
+        with transaction.atomic():
+            return InvoiceNumberingService.next_number(self.series)
+
+    def test_numbers_are_consecutive_across_blocks(self):
+        self.assertEqual([self._next() for _ in range(7)], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(InvoiceNumberBlock.objects.count(), 3)
+        self.series.refresh_from_db()
+        self.assertEqual(self.series.next_number, 10)
+
+    def test_rolled_back_number_is_reused(self):
+        self.assertEqual(self._next(), 1)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                InvoiceNumberingService.next_number(self.series)
+                raise RuntimeError("falla al crear la factura")
+        self.assertEqual(self._next(), 2)
+
+    def test_workers_use_separate_blocks_and_orphans_are_finished(self):
+        with mock.patch.object(services, "_worker_id", return_value="worker-a"):
+            self.assertEqual(self._next(), 1)
+        services._leases.blocks = {}
+        with mock.patch.object(services, "_worker_id", return_value="worker-b"):
+            self.assertEqual(self._next(), 4)
+
+        # worker-a deja de responder: su bloque vence y worker-b lo termina
+        InvoiceNumberBlock.objects.filter(leased_by="worker-a").update(
+            leased_until=timezone.now() - timedelta(seconds=1)
+        )
+        services._leases.blocks = {}
+        with mock.patch.object(services, "_worker_id", return_value="worker-b"):
+            self.assertEqual([self._next(), self._next(), self._next()], [2, 3, 5])
+
+
+class InvoiceIssueTests(TestCase):
+    """Pruebas de la emisión de facturas al capturar un pago."""
+
+    def setUp(self):
+        services._leases.blocks = {}
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.product = Product.objects.create(
+            name="Consola", slug="consola", price=Decimal("100.00"), category=category, stock_quantity=5
+        )
+        user = User.objects.create_user(
+            username="cliente", email="cliente@example.com", password="clave-segura-123"
+        )
+        self.order = Order.objects.create(
+            user=user, email="cliente@example.com", full_name="Cliente", address_line1="Calle 1",
+            city="Medellín", subtotal_amount=Decimal("200.00"), shipping_amount=Decimal("15.00"),
+            total_amount=Decimal("215.00"),
+        )
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2,
+            unit_price=Decimal("100.00"), line_total=Decimal("200.00"),
+        )
+        self.payment = Payment.objects.create(
+            order=self.order, amount=self.order.total_amount, status="initiated"
+        )
+
+    def test_capture_issues_invoice_with_ledger_lines(self):
+        capture_payment(self.payment.id, AuthResult(True, auth_code="OK"))
+
+        invoice = Invoice.objects.get(payment=self.payment)
+        self.assertEqual(invoice.code, "FE-00000001")
+        self.assertEqual(invoice.total_amount, Decimal("215.00"))
+        line = InvoiceLine.objects.get()
+        self.assertEqual(
+            (line.invoice_code, line.product_name, line.category_name, line.quantity, line.line_total),
+            ("FE-00000001", "Consola", "Gaming", 2, Decimal("200.00")),
+        )
+
+        # El libro no cambia aunque cambie el catálogo
+        Product.objects.filter(pk=self.product.pk).update(name="Consola Pro")
+        line.refresh_from_db()
+        self.assertEqual(line.product_name, "Consola")
+
+    def test_invoice_is_issued_once_and_immutable(self):
+        capture_payment(self.payment.id, AuthResult(True, auth_code="OK"))
+        self.payment.refresh_from_db()
+        invoice = InvoiceService.issue_for_payment(self.payment)
+
+        self.assertEqual(Invoice.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            invoice.save()
+        with self.assertRaises(ValueError):
+            invoice.delete()
+        self.assertEqual(InvoiceSeries.objects.get().code, "FE")
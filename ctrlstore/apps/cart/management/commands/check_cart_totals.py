@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from ctrlstore.apps.cart.services import CartService
+
+
+class Command(BaseCommand):
+    help = "Verifica que item_count y total_amount de los carritos coincidan con sus items"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Recalcula los totales de los carritos inconsistentes",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Máximo de carritos inconsistentes a listar (por defecto 20)",
+        )
+
+    def handle(self, *args, **options):
+        inconsistent = CartService.find_inconsistent_totals()
+        cart_ids = list(inconsistent.values_list("pk", flat=True))
+
+        if not cart_ids:
+            self.stdout.write(self.style.SUCCESS("✓ Totales de carritos consistentes"))
+            return
+
+        self.stdout.write(
+            self.style.WARNING(f"⚠ {len(cart_ids)} carrito(s) con totales inconsistentes")
+        )
+        for cart in inconsistent[: options["limit"]]:
+            self.stdout.write(
+                f"  Cart {cart.pk}: item_count={cart.item_count} (real {cart.actual_count}), "
+                f"total_amount={cart.total_amount} (real {cart.actual_total})"
+            )
+
+        if options["fix"]:
+            updated = CartService.recalculate_totals(cart_ids)
+            self.stdout.write(self.style.SUCCESS(f"✓ {updated} carrito(s) recalculados"))
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ctrlstore.apps.cart.services import CartCleanupService
+
+
+class Command(BaseCommand):
+    help = "Elimina carritos anónimos abandonados cuya sesión ya expiró"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=30,
+            help="Antigüedad mínima (días sin actividad) del carrito (por defecto 30)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Carritos por lote (por defecto 500)",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Segundos de espera entre lotes (por defecto 0)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo cuenta los carritos que se eliminarían",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Buscando carritos anónimos con más de {options['days']} días sin actividad..."
+        )
+        stats = CartCleanupService.reap_stale_anonymous_carts(
+            timedelta(days=options["days"]),
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            pause=options["pause"],
+            progress=self.stdout.write,
+        )
+
+        if options["dry_run"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"⚠ Simulación: se eliminarían {stats['carts']} carritos y {stats['items']} items"
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"✓ Eliminados {stats['carts']} carritos y {stats['items']} items"
+                )
+            )
@@ -10,6 +10,10 @@ class Cart(models.Model):
     session_key = models.CharField(max_length=40, blank=True, db_index=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Totales desnormalizados: los mantiene CartService en la misma transacción
+    # que cada escritura de CartItem (ver CartService.recalculate_totals)
+    item_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     class Meta:
         indexes = [
@@ -23,11 +27,11 @@ class Cart(models.Model):
 
     @property
     def items_count(self):
-        return sum(i.quantity for i in self.items.all())
+        return self.item_count
 
     @property
     def total(self):
-        return sum(i.subtotal for i in self.items.select_related("product"))
+        return self.total_amount
 
 
 class CartItem(models.Model):
@@ -6,12 +6,22 @@ Implementa la lógica de negocio siguiendo el principio "Thin Views, Fat Service
 from __future__ import annotations
 
 import logging
+import time
+from datetime import timedelta
 from decimal import Decimal
+from importlib import import_module
 from typing import TYPE_CHECKING, Optional
 
+from django.apps import apps
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.http import HttpRequest
+from django.utils import timezone
+
+from ctrlstore.apps.common.exceptions import CartItemError, StockError
 
 from .models import Cart, CartItem
 from .utils import get_or_create_cart
@@ -21,6 +31,13 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _line_total(prefix: str = ""):
+    """Expresión SQL de ``quantity * unit_price`` de un CartItem."""
+    return ExpressionWrapper(F(f"{prefix}quantity") * F(f"{prefix}unit_price"), output_field=_MONEY)
+
 
 class CartService:
     """Servicio para gestión del carrito de compras."""
@@ -66,8 +83,11 @@ class CartService:
             )
             
             if not created:
-                item.quantity += quantity
-                item.save()
+                # Suma en la base de datos: dos peticiones simultáneas no pierden unidades
+                CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + quantity)
+                item.refresh_from_db(fields=['quantity'])
+            
+            CartService._apply_totals_delta(cart, quantity, item.unit_price * quantity)
             
             logger.info(
                 "Producto agregado al carrito",
@@ -108,10 +128,24 @@ class CartService:
         cart = get_or_create_cart(request)
         
         try:
-            item = CartItem.objects.get(id=item_id, cart=cart)
+            with transaction.atomic():
+                # El delta de los totales sale de la fila bloqueada, no de una lectura vieja
+                item = (
+                    CartItem.objects.select_related('product')
+                    .select_for_update(of=('self',))
+                    .get(id=item_id, cart=cart)
+                )
+                delta = quantity - item.quantity
+                
+                if quantity == 0:
+                    item.delete()
+                else:
+                    item.quantity = quantity
+                    item.save()
+                
+                CartService._apply_totals_delta(cart, delta, item.unit_price * delta)
             
             if quantity == 0:
-                item.delete()
                 logger.info(
                     "Item eliminado del carrito",
                     extra={
@@ -122,9 +156,6 @@ class CartService:
                 )
                 return None
             else:
-                item.quantity = quantity
-                item.save()
-                
                 logger.info(
                     "Cantidad de item actualizada en el carrito",
                     extra={
@@ -158,9 +189,15 @@ class CartService:
         cart = get_or_create_cart(request)
         
         try:
-            item = CartItem.objects.get(id=item_id, cart=cart)
-            product_name = item.product.name
-            item.delete()
+            with transaction.atomic():
+                item = (
+                    CartItem.objects.select_related('product')
+                    .select_for_update(of=('self',))
+                    .get(id=item_id, cart=cart)
+                )
+                product_name = item.product.name
+                item.delete()
+                CartService._apply_totals_delta(cart, -item.quantity, -item.subtotal)
             
             logger.info(
                 "Item eliminado del carrito",
@@ -188,9 +225,14 @@ class CartService:
             True si se vació exitosamente
         """
         cart = get_or_create_cart(request)
-        items_count = cart.items.count()
         
-        cart.items.all().delete()
+        with transaction.atomic():
+            items_count, _ = cart.items.all().delete()
+            Cart.objects.filter(pk=cart.pk).update(
+                item_count=0, total_amount=Decimal("0"), updated_at=timezone.now()
+            )
+            cart.item_count = 0
+            cart.total_amount = Decimal("0")
         
         logger.info(
             "Carrito vaciado",
@@ -216,13 +258,10 @@ class CartService:
         """
         items = cart.items.select_related('product').all()
         
-        total_items = sum(item.quantity for item in items)
-        total_amount = sum(item.subtotal for item in items)
-        
         return {
             'items': items,
-            'total_items': total_items,
-            'total_amount': total_amount,
+            'total_items': cart.item_count,
+            'total_amount': cart.total_amount,
             'items_count': len(items),
         }
     
@@ -231,6 +270,10 @@ class CartService:
         """
         Fusiona un carrito de sesión con el carrito del usuario.
         
+        Los items se copian con un único ``INSERT ... SELECT ... ON CONFLICT`` que
+        suma cantidades si el producto ya estaba en el carrito del usuario; luego se
+        elimina el carrito de sesión. El número de consultas no depende de los items.
+        
         Args:
             user_cart: Carrito del usuario autenticado
             session_cart: Carrito de la sesión anónima
@@ -241,33 +284,349 @@ class CartService:
         if user_cart.id == session_cart.id:
             return user_cart
         
+        table = connection.ops.quote_name(CartItem._meta.db_table)
+        session_cart_id = session_cart.id
+        
         with transaction.atomic():
-            for session_item in session_cart.items.all():
-                user_item, created = user_cart.items.get_or_create(
-                    product=session_item.product,
-                    defaults={
-                        'quantity': session_item.quantity,
-                        'unit_price': session_item.unit_price
-                    }
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} (cart_id, product_id, quantity, unit_price) "
+                    f"SELECT %s, product_id, quantity, unit_price FROM {table} WHERE cart_id = %s "
+                    f"ON CONFLICT (cart_id, product_id) DO UPDATE "
+                    f"SET quantity = {table}.quantity + excluded.quantity",
+                    [user_cart.id, session_cart_id],
                 )
-                
-                if not created:
-                    user_item.quantity += session_item.quantity
-                    user_item.save()
+                merged_items = cursor.rowcount
             
-            # Eliminar el carrito de sesión
+            # Eliminar el carrito de sesión (y sus items)
             session_cart.delete()
             
-            logger.info(
-                "Carritos fusionados exitosamente",
-                extra={
-                    "user_cart_id": user_cart.id,
-                    "session_cart_id": session_cart.id,
-                    "user_id": user_cart.user.id if user_cart.user else None,
+            # Los productos repetidos conservan el precio del carrito del usuario,
+            # así que el total se recalcula en SQL en lugar de sumar los del carrito anónimo
+            CartService.recalculate_totals([user_cart.id])
+        
+        user_cart.refresh_from_db(fields=['item_count', 'total_amount'])
+        
+        logger.info(
+            "Carritos fusionados exitosamente",
+            extra={
+                "user_cart_id": user_cart.id,
+                "session_cart_id": session_cart_id,
+                "merged_items": merged_items,
+                "user_id": user_cart.user_id,
+            }
+        )
+        
+        return user_cart
+
+
+    @staticmethod
+    def apply_batch(request: HttpRequest, operations: list[dict]) -> Cart:
+        """
+        Aplica un lote de operaciones ``{product_id, quantity}`` sobre el carrito.
+        
+        ``quantity`` es la cantidad final del producto en el carrito (0 lo elimina).
+        El stock de todos los productos se valida con una sola consulta y el lote se
+        aplica en una transacción con escrituras masivas: un DELETE para las
+        eliminaciones y un upsert para las altas y cambios de cantidad. Si alguna
+        operación es inválida no se aplica ninguna.
+        
+        Args:
+            request: Request HTTP
+            operations: Lista de operaciones
+            
+        Returns:
+            Carrito con los totales actualizados
+            
+        Raises:
+            CartItemError: Si el lote está mal formado o incluye productos no disponibles
+            StockError: Si alguna cantidad supera el stock disponible
+        """
+        Product = apps.get_model('catalog', 'Product')
+        
+        quantities: dict[int, int] = {}
+        for op in operations:
+            try:
+                product_id = int(op['product_id'])
+                quantity = int(op['quantity'])
+            except (KeyError, TypeError, ValueError):
+                raise CartItemError(
+                    "Operación inválida", error_code="invalid_operation", details={"operation": op}
+                )
+            if quantity < 0:
+                raise CartItemError(
+                    "La cantidad no puede ser negativa",
+                    error_code="invalid_quantity",
+                    details={"product_id": product_id},
+                )
+            if product_id in quantities:
+                raise CartItemError(
+                    "Producto repetido en el lote",
+                    error_code="duplicate_product",
+                    details={"product_id": product_id},
+                )
+            quantities[product_id] = quantity
+        
+        if not quantities:
+            raise CartItemError("El lote no contiene operaciones", error_code="empty_batch")
+        
+        products = Product.objects.only(
+            'id', 'name', 'price', 'stock_quantity', 'is_active'
+        ).in_bulk(list(quantities))
+        
+        errors = []
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if quantity == 0:
+                continue
+            if product is None or not product.is_active:
+                errors.append({"product_id": product_id, "error": "Producto no disponible"})
+            elif product.stock_quantity is not None and quantity > product.stock_quantity:
+                errors.append({
+                    "product_id": product_id,
+                    "error": "No hay stock suficiente",
+                    "available": product.stock_quantity,
+                    "requested": quantity,
+                })
+        if errors:
+            exc = StockError if all("available" in e for e in errors) else CartItemError
+            raise exc(
+                "El lote contiene operaciones inválidas",
+                error_code="invalid_batch",
+                details={"errors": errors},
+            )
+        
+        cart = get_or_create_cart(request)
+        removed = [pid for pid, qty in quantities.items() if qty == 0]
+        upserts = [
+            CartItem(cart=cart, product_id=pid, quantity=qty, unit_price=products[pid].price)
+            for pid, qty in quantities.items() if qty > 0
+        ]
+        
+        with transaction.atomic():
+            if removed:
+                CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+            if upserts:
+                # Los items existentes conservan su precio; solo cambia la cantidad
+                CartItem.objects.bulk_create(
+                    upserts,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity'],
+                )
+            CartService.recalculate_totals([cart.id])
+        
+        cart.refresh_from_db(fields=['item_count', 'total_amount', 'updated_at'])
+        
+        logger.info(
+            "Lote de operaciones aplicado al carrito",
+            extra={
+                "cart_id": cart.id,
+                "upserted": len(upserts),
+                "removed": len(removed),
+                "user_id": request.user.id if request.user.is_authenticated else None,
+            }
+        )
+        
+        return cart
+    
+    @staticmethod
+    def serialize_cart(cart: Cart) -> dict:
+        """
+        Representación JSON del carrito para la API.
+        
+        Args:
+            cart: Carrito a serializar
+            
+        Returns:
+            Diccionario con totales e items
+        """
+        items = cart.items.select_related('product').order_by('id')
+        return {
+            'cart_id': cart.id,
+            'item_count': cart.item_count,
+            'total_amount': cart.total_amount,
+            'items': [
+                {
+                    'id': item.id,
+                    'product_id': item.product_id,
+                    'name': item.product.name,
+                    'slug': item.product.slug,
+                    'quantity': item.quantity,
+                    'unit_price': item.unit_price,
+                    'subtotal': item.subtotal,
                 }
+                for item in items
+            ],
+        }
+    
+    @staticmethod
+    def _apply_totals_delta(cart: Cart, quantity: int, amount: Decimal) -> None:
+        """
+        Ajusta los totales desnormalizados del carrito con expresiones F.
+        
+        Debe llamarse dentro de la misma transacción que la escritura del CartItem.
+        """
+        if not quantity:
+            return
+        Cart.objects.filter(pk=cart.pk).update(
+            item_count=F('item_count') + quantity,
+            total_amount=F('total_amount') + amount,
+            updated_at=timezone.now(),
+        )
+        cart.item_count += quantity
+        cart.total_amount += amount
+    
+    @staticmethod
+    def recalculate_totals(cart_ids: Optional[list[int]] = None) -> int:
+        """
+        Recalcula ``item_count`` y ``total_amount`` a partir de los items.
+
+        También actualiza ``updated_at``: es la actividad que mira ``reap_stale_carts``.
+        
+        Args:
+            cart_ids: Carritos a recalcular (todos si es None)
+            
+        Returns:
+            Número de carritos actualizados
+        """
+        per_cart = CartItem.objects.filter(cart=OuterRef('pk')).values('cart')
+        carts = Cart.objects.all() if cart_ids is None else Cart.objects.filter(pk__in=cart_ids)
+        return carts.update(
+            item_count=Coalesce(Subquery(per_cart.annotate(s=Sum('quantity')).values('s')), 0),
+            total_amount=Coalesce(
+                Subquery(per_cart.annotate(s=Sum(_line_total())).values('s')),
+                Decimal('0'),
+                output_field=_MONEY,
+            ),
+            updated_at=timezone.now(),
+        )
+    
+    @staticmethod
+    def find_inconsistent_totals():
+        """
+        Carritos cuyos totales desnormalizados no coinciden con sus items.
+        
+        Returns:
+            QuerySet anotado con ``actual_count`` y ``actual_total``
+        """
+        return (
+            Cart.objects
+            .annotate(
+                actual_count=Coalesce(Sum('items__quantity'), 0),
+                actual_total=Coalesce(Sum(_line_total('items__')), Decimal('0'), output_field=_MONEY),
+            )
+            .exclude(item_count=F('actual_count'), total_amount=F('actual_total'))
+            .order_by('pk')
+        )
+
+
+class CartCleanupService:
+    """Servicio para depurar carritos anónimos abandonados."""
+    
+    @staticmethod
+    def stale_anonymous_carts(older_than: timedelta):
+        """
+        Carritos anónimos sin actividad desde ``older_than`` y cuya sesión ya expiró.
+        
+        Con sesiones en base de datos la expiración se verifica con un anti-join sobre
+        ``django_session``; con otros motores se consulta el SessionStore por lote.
+        
+        Args:
+            older_than: Antigüedad mínima de ``updated_at``
+            
+        Returns:
+            QuerySet de carritos candidatos
+        """
+        now = timezone.now()
+        carts = Cart.objects.filter(user__isnull=True, updated_at__lt=now - older_than)
+        if CartCleanupService._db_sessions():
+            from django.contrib.sessions.models import Session
+            
+            carts = carts.exclude(
+                Exists(Session.objects.filter(session_key=OuterRef('session_key'), expire_date__gt=now))
             )
+        return carts
+    
+    @staticmethod
+    def reap_stale_anonymous_carts(
+        older_than: timedelta,
+        batch_size: int = 500,
+        dry_run: bool = False,
+        pause: float = 0,
+        progress=None,
+    ) -> dict:
+        """
+        Elimina carritos anónimos abandonados (y sus items) en lotes acotados.
+        
+        Recorre los candidatos por llave primaria y borra cada lote en su propia
+        transacción corta, volviendo a aplicar el filtro al borrar: un carrito que
+        recibió actividad mientras tanto se conserva. Un carrito con la sesión
+        expirada ya no es alcanzable desde ninguna petición, así que borrarlo con
+        tráfico en vivo es seguro.
+        
+        Args:
+            older_than: Antigüedad mínima de ``updated_at``
+            batch_size: Carritos por lote
+            dry_run: Solo cuenta los candidatos, sin borrar
+            pause: Segundos de espera entre lotes para ceder la base de datos
+            progress: callable(str) para reportar avance
             
-            return user_cart
+        Returns:
+            Diccionario con ``carts`` e ``items`` eliminados (o candidatos en dry_run)
+        """
+        candidates = CartCleanupService.stale_anonymous_carts(older_than)
+        check_sessions = not CartCleanupService._db_sessions()
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        
+        stats = {'carts': 0, 'items': 0, 'batches': 0}
+        last_pk = 0
+        while True:
+            batch = list(
+                candidates.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'session_key')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            ids = [
+                pk for pk, session_key in batch
+                if not (check_sessions and session_key and session_store().exists(session_key))
+            ]
+            
+            if dry_run:
+                stats['carts'] += len(ids)
+                stats['items'] += CartItem.objects.filter(cart_id__in=ids).count()
+            elif ids:
+                with transaction.atomic():
+                    _, deleted = CartCleanupService.stale_anonymous_carts(older_than).filter(
+                        pk__in=ids
+                    ).delete()
+                stats['carts'] += deleted.get(Cart._meta.label, 0)
+                stats['items'] += deleted.get(CartItem._meta.label, 0)
+            
+            stats['batches'] += 1
+            if progress:
+                progress(
+                    f"  lote {stats['batches']}: {stats['carts']} carritos, "
+                    f"{stats['items']} items (último id {last_pk})"
+                )
+            if pause:
+                time.sleep(pause)
+        
+        logger.info(
+            "Carritos anónimos abandonados depurados",
+            extra={**stats, "dry_run": dry_run, "older_than_days": older_than.days},
+        )
+        return stats
+    
+    @staticmethod
+    def _db_sessions() -> bool:
+        return settings.SESSION_ENGINE in (
+            'django.contrib.sessions.backends.db',
+            'django.contrib.sessions.backends.cached_db',
+        )
 
 
 class CartValidationService:
@@ -278,6 +637,10 @@ class CartValidationService:
         """
         Valida que el carrito esté listo para checkout.
         
+        Una sola consulta anotada retorna solo los items con problemas (producto
+        inactivo, stock insuficiente o precio cambiado), así que el número de
+        consultas no depende del tamaño del carrito.
+        
         Args:
             cart: Carrito a validar
             
@@ -287,32 +650,42 @@ class CartValidationService:
         errors = []
         warnings = []
         
-        if not cart.items.exists():
+        if not cart.item_count:
             errors.append("El carrito está vacío")
             return {'valid': False, 'errors': errors, 'warnings': warnings}
         
-        # Verificar stock de productos
-        for item in cart.items.select_related('product').all():
-            product = item.product
-            
-            if not product.is_active:
-                errors.append(f"El producto '{product.name}' no está disponible")
-                continue
+        offending = (
+            cart.items
+            .filter(
+                Q(product__is_active=False)
+                | Q(quantity__gt=F('product__stock_quantity'))
+                | ~Q(unit_price=F('product__price'))
+            )
+            .annotate(
+                name=F('product__name'),
+                is_active=F('product__is_active'),
+                stock=F('product__stock_quantity'),
+                price=F('product__price'),
+            )
+            .order_by('id')
+            .values('quantity', 'unit_price', 'name', 'is_active', 'stock', 'price')
+        )
+        
+        for row in offending:
+            if not row['is_active']:
+                errors.append(f"El producto '{row['name']}' no está disponible")
+            elif row['quantity'] > row['stock']:
+                errors.append(
+                    f"No hay suficiente stock para '{row['name']}'. "
+                    f"Disponible: {row['stock']}, "
+                    f"Solicitado: {row['quantity']}"
+                )
             
-            if hasattr(product, 'stock_quantity') and product.stock_quantity is not None:
-                if item.quantity > product.stock_quantity:
-                    errors.append(
-                        f"No hay suficiente stock para '{product.name}'. "
-                        f"Disponible: {product.stock_quantity}, "
-                        f"Solicitado: {item.quantity}"
-                    )
-        
-        # Verificar precios
-        for item in cart.items.select_related('product').all():
-            if item.unit_price != item.product.price:
+            # Verificar precios
+            if row['unit_price'] != row['price']:
                 warnings.append(
-                    f"El precio de '{item.product.name}' ha cambiado. "
-                    f"Precio actual: ${item.product.price}"
+                    f"El precio de '{row['name']}' ha cambiado. "
+                    f"Precio actual: ${row['price']}"
                 )
         
         return {
@@ -1,3 +1,396 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ctrlstore.apps.catalog.models import Category, Product
+
+from .models import Cart, CartItem
+from .services import CartService, CartValidationService
+from .utils import get_or_create_cart
+
+User = get_user_model()
+
+
+class CartMergeTests(TestCase):
+    """Pruebas de la fusión de carritos anónimos con el carrito del usuario."""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name="Gaming", slug="gaming", category_type="gaming"
+        )
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}",
+                slug=f"producto-{i}",
+                price=Decimal("1000.00"),
+                category=self.category,
+                stock_quantity=100,
+            )
+            for i in range(30)
+        ]
+        self.user = User.objects.create_user(username="cliente", password="clave-segura-123")
+        self.user_cart = Cart.objects.create(user=self.user)
+        self.anon_cart = Cart.objects.create(session_key="anon-session")
+
+    def _fill(self, cart, products, quantity, unit_price=Decimal("1000.00")):
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=p, quantity=quantity, unit_price=unit_price)
+            for p in products
+        )
+
+    def test_merge_sums_overlapping_items_and_deletes_anon_cart(self):
+        self._fill(self.user_cart, self.products[:2], 1, unit_price=Decimal("900.00"))
+        self._fill(self.anon_cart, self.products[1:3], 2)
+
+        CartService.merge_carts(self.user_cart, self.anon_cart)
+
+        items = {i.product_id: i for i in self.user_cart.items.all()}
+        self.assertEqual(items[self.products[0].id].quantity, 1)
+        self.assertEqual(items[self.products[1].id].quantity, 3)
+        # Se conserva el precio del carrito del usuario en los productos repetidos
+        self.assertEqual(items[self.products[1].id].unit_price, Decimal("900.00"))
+        self.assertEqual(items[self.products[2].id].quantity, 2)
+        self.assertFalse(Cart.objects.filter(session_key="anon-session").exists())
+
+    def test_merge_query_count_does_not_depend_on_items(self):
+        self._fill(self.user_cart, self.products[:10], 1)
+        self._fill(self.anon_cart, self.products, 1)
+        small_cart = Cart.objects.create(session_key="otra-session")
+        self._fill(small_cart, self.products[:1], 1)
+
+        with self.assertNumQueries(7) as ctx:
+            CartService.merge_carts(self.user_cart, self.anon_cart)
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            CartService.merge_carts(self.user_cart, small_cart)
+
+        self.assertEqual(self.user_cart.items.count(), 30)
+        self.assertEqual(self.user_cart.items.get(product=self.products[0]).quantity, 3)
+
+    def test_login_merges_anonymous_cart(self):
+        self._fill(self.anon_cart, self.products[:2], 2)
+        session = self.client.session
+        session["anon_cart_id"] = self.anon_cart.id
+        session.save()
+
+        self.client.login(username="cliente", password="clave-segura-123")
+
+        self.assertEqual(self.user_cart.items.count(), 2)
+        self.assertFalse(Cart.objects.filter(id=self.anon_cart.id).exists())
+
+
+class GetOrCreateCartTests(TestCase):
+    """Pruebas de la resolución memorizada del carrito."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        self.user = User.objects.create_user(username="cliente", password="clave-segura-123")
+
+    def _request(self, user=None, session=None):
+        request = self.factory.get("/")
+        request.user = user or AnonymousUser()
+        request.session = session if session is not None else self.session_store()
+        return request
+
+    def test_cart_is_memoized_per_request(self):
+        request = self._request(user=self.user)
+        cart = get_or_create_cart(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_or_create_cart(request), cart)
+            self.assertEqual(get_or_create_cart(request), cart)
+
+    def test_next_request_resolves_cart_with_one_query(self):
+        first = self._request(user=self.user)
+        cart = get_or_create_cart(first)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_or_create_cart(self._request(user=self.user, session=first.session)), cart)
+
+    def test_anonymous_cart_survives_between_requests(self):
+        first = self._request()
+        cart = get_or_create_cart(first)
+        first.session.save()
+
+        session = self.session_store(session_key=first.session.session_key)
+        with self.assertNumQueries(2):  # carga de sesión + pk del carrito
+            self.assertEqual(get_or_create_cart(self._request(session=session)), cart)
+
+    def test_warm_request_does_not_rewrite_session(self):
+        first = self._request(user=self.user)
+        get_or_create_cart(first)
+        first.session.save()
+
+        session = self.session_store(session_key=first.session.session_key)
+        request = self._request(user=self.user, session=session)
+        with self.assertNumQueries(2):  # carga de sesión + pk del carrito
+            get_or_create_cart(request)
+        self.assertFalse(request.session.modified)
+
+    def test_warm_cart_page_runs_no_session_update(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("cart:detail"))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("cart:detail"))
+        writes = [q["sql"] for q in ctx.captured_queries if "django_session" in q["sql"] and "UPDATE" in q["sql"]]
+        self.assertEqual(writes, [])
+
+    def test_session_cart_of_another_user_is_ignored(self):
+        other = User.objects.create_user(
+            username="otro", email="otro@example.com", password="clave-segura-123"
+        )
+        session = self.session_store()
+        session["cart_id"] = Cart.objects.create(user=other).id
+
+        cart = get_or_create_cart(self._request(user=self.user, session=session))
+
+        self.assertEqual(cart.user, self.user)
+
+
+class CartTotalsTests(TestCase):
+    """Pruebas de los totales desnormalizados del carrito."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.mouse = Product.objects.create(
+            name="Mouse", slug="mouse", price=Decimal("50.00"), category=category, stock_quantity=10
+        )
+        self.teclado = Product.objects.create(
+            name="Teclado", slug="teclado", price=Decimal("120.00"), category=category, stock_quantity=10
+        )
+        self.request = RequestFactory().post("/")
+        self.request.user = User.objects.create_user(username="cliente", password="clave-segura-123")
+        self.request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+
+    def _assert_totals(self, cart, count, total):
+        cart.refresh_from_db()
+        self.assertEqual(cart.item_count, count)
+        self.assertEqual(cart.total_amount, Decimal(total))
+        self.assertFalse(CartService.find_inconsistent_totals().exists())
+
+    def test_service_writes_keep_totals_in_sync(self):
+        CartService.add_to_cart(self.request, self.mouse, 2)
+        item = CartService.add_to_cart(self.request, self.teclado, 1)
+        cart = item.cart
+        self._assert_totals(cart, 3, "220.00")
+
+        CartService.add_to_cart(self.request, self.mouse, 1)
+        self._assert_totals(cart, 4, "270.00")
+
+        CartService.update_cart_item(self.request, item.id, 3)
+        self._assert_totals(cart, 6, "510.00")
+
+        CartService.remove_from_cart(self.request, item.id)
+        self._assert_totals(cart, 3, "150.00")
+
+        CartService.clear_cart(self.request)
+        self._assert_totals(cart, 0, "0")
+
+    def test_concurrent_add_does_not_lose_quantity(self):
+        CartService.add_to_cart(self.request, self.mouse, 2)
+        stale = CartItem.objects.get()  # leída por otra petición antes de la siguiente suma
+        CartService.add_to_cart(self.request, self.mouse, 1)
+
+        with mock.patch.object(CartItem.objects, "get_or_create", return_value=(stale, False)):
+            item = CartService.add_to_cart(self.request, self.mouse, 1)
+
+        self.assertEqual(item.quantity, 4)
+        self._assert_totals(item.cart, 4, "200.00")
+
+    def test_context_processor_reads_totals_without_queries(self):
+        from .context_processors import cart_info
+
+        CartService.add_to_cart(self.request, self.mouse, 2)
+        with self.assertNumQueries(0):
+            context = cart_info(self.request)
+        self.assertEqual(context["cart_items_count"], 2)
+        self.assertEqual(context["cart_total"], Decimal("100.00"))
+
+    def test_check_cart_totals_command_reports_and_fixes(self):
+        cart = CartService.add_to_cart(self.request, self.mouse, 2).cart
+        Cart.objects.filter(pk=cart.pk).update(item_count=7)
+
+        out = StringIO()
+        call_command("check_cart_totals", "--fix", stdout=out)
+
+        self.assertIn(f"Cart {cart.pk}", out.getvalue())
+        self._assert_totals(cart, 2, "100.00")
+
+
+class CartApiTests(TestCase):
+    """Pruebas de la API JSON del carrito."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}",
+                slug=f"producto-{i}",
+                price=Decimal("10.00"),
+                category=category,
+                stock_quantity=5,
+            )
+            for i in range(20)
+        ]
+        self.url = reverse("cart:api")
+
+    def _post(self, operations):
+        return self.client.post(
+            self.url, data=json.dumps({"operations": operations}), content_type="application/json"
+        )
+
+    def test_batch_applies_upserts_and_removals(self):
+        self._post([{"product_id": p.id, "quantity": 1} for p in self.products[:3]])
+
+        resp = self._post([
+            {"product_id": self.products[0].id, "quantity": 4},
+            {"product_id": self.products[1].id, "quantity": 0},
+        ])
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["item_count"], 5)
+        self.assertEqual(Decimal(data["total_amount"]), Decimal("50.00"))
+        self.assertEqual(
+            {i["product_id"]: i["quantity"] for i in data["items"]},
+            {self.products[0].id: 4, self.products[2].id: 1},
+        )
+        self.assertFalse(CartService.find_inconsistent_totals().exists())
+
+    def test_batch_marks_cart_as_active(self):
+        self._post([{"product_id": self.products[0].id, "quantity": 1}])
+        cart = Cart.objects.get()
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=30))
+
+        self._post([{"product_id": self.products[0].id, "quantity": 2}])
+
+        cart.refresh_from_db()
+        self.assertGreater(cart.updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_batch_is_all_or_nothing_on_stock_error(self):
+        resp = self._post([
+            {"product_id": self.products[0].id, "quantity": 1},
+            {"product_id": self.products[1].id, "quantity": 6},
+        ])
+
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.json()["details"]["errors"][0]["product_id"], self.products[1].id)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_invalid_payload_returns_400(self):
+        self.assertEqual(self.client.post(self.url, data="{", content_type="application/json").status_code, 400)
+        self.assertEqual(self._post([{"product_id": 999999, "quantity": 1}]).status_code, 400)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        self._post([{"product_id": self.products[0].id, "quantity": 1}])
+
+        with CaptureQueriesContext(connection) as small:
+            self._post([{"product_id": p.id, "quantity": 2} for p in self.products[:2]])
+        with CaptureQueriesContext(connection) as large:
+            self._post([{"product_id": p.id, "quantity": 3} for p in self.products])
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class CartValidationTests(TestCase):
+    """Pruebas de la validación del carrito para checkout."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}",
+                slug=f"producto-{i}",
+                price=Decimal("10.00"),
+                category=category,
+                stock_quantity=5,
+            )
+            for i in range(20)
+        ]
+        self.cart = Cart.objects.create(session_key="checkout")
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, product=p, quantity=1, unit_price=p.price) for p in self.products
+        )
+        CartService.recalculate_totals([self.cart.id])
+        self.cart.refresh_from_db()
+
+    def test_valid_cart_uses_one_query(self):
+        with self.assertNumQueries(1):
+            result = CartValidationService.validate_cart_for_checkout(self.cart)
+        self.assertEqual(result, {'valid': True, 'errors': [], 'warnings': []})
+
+    def test_reports_inactive_stock_and_price_problems(self):
+        Product.objects.filter(pk=self.products[0].pk).update(is_active=False)
+        Product.objects.filter(pk=self.products[1].pk).update(stock_quantity=0)
+        Product.objects.filter(pk=self.products[2].pk).update(price=Decimal("12.00"))
+
+        with self.assertNumQueries(1):
+            result = CartValidationService.validate_cart_for_checkout(self.cart)
+
+        self.assertFalse(result['valid'])
+        self.assertEqual(result['errors'], [
+            "El producto 'Producto 0' no está disponible",
+            "No hay suficiente stock para 'Producto 1'. Disponible: 0, Solicitado: 1",
+        ])
+        self.assertEqual(result['warnings'], [
+            "El precio de 'Producto 2' ha cambiado. Precio actual: $12.00",
+        ])
+
+    def test_empty_cart_is_invalid_without_queries(self):
+        empty = Cart.objects.create(session_key="vacio")
+        with self.assertNumQueries(0):
+            result = CartValidationService.validate_cart_for_checkout(empty)
+        self.assertEqual(result['errors'], ["El carrito está vacío"])
+
+
+class StaleCartReaperTests(TestCase):
+    """Pruebas de la depuración de carritos anónimos abandonados."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        product = Product.objects.create(
+            name="Mouse", slug="mouse", price=Decimal("50.00"), category=category, stock_quantity=10
+        )
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store.create()
+        old = timezone.now() - timedelta(days=45)
+
+        self.expired = [Cart.objects.create(session_key=f"expirada-{i}") for i in range(3)]
+        self.live_session = Cart.objects.create(session_key=store.session_key)
+        self.recent = Cart.objects.create(session_key="reciente")
+        self.user_cart = Cart.objects.create(
+            user=User.objects.create_user(username="cliente", password="clave-segura-123")
+        )
+        for cart in (*self.expired, self.live_session, self.recent, self.user_cart):
+            CartItem.objects.create(cart=cart, product=product, quantity=1, unit_price=product.price)
+        Cart.objects.exclude(pk=self.recent.pk).update(updated_at=old)
+
+    def test_reaps_only_expired_anonymous_carts_in_batches(self):
+        out = StringIO()
+        call_command("reap_stale_carts", "--days", "30", "--batch-size", "2", stdout=out)
+
+        remaining = set(Cart.objects.values_list("pk", flat=True))
+        self.assertEqual(remaining, {self.live_session.pk, self.recent.pk, self.user_cart.pk})
+        self.assertEqual(CartItem.objects.count(), 3)
+        self.assertIn("lote 2", out.getvalue())
+        self.assertIn("Eliminados 3 carritos y 3 items", out.getvalue())
+
+    def test_dry_run_does_not_delete(self):
+        out = StringIO()
+        call_command("reap_stale_carts", "--dry-run", stdout=out)
+
+        self.assertEqual(Cart.objects.count(), 6)
+        self.assertIn("se eliminarían 3 carritos y 3 items", out.getvalue())
@@ -8,4 +8,5 @@ urlpatterns = [
     path("add/<int:product_id>/", views.add_to_cart, name="add"),
     path("update/<int:item_id>/", views.update_cart_item, name="update"),
     path("remove/<int:item_id>/", views.remove_from_cart, name="remove"),
+    path("api/", views.cart_api, name="api"),
 ]
@@ -1,66 +1,90 @@
 # ctrlstore/apps/cart/utils.py
 from django.apps import apps
+
 from .models import Cart
 
 Product = apps.get_model("catalog", "Product")
 
+# Llaves de sesión: carrito del usuario autenticado y carrito anónimo
+CART_SESSION_KEY = "cart_id"
+ANON_CART_SESSION_KEY = "anon_cart_id"
+
+# Atributo del request donde se memoriza el carrito resuelto
+_REQUEST_CART_ATTR = "_ctrlstore_cart"
+
+
 def _ensure_session(request):
     if not request.session.session_key:
         request.session.save()
 
+
+def remember_cart(request, cart):
+    """
+    Memoriza el carrito en el request y guarda su id en la sesión.
+
+    Solo se escribe la sesión si el id cambió: asignar el mismo valor la marca como
+    modificada y cada petición terminaría con un UPDATE de ``django_session``.
+    """
+    key = CART_SESSION_KEY if cart.user_id else ANON_CART_SESSION_KEY
+    if request.session.get(key) != cart.id:
+        request.session[key] = cart.id
+    setattr(request, _REQUEST_CART_ATTR, (cart.user_id, cart))
+    return cart
+
+
 def get_or_create_cart(request):
     """
-    - Invitado: guarda/ubica por session_key y memoriza anon_cart_id en la sesión.
-    - Usuario logueado: prioriza user; mergea con carrito anónimo si existe (por session_key y/o anon_cart_id).
+    Resuelve el carrito del request con a lo sumo una consulta en el caso común.
+
+    - El carrito queda memorizado en el request: llamadas repetidas (context processor,
+      vistas, servicios) no vuelven a la base de datos.
+    - El id del carrito se guarda en la sesión, así las peticiones siguientes hacen
+      una búsqueda por llave primaria.
+    - Usuario logueado: solo se intenta fusionar si la sesión aún conserva un
+      anon_cart_id (normalmente lo consume el receiver de login).
+    - Invitado: se ubica por anon_cart_id y, si no existe, por session_key.
     """
-    _ensure_session(request)
-    session_key = request.session.session_key
-
-    if request.user.is_authenticated:
-        # Carrito del usuario
-        cart_user, _ = Cart.objects.get_or_create(user=request.user)
-
-        # 1) Merge por session_key antiguo (quizá no sirva tras login por rotación, pero lo intentamos)
-        try:
-            cart_session = Cart.objects.get(session_key=session_key, user__isnull=True)
-            if cart_session.id != cart_user.id:
-                for item in cart_session.items.all():
-                    tgt, created = cart_user.items.get_or_create(
-                        product=item.product,
-                        defaults={"quantity": item.quantity, "unit_price": item.unit_price},
-                    )
-                    if not created:
-                        tgt.quantity += item.quantity
-                        tgt.save()
-                cart_session.delete()
-        except Cart.DoesNotExist:
-            pass
-
-        # 2) Merge por anon_cart_id guardado en sesión (robusto frente a rotación de sesión)
-        anon_cart_id = request.session.get("anon_cart_id")
+    # Import local: services depende de este módulo
+    from .services import CartService
+
+    user = request.user if request.user.is_authenticated else None
+    user_id = user.id if user else None
+
+    cached = getattr(request, _REQUEST_CART_ATTR, None)
+    if cached is not None and cached[0] == user_id:
+        return cached[1]
+
+    session = request.session
+
+    if user is not None:
+        anon_cart_id = session.get(ANON_CART_SESSION_KEY)
+        cart_id = session.get(CART_SESSION_KEY)
+
+        # Camino rápido: una búsqueda por pk
+        if cart_id and not anon_cart_id:
+            cart = Cart.objects.filter(pk=cart_id, user=user).first()
+            if cart is not None:
+                return remember_cart(request, cart)
+
+        cart_user, _ = Cart.objects.get_or_create(user=user)
+
+        # Carrito anónimo pendiente de fusionar (robusto frente a rotación de sesión)
         if anon_cart_id:
-            try:
-                cart_session2 = Cart.objects.get(id=anon_cart_id, user__isnull=True)
-                if cart_session2.id != cart_user.id:
-                    for item in cart_session2.items.all():
-                        tgt, created = cart_user.items.get_or_create(
-                            product=item.product,
-                            defaults={"quantity": item.quantity, "unit_price": item.unit_price},
-                        )
-                        if not created:
-                            tgt.quantity += item.quantity
-                            tgt.save()
-                    cart_session2.delete()
-            except Cart.DoesNotExist:
-                pass
-            finally:
-                # Limpia el marcador
-                request.session.pop("anon_cart_id", None)
-
-        return cart_user
-
-    # Invitado: crea/recupera por session_key y guarda anon_cart_id en la sesión
-    cart, _ = Cart.objects.get_or_create(session_key=session_key, user__isnull=True)
-    # marca el carrito anónimo activamente en la sesión para supervivencia post-login
-    request.session["anon_cart_id"] = cart.id
-    return cart
+            session.pop(ANON_CART_SESSION_KEY, None)
+            cart_anon = Cart.objects.filter(pk=anon_cart_id, user__isnull=True).first()
+            if cart_anon is not None:
+                CartService.merge_carts(cart_user, cart_anon)
+
+        return remember_cart(request, cart_user)
+
+    # Invitado: camino rápido por el id guardado en la sesión
+    anon_cart_id = session.get(ANON_CART_SESSION_KEY)
+    if anon_cart_id:
+        cart = Cart.objects.filter(pk=anon_cart_id, user__isnull=True).first()
+        if cart is not None:
+            return remember_cart(request, cart)
+
+    # Crea/recupera por session_key y marca el carrito en la sesión para supervivencia post-login
+    _ensure_session(request)
+    cart, _ = Cart.objects.get_or_create(session_key=session.session_key, user__isnull=True)
+    return remember_cart(request, cart)
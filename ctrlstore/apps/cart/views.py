@@ -1,15 +1,15 @@
+import json
 from decimal import Decimal
 
 from django.apps import apps
 from django.contrib import messages
-from django.http import HttpResponseBadRequest
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_http_methods, require_POST
 
 from ctrlstore.apps.common.exceptions import CartError, StockError
 from ctrlstore.apps.common.logging_config import cart_logger
 
-from .models import CartItem
 from .services import CartService, CartValidationService
 from .utils import get_or_create_cart
 
@@ -78,42 +78,63 @@ def add_to_cart(request, product_id):
 
 @require_POST
 def update_cart_item(request, item_id):
-    cart = get_or_create_cart(request)
-    item = get_object_or_404(CartItem, pk=item_id, cart=cart)
-
     try:
         qty = int(request.POST.get("quantity", 1))
     except (TypeError, ValueError):
         return HttpResponseBadRequest(_("Cantidad inválida"))
 
-    if qty <= 0:
-        item.delete()
-        messages.info(
+    try:
+        item = CartService.update_cart_item(request, item_id, max(qty, 0))
+    except ValueError:
+        raise Http404(_("El item no existe en el carrito"))
+
+    if item is None:
+        messages.info(request, _("Producto eliminado del carrito."))
+    else:
+        messages.success(
             request,
-            _("%(name)s eliminado del carrito.") % {"name": item.product.name},
+            _("Cantidad actualizada: %(name)s x%(qty)s")
+            % {"name": item.product.name, "qty": qty},
         )
-    else:
-        if (
-            hasattr(item.product, "stock")
-            and item.product.stock is not None
-            and qty > item.product.stock
-        ):
-            messages.error(request, _("No hay stock suficiente."))
-        else:
-            item.quantity = qty
-            item.save()
-            messages.success(
-                request,
-                _("Cantidad actualizada: %(name)s x%(qty)s")
-                % {"name": item.product.name, "qty": qty},
-            )
     return redirect("cart:detail")
 
 
 @require_POST
 def remove_from_cart(request, item_id):
-    cart = get_or_create_cart(request)
-    item = get_object_or_404(CartItem, pk=item_id, cart=cart)
-    item.delete()
+    try:
+        CartService.remove_from_cart(request, item_id)
+    except ValueError:
+        raise Http404(_("El item no existe en el carrito"))
     messages.info(request, _("Producto eliminado del carrito."))
     return redirect("cart:detail")
+
+
+@require_http_methods(["GET", "POST"])
+def cart_api(request):
+    """
+    API JSON del carrito.
+
+    GET retorna el resumen; POST recibe ``{"operations": [{"product_id", "quantity"}]}``,
+    aplica el lote completo en una transacción y retorna el resumen actualizado.
+    """
+    if request.method == "GET":
+        return JsonResponse(CartService.serialize_cart(get_or_create_cart(request)))
+
+    try:
+        payload = json.loads(request.body or b"{}")
+        operations = payload["operations"]
+        if not isinstance(operations, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": _("Cuerpo JSON inválido")}, status=400)
+
+    try:
+        cart = CartService.apply_batch(request, operations)
+    except (StockError, CartError) as e:
+        cart_logger.log_error(e, {"action": "cart_api", "operations": len(operations)})
+        return JsonResponse(
+            {"error": e.message, "code": e.error_code, "details": e.details},
+            status=409 if isinstance(e, StockError) else 400,
+        )
+
+    return JsonResponse(CartService.serialize_cart(cart))
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CatalogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ctrlstore.apps.catalog"
+
+    def ready(self):
+        # Registra signals
+        from . import receivers  # noqa: F401
@@ -0,0 +1,376 @@
+"""
+Importación masiva del catálogo desde archivos JSON con formato de fixture.
+
+A diferencia de ``loaddata`` (un ``save()`` y sus signals por fila), el importador
+lee el archivo de forma incremental y hace upserts por lotes con
+``bulk_create(update_conflicts=True)``. Las referencias por pk del archivo
+(categoría padre, categoría del producto, producto de la especificación) y los
+slugs se resuelven en memoria.
+"""
+import json
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from typing import IO, Any, Iterator, Optional
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils.text import slugify
+
+from .models import Category, Product, ProductSpecification
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(stream: IO[str], chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Recorre los elementos de un arreglo JSON sin cargar el archivo completo.
+
+    Lee el archivo por bloques y decodifica un elemento a la vez con
+    ``JSONDecoder.raw_decode``; la memoria usada depende del tamaño de un elemento,
+    no del archivo.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE + ("," if started else ""):
+            pos += 1
+        if pos >= len(buffer):
+            if eof or not fill():
+                raise ValueError("JSON incompleto: falta el cierre del arreglo")
+            continue
+
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Se esperaba un arreglo JSON")
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # El elemento puede estar partido entre dos bloques
+            if eof or not fill():
+                raise
+            continue
+        yield item
+        pos = end
+
+
+class CatalogImporter:
+    """
+    Upsert por lotes de categorías, productos y especificaciones.
+
+    Las filas usan el formato de fixture de Django (``model``, ``pk``, ``fields``).
+    Las categorías se identifican por ``slug``, los productos por ``slug`` y las
+    especificaciones por ``product``. Los pk del archivo solo sirven para resolver
+    referencias; si una referencia no está en el archivo se busca como pk existente.
+    """
+
+    MODELS = {
+        "catalog.category": Category,
+        "catalog.product": Product,
+        "catalog.productspecification": ProductSpecification,
+    }
+
+    def __init__(self, batch_size: int = 1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress  # callable(str) para reportar avance
+        self.pending: dict[type, list[tuple[Any, dict]]] = {model: [] for model in self.MODELS.values()}
+
+        # pk del archivo -> id en la BD
+        self.category_ids: dict[Any, int] = {}
+        self.product_ids: dict[Any, int] = {}
+        # pk del archivo -> slug asignado, y slugs de producto ya usados en el archivo
+        self.product_slugs: dict[Any, str] = {}
+        self.used_product_slugs: set[str] = set()
+
+        self.stats = {model: 0 for model in self.MODELS.values()}
+        self.invalid = 0
+        self.errors: list[str] = []
+        self.started = time.monotonic()
+
+    # --- API pública ---
+
+    def run(self, stream: IO[str]) -> dict:
+        """Importa todas las filas del arreglo JSON y retorna el resumen."""
+        for row in iter_json_array(stream):
+            self.add(row)
+        self.flush()
+        return self.summary()
+
+    def add(self, row: dict) -> None:
+        model = self.MODELS.get(str(row.get("model", "")).lower())
+        if model is None:
+            self._reject(row, f"modelo no soportado: {row.get('model')}")
+            return
+        self.pending[model].append((row.get("pk"), row.get("fields") or {}))
+        # Las categorías se acumulan hasta que algo las necesita: los padres deben ir primero
+        if model is not Category and len(self.pending[model]) >= self.batch_size:
+            self._flush_model(model)
+
+    def flush(self) -> None:
+        for model in (Category, Product, ProductSpecification):
+            self._flush_model(model)
+
+    def summary(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        total = sum(self.stats.values())
+        return {
+            "categories": self.stats[Category],
+            "products": self.stats[Product],
+            "specifications": self.stats[ProductSpecification],
+            "invalid": self.invalid,
+            "errors": self.errors,
+            "elapsed": elapsed,
+            "rows_per_second": total / elapsed,
+        }
+
+    # --- Lotes ---
+
+    def _flush_model(self, model: type) -> None:
+        # Respeta dependencias: categorías -> productos -> especificaciones
+        if model is not Category and self.pending[Category]:
+            self._flush_categories()
+        if model is ProductSpecification and self.pending[Product]:
+            self._flush_products()
+
+        if model is Category:
+            self._flush_categories()
+        elif model is Product:
+            self._flush_products()
+        else:
+            self._flush_specifications()
+
+    def _flush_categories(self) -> None:
+        rows, self.pending[Category] = self.pending[Category], []
+        if not rows:
+            return
+        if not self.category_ids:
+            self.category_ids = {pk: pk for pk in Category.objects.values_list("id", flat=True)}
+
+        # Se insertan por niveles: una categoría entra cuando su padre ya tiene id
+        file_pks = {pk for pk, _ in rows}
+        while rows:
+            level, waiting = [], []
+            for pk, fields in rows:
+                parent = fields.get("parent")
+                if parent is not None and parent not in self.category_ids:
+                    if parent in file_pks:
+                        waiting.append((pk, fields))
+                    else:
+                        self._reject(fields, f"categoría padre inexistente: {parent}")
+                    continue
+                level.append((pk, fields))
+
+            if not level:
+                for _, fields in waiting:
+                    self._reject(fields, "ciclo en categorías padre")
+                break
+
+            objs, pks = [], []
+            for pk, fields in level:
+                obj = self._build(Category, fields, {"parent": "parent_id"})
+                if obj is None:
+                    continue
+                if obj.parent_id is not None:
+                    obj.parent_id = self.category_ids[obj.parent_id]
+                obj.slug = obj.slug or slugify(obj.name)
+                objs.append(obj)
+                pks.append(pk)
+
+            self._keep_file_pks(Category, zip(pks, objs))
+            ids = self._upsert(Category, objs, ["slug"])
+            for pk, obj in zip(pks, objs):
+                self.category_ids[pk] = ids[obj.slug]
+            # Las inválidas también salen: sus hijas se rechazan por padre inexistente
+            file_pks -= {pk for pk, _ in level}
+            rows = waiting
+
+    def _flush_products(self) -> None:
+        rows, self.pending[Product] = self.pending[Product], []
+        if not rows:
+            return
+
+        by_slug: dict[str, tuple[Any, Product]] = {}
+        for pk, fields in rows:
+            obj = self._build(Product, fields, {"category": "category_id"})
+            if obj is None:
+                continue
+            category_id = self._resolve_category(obj.category_id)
+            if category_id is None:
+                self._reject(fields, f"categoría inexistente: {obj.category_id}")
+                continue
+            obj.category_id = category_id
+            obj.slug = self._product_slug(pk, obj)
+            # Slug repetido en el mismo lote: gana la última fila (un upsert no puede tocar dos veces la misma fila)
+            by_slug[obj.slug] = (pk, obj)
+
+        self._keep_file_pks(Product, by_slug.values())
+        objs = [obj for _, obj in by_slug.values()]
+        ids = self._upsert(Product, objs, ["slug"])
+        for pk, obj in by_slug.values():
+            if pk is not None:
+                self.product_ids[pk] = ids[obj.slug]
+
+    def _flush_specifications(self) -> None:
+        rows, self.pending[ProductSpecification] = self.pending[ProductSpecification], []
+        if not rows:
+            return
+
+        # Referencias a productos que no vienen en el archivo: se validan en una sola consulta
+        unknown = {f.get("product") for _, f in rows if f.get("product") not in self.product_ids}
+        existing = set(Product.objects.filter(pk__in=unknown).values_list("id", flat=True)) if unknown else set()
+
+        by_product: dict[int, ProductSpecification] = {}
+        for _, fields in rows:
+            obj = self._build(ProductSpecification, fields, {"product": "product_id"})
+            if obj is None:
+                continue
+            product_id = self.product_ids.get(obj.product_id)
+            if product_id is None and obj.product_id in existing:
+                product_id = obj.product_id
+            if product_id is None:
+                self._reject(fields, f"producto inexistente: {obj.product_id}")
+                continue
+            obj.product_id = product_id
+            by_product[product_id] = obj
+
+        self._upsert(ProductSpecification, list(by_product.values()), ["product"], key="product_id")
+
+    # --- Utilidades ---
+
+    def _upsert(self, model: type, objs: list, unique_fields: list[str], key: str = "slug") -> dict:
+        """Hace el upsert del lote y retorna el mapa ``key -> id`` de las filas afectadas."""
+        if not objs:
+            return {}
+        update_fields = [
+            f.name for f in model._meta.concrete_fields
+            if not f.primary_key and f.name not in unique_fields and f.name != "created_at"
+        ]
+        # Primero las filas con pk del archivo y luego la secuencia se ajusta, antes de que
+        # las filas sin pk tomen ids de ella (en Postgres chocarían con los pk explícitos)
+        explicit = [o for o in objs if o.pk is not None]
+        implicit = [o for o in objs if o.pk is None]
+        with transaction.atomic():
+            for group in (explicit, implicit):
+                if not group:
+                    continue
+                model.objects.bulk_create(
+                    group,
+                    batch_size=self.batch_size,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=update_fields,
+                )
+                if group is explicit:
+                    self._reset_sequence(model)
+            ids = dict(
+                model.objects
+                .filter(**{f"{key}__in": [getattr(o, key) for o in objs]})
+                .values_list(key, "id")
+            )
+
+        self.stats[model] += len(objs)
+        if self.progress:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            total = sum(self.stats.values())
+            self.progress(
+                f"{model._meta.verbose_name_plural}: {self.stats[model]} "
+                f"({total / elapsed:,.0f} filas/s)"
+            )
+        return ids
+
+    def _keep_file_pks(self, model: type, pairs) -> None:
+        """
+        Conserva el pk del archivo en filas nuevas cuando está libre (como ``loaddata``),
+        para que otros archivos que referencian esos pk sigan funcionando.
+        """
+        pairs = [(pk, obj) for pk, obj in pairs if isinstance(pk, int)]
+        if not pairs:
+            return
+        taken = dict(model.objects.filter(pk__in=[pk for pk, _ in pairs]).values_list("pk", "slug"))
+        for pk, obj in pairs:
+            if pk not in taken or taken[pk] == obj.slug:
+                obj.pk = pk
+
+    def _reset_sequence(self, model: type) -> None:
+        # Tras insertar pk explícitos, la secuencia (Postgres) debe quedar por encima del máximo
+        statements = connection.ops.sequence_reset_sql(no_style(), [model])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def _build(self, model: type, fields: dict, fk_map: dict[str, str]):
+        """Construye la instancia validando y convirtiendo cada campo; None si la fila es inválida."""
+        values = {}
+        try:
+            for name, value in fields.items():
+                if name in fk_map:
+                    values[fk_map[name]] = value
+                    continue
+                field = model._meta.get_field(name)
+                if not field.concrete or field.primary_key:
+                    raise ValidationError(f"campo no importable: {name}")
+                if value is None and not field.null:
+                    raise ValidationError(f"{name} no puede ser nulo")
+                values[name] = field.to_python(value)
+        except (FieldDoesNotExist, ValidationError, InvalidOperation, TypeError) as e:
+            self._reject(fields, str(e))
+            return None
+
+        if model is not ProductSpecification and not values.get("name"):
+            self._reject(fields, "nombre requerido")
+            return None
+        if model is Product and not isinstance(values.get("price"), Decimal):
+            self._reject(fields, "precio requerido")
+            return None
+        return model(**values)
+
+    def _resolve_category(self, ref: Any) -> Optional[int]:
+        if not self.category_ids:
+            self.category_ids = {pk: pk for pk in Category.objects.values_list("id", flat=True)}
+        return self.category_ids.get(ref)
+
+    def _product_slug(self, pk: Any, obj: Product) -> str:
+        """Slug explícito o derivado del nombre, único dentro del archivo."""
+        if obj.slug:
+            slug = obj.slug
+        elif pk is not None and pk in self.product_slugs:
+            slug = self.product_slugs[pk]
+        else:
+            base = slugify(obj.name)[:140] or "producto"
+            slug, n = base, 2
+            while slug in self.used_product_slugs:
+                slug, n = f"{base}-{n}", n + 1
+        self.used_product_slugs.add(slug)
+        if pk is not None:
+            self.product_slugs[pk] = slug
+        return slug
+
+    def _reject(self, fields: Any, reason: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < 20:
+            self.errors.append(f"{reason} ({str(fields)[:80]})")
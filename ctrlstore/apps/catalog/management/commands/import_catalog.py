@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ctrlstore.apps.catalog.importer import CatalogImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa categorías, productos y especificaciones desde un JSON con formato de fixture, "
+        "leyéndolo de forma incremental y haciendo upserts por lotes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Ruta al archivo JSON (p. ej. complete_catalog.json)")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Filas por lote de upsert (por defecto 1000)",
+        )
+        parser.add_argument(
+            "--quiet-progress",
+            action="store_true",
+            help="No mostrar el avance por lote",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size debe ser mayor a 0")
+
+        progress = None if options["quiet_progress"] else self.stdout.write
+        importer = CatalogImporter(batch_size=options["batch_size"], progress=progress)
+
+        try:
+            with open(options["path"], encoding="utf-8") as fp:
+                summary = importer.run(fp)
+        except OSError as e:
+            raise CommandError(f"No se pudo leer el archivo: {e}")
+        except ValueError as e:
+            raise CommandError(f"JSON inválido: {e}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Importadas {summary['categories']} categorías, {summary['products']} productos "
+                f"y {summary['specifications']} especificaciones en {summary['elapsed']:.2f}s "
+                f"({summary['rows_per_second']:,.0f} filas/s)"
+            )
+        )
+        if summary["invalid"]:
+            self.stdout.write(self.style.WARNING(f"⚠ {summary['invalid']} filas inválidas omitidas"))
+            for error in summary["errors"]:
+                self.stdout.write(f"  - {error}")
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0003_alter_product_created_at_alter_product_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("product_id", models.BigIntegerField(db_index=True)),
+                ("slug", models.SlugField(blank=True, max_length=150)),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["deleted_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["updated_at", "id"], name="catalog_pro_updated_ee0b6a_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="producttombstone",
+            index=models.Index(fields=["deleted_at", "id"], name="catalog_pro_deleted_9a22e6_idx"),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import json
 
 class Category(models.Model):
@@ -118,6 +119,7 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['category', 'is_active']),
             models.Index(fields=['is_featured', 'is_active']),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
     def __str__(self) -> str:
@@ -190,3 +192,20 @@ class Product(models.Model):
                 main_specs['Edad'] = specs.age_rating
         
         return main_specs
+
+
+class ProductTombstone(models.Model):
+    """Registro de productos eliminados para el feed de cambios del catálogo"""
+    # Sin FK: el producto ya no existe cuando se crea la lápida
+    product_id = models.BigIntegerField(db_index=True)
+    slug = models.SlugField(max_length=150, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["deleted_at"]
+        indexes = [
+            models.Index(fields=['deleted_at', 'id']),
+        ]
+
+    def __str__(self) -> str:
+        return f"Tombstone({self.product_id} at {self.deleted_at:%Y-%m-%d %H:%M})"
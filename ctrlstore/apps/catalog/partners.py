@@ -0,0 +1,317 @@
+"""
+Catálogos de aliados comerciales.
+
+Cada aliado se integra con un adaptador (URL, mapeo de campos y configuración)
+registrado en ``partner_registry``. Los catálogos se consultan en paralelo con un
+plazo por aliado, de modo que la latencia de la página queda acotada por el plazo
+más largo y no por la suma de todos los aliados.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Any, Optional
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Pool compartido para consultas y refrescos en segundo plano
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="partner-catalog")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker con estado en el caché de Django (compartido entre workers).
+
+    Tras ``failure_threshold`` fallos consecutivos el circuito se abre durante
+    ``reset_timeout`` segundos y las llamadas se omiten sin tocar la red.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: int = 60):
+        self.failures_key = f"{name}:breaker:failures"
+        self.open_key = f"{name}:breaker:open-until"
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def allow(self) -> bool:
+        open_until = cache.get(self.open_key)
+        return open_until is None or time.time() >= open_until
+
+    def record_success(self) -> None:
+        cache.delete_many([self.failures_key, self.open_key])
+
+    def record_failure(self) -> None:
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            cache.set(self.failures_key, 1, self.reset_timeout)
+            failures = 1
+        if failures >= self.failure_threshold:
+            cache.set(self.open_key, time.time() + self.reset_timeout, self.reset_timeout)
+            cache.delete(self.failures_key)
+            logger.warning(f"Circuito abierto para {self.open_key} durante {self.reset_timeout}s")
+
+
+def _build_session(pool_size: int = 10, retries: int = 1) -> requests.Session:
+    """Sesión HTTP con pool de conexiones y un presupuesto de reintentos acotado."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PartnerAdapter:
+    """
+    Describe un aliado: de dónde se lee su catálogo y cómo se normalizan sus campos.
+
+    ``field_map`` asocia cada campo normalizado con las llaves candidatas del aliado,
+    en orden de preferencia (p. ej. ``"name": ("nombre", "name")``). La configuración
+    por defecto se puede sobrescribir en ``settings.CATALOG_PARTNERS[slug]``.
+    """
+
+    slug = ""
+    name = ""
+    default_url = ""
+    field_map: dict[str, tuple[str, ...]] = {}
+    defaults: dict[str, Any] = {
+        "id": None,
+        "name": "",
+        "description": "",
+        "price": 0,
+        "stock": 0,
+        "image_url": "",
+        "detail_url": "",
+    }
+    default_config: dict[str, Any] = {
+        "enabled": True,
+        "cache_ttl": 300,          # segundos que la copia se considera fresca
+        "stale_ttl": 24 * 60 * 60,  # segundos que la copia se puede servir obsoleta
+        "timeout": 5,              # timeout de la llamada HTTP
+        "deadline": 3,             # segundos que la página espera a este aliado
+        "breaker_threshold": 3,
+        "breaker_reset": 60,
+    }
+
+    @property
+    def config(self) -> dict[str, Any]:
+        overrides = getattr(settings, "CATALOG_PARTNERS", {}).get(self.slug, {})
+        return {**self.default_config, **overrides}
+
+    @property
+    def url(self) -> str:
+        return self.config.get("url") or self.default_url
+
+    def extract_items(self, payload: Any) -> list[dict]:
+        """Obtiene la lista de productos del cuerpo de respuesta."""
+        if isinstance(payload, dict):
+            return payload.get("results", [])
+        return payload
+
+    def normalize(self, raw: dict) -> dict:
+        """Normaliza un producto del aliado a nuestro formato común."""
+        product = {}
+        for field, default in self.defaults.items():
+            product[field] = default
+            for key in self.field_map.get(field, (field,)):
+                if key in raw:
+                    product[field] = raw[key]
+                    break
+        product["price"] = float(product["price"])
+        product["partner"] = self.slug
+        product["partner_name"] = self.name
+        return product
+
+
+class PartnerCatalogClient:
+    """
+    Cliente resiliente para el catálogo de un aliado.
+
+    - Reutiliza conexiones mediante un ``requests.Session`` con pool.
+    - Guarda la lista normalizada en el caché compartido: fresca durante
+      ``cache_ttl`` y servible como obsoleta hasta ``stale_ttl``.
+    - Si la copia está obsoleta la sirve de inmediato y la refresca en segundo plano
+      (stale-while-revalidate); si el aliado falla se sigue sirviendo la copia.
+    - Un circuit breaker evita esperar timeouts mientras el aliado está caído.
+    """
+
+    def __init__(self, adapter: PartnerAdapter, session: Optional[requests.Session] = None):
+        self.adapter = adapter
+        self.session = session or _build_session()
+        self.cache_key = f"catalog:partner:{adapter.slug}:products"
+        self.refresh_lock_key = f"catalog:partner:{adapter.slug}:refresh-lock"
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        config = self.adapter.config
+        return CircuitBreaker(
+            f"catalog:partner:{self.adapter.slug}",
+            failure_threshold=config["breaker_threshold"],
+            reset_timeout=config["breaker_reset"],
+        )
+
+    def get_products(self) -> list[dict]:
+        """Retorna los productos del aliado; nunca bloquea si hay una copia en caché."""
+        entry = cache.get(self.cache_key)
+        if entry is not None:
+            if time.time() - entry["fetched_at"] >= self.adapter.config["cache_ttl"]:
+                self._schedule_refresh()
+            return entry["products"]
+
+        # Caché frío: única situación en la que se espera al aliado. Solo el worker que
+        # toma el lock lo consulta; los demás responden sin productos en lugar de ocupar
+        # el pool compartido con llamadas repetidas (arranque en frío o caché vaciado).
+        if not cache.add(self.refresh_lock_key, True, self._lock_timeout()):
+            return []
+        try:
+            products = self.refresh()
+        finally:
+            cache.delete(self.refresh_lock_key)
+        return products if products is not None else []
+
+    def refresh(self) -> Optional[list[dict]]:
+        """
+        Descarga y cachea la lista normalizada.
+
+        Returns:
+            Lista de productos, o None si el circuito está abierto o la llamada falló.
+        """
+        config = self.adapter.config
+        breaker = self.breaker
+        if not breaker.allow():
+            logger.warning(f"Circuito abierto: se omite la llamada a {self.adapter.name}")
+            return None
+
+        try:
+            response = self.session.get(self.adapter.url, timeout=config["timeout"])
+            response.raise_for_status()
+            items = self.adapter.extract_items(response.json())
+            normalized = [self.adapter.normalize(p) for p in items]
+        except requests.exceptions.RequestException as e:
+            breaker.record_failure()
+            logger.error(f"Error al consumir API de {self.adapter.name}: {e}")
+            return None
+        except Exception as e:
+            breaker.record_failure()
+            logger.error(f"Error inesperado al procesar productos de {self.adapter.name}: {e}")
+            return None
+
+        breaker.record_success()
+        cache.set(
+            self.cache_key,
+            {"products": normalized, "fetched_at": time.time()},
+            config["cache_ttl"] + config["stale_ttl"],
+        )
+        logger.info(f"Consumidos {len(normalized)} productos de {self.adapter.name}")
+        return normalized
+
+    def _lock_timeout(self) -> int:
+        return max(int(self.adapter.config["timeout"]) * 2, 10)
+
+    def _schedule_refresh(self) -> None:
+        # cache.add es atómico: solo un worker refresca a la vez
+        if cache.add(self.refresh_lock_key, True, self._lock_timeout()):
+            self._spawn(self._refresh_and_release)
+
+    def _refresh_and_release(self) -> None:
+        try:
+            self.refresh()
+        finally:
+            cache.delete(self.refresh_lock_key)
+
+    @staticmethod
+    def _spawn(target) -> None:
+        _EXECUTOR.submit(target)
+
+
+class PartnerRegistry:
+    """Registro de aliados disponibles y de su cliente (uno por proceso)."""
+
+    def __init__(self):
+        self._clients: dict[str, PartnerCatalogClient] = {}
+
+    def register(self, adapter_cls: type[PartnerAdapter]) -> type[PartnerAdapter]:
+        """Registra un adaptador; se puede usar como decorador de clase."""
+        adapter = adapter_cls()
+        self._clients[adapter.slug] = PartnerCatalogClient(adapter)
+        return adapter_cls
+
+    def unregister(self, slug: str) -> None:
+        self._clients.pop(slug, None)
+
+    def get(self, slug: str) -> PartnerCatalogClient:
+        return self._clients[slug]
+
+    def enabled(self) -> list[PartnerCatalogClient]:
+        return [c for c in self._clients.values() if c.adapter.config["enabled"]]
+
+
+partner_registry = PartnerRegistry()
+
+
+@partner_registry.register
+class BloomberryAdapter(PartnerAdapter):
+    """Catálogo público de Bloomberry (campos en español o inglés)."""
+
+    slug = "bloomberry"
+    name = "Bloomberry"
+    default_url = "https://bloomberry-app-1067375337365.us-central1.run.app/products/api/"
+    field_map = {
+        "id": ("id",),
+        "name": ("nombre", "name"),
+        "description": ("descripcion", "description"),
+        "price": ("precio", "price"),
+        "stock": ("stock",),
+        "image_url": ("imagen", "image_url"),
+        "detail_url": ("detalle_url", "detail_url"),
+    }
+
+
+def get_partner_catalog(clients: Optional[list[PartnerCatalogClient]] = None) -> dict:
+    """
+    Consulta en paralelo los catálogos de los aliados habilitados y los combina.
+
+    Cada aliado tiene su propio plazo (``deadline``) contado desde el inicio; el que no
+    responda a tiempo se omite en esta respuesta y su consulta sigue en segundo plano
+    para dejar el caché listo.
+
+    Returns:
+        Diccionario con ``products`` (lista combinada) y ``partners`` (estado por aliado).
+    """
+    clients = partner_registry.enabled() if clients is None else clients
+    started = time.monotonic()
+    futures = [(client, _EXECUTOR.submit(client.get_products)) for client in clients]
+
+    products: list[dict] = []
+    partners: list[dict] = []
+    for client, future in futures:
+        adapter = client.adapter
+        remaining = adapter.config["deadline"] - (time.monotonic() - started)
+        try:
+            partner_products = future.result(timeout=max(remaining, 0))
+        except FuturesTimeout:
+            logger.warning(f"{adapter.name} no respondió dentro del plazo")
+            partner_products = []
+        except Exception as e:
+            logger.error(f"Error inesperado al consultar {adapter.name}: {e}")
+            partner_products = []
+
+        products.extend(partner_products)
+        partners.append({
+            "slug": adapter.slug,
+            "name": adapter.name,
+            "url": adapter.url,
+            "count": len(partner_products),
+        })
+
+    return {"products": products, "partners": partners}
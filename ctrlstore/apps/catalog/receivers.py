@@ -0,0 +1,14 @@
+# ctrlstore/apps/catalog/receivers.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Product, ProductTombstone
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance: Product, **kwargs):
+    """
+    Deja una lápida al eliminar un producto para que el feed de cambios
+    pueda informar la eliminación a quienes replican el catálogo.
+    """
+    ProductTombstone.objects.create(product_id=instance.pk, slug=instance.slug)
@@ -1,48 +1,175 @@
 """Servicios para el catálogo."""
-import requests
-from typing import Optional
+import heapq
+import json
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import or_
+from typing import Iterator, Optional
 import logging
 
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from ctrlstore.apps.common.exceptions import StockError
+
+from .models import Product, ProductTombstone
+
 logger = logging.getLogger(__name__)
 
-# URL de la API del equipo aliado (Bloomberry)
-BLOOMBERRY_API_URL = "https://bloomberry-app-1067375337365.us-central1.run.app/products/api/"
+# Tamaño de lote al recorrer el feed de cambios con iterator()
+CHANGE_FEED_CHUNK_SIZE = 500
+
+# Margen que el feed vuelve a leer antes de ``since``: una transacción que confirma tarde
+# deja un ``updated_at`` anterior al cursor ya entregado, y varias filas pueden compartir
+# el instante del cursor. Los eventos repetidos se deduplican por ``id`` en el cliente.
+CHANGE_FEED_OVERLAP = timedelta(seconds=60)
+
+def _product_change_event(product: Product, since: Optional[datetime]) -> dict:
+    """Construye el evento del feed para un producto creado, actualizado o desactivado."""
+    if not product.is_active:
+        op = "deactivated"
+    elif since is None or (product.created_at and product.created_at > since):
+        op = "created"
+    else:
+        op = "updated"
+
+    return {
+        "op": op,
+        "id": product.id,
+        "changed_at": product.updated_at.isoformat(),
+        "product": {
+            "name": product.name,
+            "slug": product.slug,
+            "price": float(product.price),
+            "stock": product.stock_quantity,
+            "is_active": product.is_active,
+            "is_featured": product.is_featured,
+            "category": product.category.slug,
+            "detail_url": reverse("catalog:product_detail", args=[product.id]),
+        },
+    }
+
+
+def iter_product_changes(since: Optional[datetime] = None) -> Iterator[dict]:
+    """
+    Recorre los cambios del catálogo posteriores a ``since`` en orden cronológico.
+
+    Combina los productos por ``updated_at`` con las lápidas de productos eliminados,
+    sin materializar ninguno de los dos conjuntos en memoria. La lectura empieza
+    ``CHANGE_FEED_OVERLAP`` antes de ``since``, así que puede repetir eventos ya
+    entregados; cada evento es el estado completo de su ``id`` y aplicarlo dos veces no
+    cambia el resultado.
+    """
+    products = (
+        Product.objects
+        .select_related("category")
+        .filter(updated_at__isnull=False)
+        .order_by("updated_at", "id")
+    )
+    tombstones = ProductTombstone.objects.order_by("deleted_at", "id")
+    if since is not None:
+        window = since - CHANGE_FEED_OVERLAP
+        products = products.filter(updated_at__gt=window)
+        tombstones = tombstones.filter(deleted_at__gt=window)
+
+    product_events = (
+        (p.updated_at, _product_change_event(p, since))
+        for p in products.iterator(chunk_size=CHANGE_FEED_CHUNK_SIZE)
+    )
+    deleted_events = (
+        (
+            t.deleted_at,
+            {
+                "op": "deleted",
+                "id": t.product_id,
+                "changed_at": t.deleted_at.isoformat(),
+                "product": {"slug": t.slug},
+            },
+        )
+        for t in tombstones.iterator(chunk_size=CHANGE_FEED_CHUNK_SIZE)
+    )
 
+    for _ts, event in heapq.merge(product_events, deleted_events, key=lambda e: e[0]):
+        yield event
 
-def get_bloomberry_products(timeout: int = 5) -> list[dict]:
+
+def stream_product_changes_ndjson(since: Optional[datetime] = None) -> Iterator[bytes]:
+    """
+    Serializa el feed de cambios como NDJSON (un evento JSON por línea).
+
+    La última línea es ``{"op": "end", "cursor": ...}``; el cliente debe enviar ese
+    cursor como ``since`` en la siguiente sincronización y aplicar los eventos por ``id``
+    (los del margen de solape pueden llegar repetidos).
+    """
+    cursor = since
+    for event in iter_product_changes(since):
+        changed_at = datetime.fromisoformat(event["changed_at"])
+        # Los eventos del solape son anteriores a ``since``: el cursor nunca retrocede
+        if cursor is None or changed_at > cursor:
+            cursor = changed_at
+        yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+    end = {"op": "end", "cursor": cursor.isoformat() if cursor else None}
+    yield (json.dumps(end) + "\n").encode("utf-8")
+
+
+def decrement_stock(quantities: dict[int, int]) -> None:
     """
-    Consume la API de productos de Bloomberry y retorna lista de productos.
-    
+    Descuenta stock de varios productos con un único UPDATE condicional.
+
+    Cada producto solo se actualiza si ``stock_quantity >= n`` (guarda por fila dentro
+    del mismo UPDATE); si el número de filas afectadas no coincide con el de productos
+    falta stock y el descuento se revierte. No hace falta ``select_for_update``: los
+    locks de fila los toma el propio UPDATE y duran hasta el commit de la transacción
+    que llama. También actualiza ``updated_at`` para el feed de cambios.
+
     Args:
-        timeout: Tiempo máximo de espera en segundos
-        
-    Returns:
-        Lista de productos en formato dict. Retorna lista vacía si hay error.
+        quantities: Diccionario product_id -> unidades a descontar
+
+    Raises:
+        StockError: Si algún producto no existe o no tiene stock suficiente
     """
-    try:
-        response = requests.get(BLOOMBERRY_API_URL, timeout=timeout)
-        response.raise_for_status()
-        products = response.json()
-        
-        # Normalizar formato si es necesario
-        normalized = []
-        for p in products:
-            normalized.append({
-                "id": p.get("id"),
-                "name": p.get("nombre", p.get("name", "")),
-                "description": p.get("descripcion", p.get("description", "")),
-                "price": float(p.get("precio", p.get("price", 0))),
-                "stock": p.get("stock", 0),
-                "image_url": p.get("imagen", p.get("image_url", "")),
-                "detail_url": p.get("detalle_url", p.get("detail_url", "")),
-            })
-        
-        logger.info(f"Consumidos {len(normalized)} productos de Bloomberry")
-        return normalized
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error al consumir API de Bloomberry: {e}")
-        return []
-    except Exception as e:
-        logger.error(f"Error inesperado al procesar productos de Bloomberry: {e}")
-        return []
+    quantities = {pid: qty for pid, qty in quantities.items() if qty > 0}
+    if not quantities:
+        return
+
+    guard = reduce(or_, (Q(pk=pid, stock_quantity__gte=qty) for pid, qty in quantities.items()))
+    amount = Case(*(When(pk=pid, then=Value(qty)) for pid, qty in quantities.items()))
+
+    with transaction.atomic():
+        updated = Product.objects.filter(guard).update(
+            stock_quantity=F("stock_quantity") - amount,
+            updated_at=timezone.now(),
+        )
+        if updated == len(quantities):
+            return
+        # Falta stock: se revierte el descuento parcial de este bloque
+        transaction.set_rollback(True)
+
+    # Caso raro: se identifica qué productos no alcanzan para el mensaje de error
+    stock = {
+        pid: (name, available)
+        for pid, name, available in Product.objects.filter(pk__in=list(quantities)).values_list(
+            "pk", "name", "stock_quantity"
+        )
+    }
+    short = {
+        pid: {"available": stock[pid][1] if pid in stock else 0, "requested": qty}
+        for pid, qty in quantities.items()
+        if pid not in stock or stock[pid][1] < qty
+    }
+    detail = ", ".join(
+        _("%(product)s (stock: %(stock)s, requerido: %(req)s)") % {
+            "product": stock.get(pid, (pid,))[0],
+            "stock": row["available"],
+            "req": row["requested"],
+        }
+        for pid, row in short.items()
+    )
+    raise StockError(
+        _("Stock insuficiente para: %(items)s") % {"items": detail},
+        error_code="out_of_stock",
+        details={"products": short},
+    )
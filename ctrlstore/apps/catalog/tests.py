@@ -1,7 +1,23 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import translation
+from django.utils.dateparse import parse_datetime
+
+from ctrlstore.apps.common.exceptions import StockError
 
+from .importer import CatalogImporter, iter_json_array
 from .models import Category, Product, ProductSpecification
+from .partners import BloomberryAdapter, PartnerCatalogClient, get_partner_catalog
+from .services import CHANGE_FEED_OVERLAP, decrement_stock
 
 
 class CatalogTests(TestCase):
@@ -169,3 +185,310 @@ class CatalogTests(TestCase):
         self.assertIsInstance(specs, dict)
         self.assertEqual(specs, {})
 
+
+
+class ProductChangeFeedTests(TestCase):
+    """Pruebas del feed incremental de cambios del catálogo."""
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name="Gaming", slug="gaming", category_type="gaming"
+        )
+        self.product = Product.objects.create(
+            name="Juego Pro",
+            slug="juego-pro",
+            price=100000,
+            category=self.category,
+            stock_quantity=5,
+        )
+        self.url = reverse("catalog:api_products_changes")
+
+    def _events(self, resp):
+        body = b"".join(resp.streaming_content).decode("utf-8")
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_full_feed_without_cursor(self):
+        """Sin cursor se emite todo el catálogo y una línea final con cursor."""
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        events = self._events(resp)
+        self.assertEqual(events[0]["op"], "created")
+        self.assertEqual(events[0]["id"], self.product.id)
+        self.assertEqual(events[-1], {"op": "end", "cursor": events[0]["changed_at"]})
+
+    def test_incremental_feed_reports_updates_and_deletes(self):
+        """Con cursor solo se emiten los cambios posteriores, incluidas desactivaciones y borrados."""
+        cursor = self._events(self.client.get(self.url))[-1]["cursor"]
+
+        other = Product.objects.create(
+            name="Juego Lite", slug="juego-lite", price=50000, category=self.category
+        )
+        self.product.is_active = False
+        self.product.save()
+        other_id = other.id
+        other.delete()
+
+        events = self._events(self.client.get(self.url, {"since": cursor}))
+        ops = [(e["op"], e["id"]) for e in events[:-1]]
+        self.assertEqual(ops, [("deactivated", self.product.id), ("deleted", other_id)])
+        self.assertEqual(events[-1]["cursor"], events[-2]["changed_at"])
+
+        # Sin cambios nuevos, el cursor se conserva; el margen de solape repite los
+        # eventos recientes (mismos ids) para que el cliente los deduplique
+        cursor = events[-1]["cursor"]
+        events = self._events(self.client.get(self.url, {"since": cursor}))
+        self.assertEqual([(e["op"], e["id"]) for e in events[:-1]], ops)
+        self.assertEqual(events[-1]["cursor"], cursor)
+
+        later = parse_datetime(cursor) + CHANGE_FEED_OVERLAP + timedelta(seconds=1)
+        events = self._events(self.client.get(self.url, {"since": later.isoformat()}))
+        self.assertEqual(events, [{"op": "end", "cursor": later.isoformat()}])
+
+    def test_late_commit_before_cursor_is_not_skipped(self):
+        """Un cambio que confirma después de entregar el cursor, con ``updated_at`` anterior."""
+        cursor = self._events(self.client.get(self.url))[-1]["cursor"]
+
+        late = parse_datetime(cursor) - timedelta(seconds=5)
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=2, updated_at=late)
+
+        events = self._events(self.client.get(self.url, {"since": cursor}))
+        self.assertEqual([(e["id"], e["product"]["stock"]) for e in events[:-1]], [(self.product.id, 2)])
+        self.assertEqual(events[-1]["cursor"], cursor)
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(self.url, {"since": "ayer"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class _StubPartnerHandler(BaseHTTPRequestHandler):
+    """Servidor local que se hace pasar por la API de un aliado (``/slow/`` tarda ``delay``)."""
+
+    status = 200
+    payload: list = []
+    hits = 0
+    delay = 1.0
+
+    def do_GET(self):
+        type(self).hits += 1
+        if self.path.startswith("/slow/"):
+            time.sleep(self.delay)
+        body = json.dumps(self.payload).encode("utf-8")
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SlowAdapter(BloomberryAdapter):
+    slug = "lento"
+    name = "Aliado Lento"
+
+
+class PartnerCatalogTests(SimpleTestCase):
+    """Pruebas del cliente cacheado y la agregación de aliados contra un servidor stub local."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubPartnerHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        _StubPartnerHandler.status = 200
+        _StubPartnerHandler.payload = [{"id": 1, "nombre": "Audífonos", "precio": "99.5", "stock": 3}]
+        _StubPartnerHandler.hits = 0
+        settings_override = override_settings(CATALOG_PARTNERS={
+            "bloomberry": {"url": f"{self.base_url}/products/api/", "breaker_threshold": 2},
+            "lento": {"url": f"{self.base_url}/slow/", "deadline": 0.2},
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client_ = PartnerCatalogClient(BloomberryAdapter())
+        # Refresco en segundo plano síncrono para que las pruebas sean deterministas
+        spawn = mock.patch.object(PartnerCatalogClient, "_spawn", staticmethod(lambda target: target()))
+        spawn.start()
+        self.addCleanup(spawn.stop)
+        self.addCleanup(cache.clear)
+
+    def test_normalizes_and_caches(self):
+        products = self.client_.get_products()
+        self.assertEqual(products[0]["name"], "Audífonos")
+        self.assertEqual(products[0]["price"], 99.5)
+        self.assertEqual(products[0]["partner_name"], "Bloomberry")
+        self.client_.get_products()
+        self.assertEqual(_StubPartnerHandler.hits, 1)
+
+    def test_cold_cache_is_fetched_by_a_single_worker(self):
+        # Otro worker ya está consultando al aliado con el caché frío
+        cache.add(self.client_.refresh_lock_key, True, 10)
+        self.assertEqual(self.client_.get_products(), [])
+        self.assertEqual(_StubPartnerHandler.hits, 0)
+
+        cache.delete(self.client_.refresh_lock_key)
+        self.assertEqual(len(self.client_.get_products()), 1)
+        self.assertIsNone(cache.get(self.client_.refresh_lock_key))
+
+    def test_serves_stale_copy_when_partner_fails(self):
+        self.client_.get_products()
+        _StubPartnerHandler.status = 500
+        with override_settings(CATALOG_PARTNERS={
+            "bloomberry": {"url": f"{self.base_url}/products/api/", "cache_ttl": 0},
+        }):
+            products = self.client_.get_products()
+        self.assertEqual(products[0]["name"], "Audífonos")
+        # Se intentó revalidar, pero la copia obsoleta se conserva
+        self.assertEqual(_StubPartnerHandler.hits, 2)
+        self.assertEqual(cache.get(self.client_.cache_key)["products"], products)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        _StubPartnerHandler.status = 500
+        self.assertEqual(self.client_.get_products(), [])
+        self.assertEqual(self.client_.get_products(), [])
+        hits = _StubPartnerHandler.hits
+        _StubPartnerHandler.status = 200
+        self.assertEqual(self.client_.get_products(), [])
+        self.assertEqual(_StubPartnerHandler.hits, hits)
+
+    def test_aggregation_is_bounded_by_partner_deadline(self):
+        """Un aliado lento se omite al vencer su plazo sin retrasar al resto."""
+        started = time.monotonic()
+        catalog = get_partner_catalog([self.client_, PartnerCatalogClient(_SlowAdapter())])
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, _StubPartnerHandler.delay)
+        self.assertEqual([p["partner"] for p in catalog["products"]], ["bloomberry"])
+        self.assertEqual([p["count"] for p in catalog["partners"]], [1, 0])
+
+
+class CatalogImportTests(TestCase):
+    """Pruebas del importador masivo del catálogo."""
+
+    ROWS = [
+        # La subcategoría aparece antes que su padre
+        {"model": "catalog.category", "pk": 11, "fields": {
+            "name": "Audífonos", "slug": "audifonos", "category_type": "audio_video", "parent": 1}},
+        {"model": "catalog.category", "pk": 1, "fields": {
+            "name": "Audio y Video", "slug": "audio-y-video", "category_type": "audio_video", "parent": None}},
+        {"model": "catalog.product", "pk": 5, "fields": {
+            "name": "Audífonos X", "slug": "audifonos-x", "price": "199.90", "category": 11, "stock_quantity": 4}},
+        # Sin slug: se deriva del nombre
+        {"model": "catalog.product", "pk": 6, "fields": {"name": "Parlante Y", "price": "50", "category": 1}},
+        {"model": "catalog.productspecification", "pk": 1, "fields": {
+            "product": 5, "brand": "Sony", "weight": "0.25", "additional_specs": {"anc": True}}},
+        # Filas inválidas
+        {"model": "catalog.product", "pk": 7, "fields": {"name": "Sin precio", "slug": "sin-precio", "category": 1}},
+        {"model": "catalog.product", "pk": 8, "fields": {
+            "name": "Sin categoría", "slug": "sin-categoria", "price": "1", "category": 999}},
+    ]
+
+    def _import(self, rows, **kwargs):
+        return CatalogImporter(**kwargs).run(io.StringIO(json.dumps(rows)))
+
+    def test_iter_json_array_handles_split_chunks(self):
+        data = json.dumps(self.ROWS)
+        self.assertEqual(list(iter_json_array(io.StringIO(data), chunk_size=7)), self.ROWS)
+
+    def test_import_resolves_references_and_rejects_invalid_rows(self):
+        summary = self._import(self.ROWS, batch_size=2)
+
+        self.assertEqual(summary["categories"], 2)
+        self.assertEqual(summary["products"], 2)
+        self.assertEqual(summary["specifications"], 1)
+        self.assertEqual(summary["invalid"], 2)
+
+        child = Category.objects.get(slug="audifonos")
+        self.assertEqual(child.parent.slug, "audio-y-video")
+        product = Product.objects.get(slug="audifonos-x")
+        self.assertEqual(product.category, child)
+        self.assertEqual(product.specifications.brand, "Sony")
+        self.assertTrue(Product.objects.filter(slug="parlante-y").exists())
+
+    def test_sequence_is_reset_before_rows_without_file_pk(self):
+        calls = []
+        bulk_create = Product.objects.bulk_create
+
+        def spy_bulk_create(objs, **kwargs):
+            calls.append(("insert", [o.pk for o in objs]))
+            return bulk_create(objs, **kwargs)
+
+        rows = self.ROWS[:2] + [
+            {"model": "catalog.product", "pk": 5, "fields": {
+                "name": "Con pk", "slug": "con-pk", "price": "1", "category": 1}},
+            {"model": "catalog.product", "fields": {
+                "name": "Sin pk", "slug": "sin-pk", "price": "1", "category": 1}},
+        ]
+        with mock.patch.object(Product.objects, "bulk_create", side_effect=spy_bulk_create), \
+                mock.patch.object(
+                    CatalogImporter, "_reset_sequence",
+                    lambda self, model: calls.append(("reset", model.__name__)),
+                ):
+            self._import(rows)
+
+        product_calls = [c for c in calls if c != ("reset", "Category")]
+        self.assertEqual(product_calls, [("insert", [5]), ("reset", "Product"), ("insert", [None])])
+
+    def test_reimport_updates_in_place(self):
+        self._import(self.ROWS)
+        rows = json.loads(json.dumps(self.ROWS))
+        rows[2]["fields"]["price"] = "149.90"
+        self._import(rows)
+
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(ProductSpecification.objects.count(), 1)
+        self.assertEqual(str(Product.objects.get(slug="audifonos-x").price), "149.90")
+
+
+class DecrementStockTests(TestCase):
+    """Pruebas del descuento de stock en un solo UPDATE condicional."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}",
+                slug=f"producto-{i}",
+                price=100,
+                category=category,
+                stock_quantity=5,
+            )
+            for i in range(25)
+        ]
+
+    def test_decrements_all_lines_with_one_update(self):
+        quantities = {p.pk: (i % 5) + 1 for i, p in enumerate(self.products)}
+
+        with self.assertNumQueries(3):  # SAVEPOINT + UPDATE + RELEASE
+            decrement_stock(quantities)
+
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock_quantity, 5 - quantities[product.pk])
+
+    def test_shortage_rolls_back_every_line(self):
+        first, second = self.products[:2]
+
+        with self.assertRaises(StockError) as ctx:
+            decrement_stock({first.pk: 2, second.pk: 6})
+
+        self.assertEqual(ctx.exception.details["products"], {second.pk: {"available": 5, "requested": 6}})
+        self.assertIn("Producto 1 (stock: 5, requerido: 6)", ctx.exception.message)
+        first.refresh_from_db()
+        self.assertEqual(first.stock_quantity, 5)
+
+    def test_shortage_message_is_translated(self):
+        with translation.override("en"), self.assertRaises(StockError) as ctx:
+            decrement_stock({self.products[0].pk: 6})
+        self.assertEqual(ctx.exception.message, "Insufficient stock for: Producto 0 (stock: 5, required: 6)")
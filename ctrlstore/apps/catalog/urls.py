@@ -6,6 +6,7 @@ urlpatterns = [
     path("p/<int:pk>/", views.ProductDetailView.as_view(), name="product_detail"),
     # API pública
     path("api/products/in-stock/", views.products_in_stock_api, name="api_products_in_stock"),
+    path("api/products/changes/", views.products_changes_api, name="api_products_changes"),
     
     # Productos aliados
     path("productos-aliados/", views.ProductosAliadosView.as_view(), name="productos_aliados"),
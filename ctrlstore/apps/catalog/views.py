@@ -1,17 +1,21 @@
 from django.views.generic import ListView, DetailView, TemplateView
 from django.shortcuts import get_object_or_404, render
-from django.http import JsonResponse
+from django.core.paginator import Paginator
+from django.http import JsonResponse, StreamingHttpResponse
 from .models import Product, Category
 from ctrlstore.apps.analytics.services import record_product_view
 from django.urls import reverse
 from django.views.decorators.http import require_GET
 from django.utils.decorators import method_decorator
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 # i18n
 from django.utils.translation import gettext as _
 # from django.utils.translation import ngettext, pgettext  # Importar si se usa más adelante
 
-from .services import get_bloomberry_products
+from .partners import get_partner_catalog
+from .services import stream_product_changes_ndjson
 
 class ProductListView(ListView):
     model = Product
@@ -84,6 +88,27 @@ def products_in_stock_api(request):
     return JsonResponse(data)
 
 
+# API pública: feed incremental de cambios del catálogo (NDJSON)
+@require_GET
+def products_changes_api(request):
+    since = None
+    raw_since = request.GET.get("since")
+    if raw_since:
+        try:
+            since = parse_datetime(raw_since)
+        except ValueError:
+            since = None
+        if since is None:
+            return JsonResponse({"error": _("Parámetro 'since' inválido")}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    return StreamingHttpResponse(
+        stream_product_changes_ndjson(since),
+        content_type="application/x-ndjson",
+    )
+
+
 # Vistas del Comparador
 class CompareCategorySelectView(TemplateView):
     """Vista para seleccionar categoría antes de comparar productos"""
@@ -291,15 +316,20 @@ class CompareProductsView(TemplateView):
 
 
 class ProductosAliadosView(TemplateView):
-    """Vista para mostrar productos de nuestro socio comercial Bloomberry."""
+    """Vista para mostrar productos de nuestros socios comerciales."""
     template_name = "catalog/productos-aliados.html"
-    
+    paginate_by = 12
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products = get_bloomberry_products()
+        catalog = get_partner_catalog()
+        page_obj = Paginator(catalog["products"], self.paginate_by).get_page(
+            self.request.GET.get("page")
+        )
         context.update({
-            "products": products,
-            "api_source": "Bloomberry",
-            "api_url": "https://bloomberry-app-1067375337365.us-central1.run.app/products/api/",
+            "products": page_obj.object_list,
+            "page_obj": page_obj,
+            "is_paginated": page_obj.has_other_pages(),
+            "partners": catalog["partners"],
         })
-        return context
\ No newline at end of file
+        return context
@@ -0,0 +1,24 @@
+"""
+Utilidades de peticiones HTTP compartidas entre apps.
+"""
+from django.conf import settings
+
+
+def get_client_ip(request) -> str:
+    """
+    IP del cliente teniendo en cuenta los proxies de confianza.
+
+    Cada proxy agrega a ``X-Forwarded-For`` la IP de quien le habló, así que con
+    ``TRUSTED_PROXY_COUNT`` proxies delante (Nginx = 1) la IP real es la N-ésima desde
+    la derecha; lo que esté más a la izquierda lo pudo escribir el propio cliente.
+    Sin proxies de confianza, o si el encabezado trae menos saltos, se usa ``REMOTE_ADDR``.
+    """
+    proxies = getattr(settings, "TRUSTED_PROXY_COUNT", 0)
+    remote = request.META.get("REMOTE_ADDR", "") or ""
+    if proxies <= 0:
+        return remote
+
+    forwarded = [ip.strip() for ip in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if ip.strip()]
+    if len(forwarded) < proxies:
+        return remote
+    return forwarded[-proxies]
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ctrlstore.apps.common.synthetic import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos (catálogo, usuarios, carritos, órdenes, pagos y vistas) "
+        "con inserciones por lotes y semilla determinística, para pruebas de carga"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=50, help="Categorías (por defecto 50)")
+        parser.add_argument("--products", type=int, default=10_000, help="Productos (por defecto 10000)")
+        parser.add_argument("--users", type=int, default=1_000, help="Usuarios (por defecto 1000)")
+        parser.add_argument("--carts", type=int, default=1_000, help="Carritos activos (por defecto 1000)")
+        parser.add_argument("--orders", type=int, default=5_000, help="Órdenes (por defecto 5000)")
+        parser.add_argument("--views", type=int, default=100_000, help="Vistas de producto (por defecto 100000)")
+        parser.add_argument("--days", type=int, default=180, help="Ventana histórica en días (por defecto 180)")
+        parser.add_argument("--seed", type=int, default=42, help="Semilla del generador (por defecto 42)")
+        parser.add_argument("--batch-size", type=int, default=5_000, help="Filas por lote (por defecto 5000)")
+
+    def handle(self, *args, **options):
+        if options["categories"] < 1 or options["products"] < 1:
+            raise CommandError("Se requiere al menos una categoría y un producto")
+        if options["orders"] and not options["users"]:
+            raise CommandError("Las órdenes requieren usuarios (--users > 0)")
+
+        generator = SyntheticDataGenerator(
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            days=options["days"],
+            progress=self.stdout.write,
+        )
+        started = time.monotonic()
+
+        generator.categories(options["categories"])
+        generator.products(options["products"])
+        if options["users"]:
+            generator.users(options["users"])
+        if options["carts"]:
+            generator.carts(options["carts"])
+        if options["orders"]:
+            generator.orders(options["orders"])
+        if options["views"]:
+            generator.views(options["views"])
+        generator.finish()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ Datos sintéticos generados en {time.monotonic() - started:.1f}s")
+        )
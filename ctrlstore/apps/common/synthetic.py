@@ -0,0 +1,459 @@
+"""
+Generador de datos sintéticos para pruebas de carga.
+
+Produce categorías, productos con especificaciones acordes a su tipo, usuarios,
+carritos, órdenes pagadas con items y pagos, y eventos de vista de producto.
+Todo se inserta con ``bulk_create`` en lotes, con ids pre-asignados (no hace falta
+leerlos de vuelta) y a partir de una semilla fija: con la misma semilla y la misma
+base vacía se obtiene el mismo conjunto de datos.
+"""
+import random
+import time
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Optional
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+SPEC_VALUES = {
+    "celulares_tablets": {
+        "brand": ["Apple", "Samsung", "Xiaomi", "Motorola", "Huawei"],
+        "operating_system": ["iOS 17", "Android 14", "Android 13", "iPadOS 17"],
+        "screen_resolution": ["1080 x 2400", "1170 x 2532", "1440 x 3200", "2048 x 2732"],
+        "ram_memory": ["4GB", "6GB", "8GB", "12GB"],
+        "internal_storage": ["64GB", "128GB", "256GB", "512GB"],
+        "main_camera": ["12MP", "48MP", "50MP", "108MP", "200MP"],
+        "front_camera": ["8MP", "12MP", "32MP"],
+        "battery_capacity": ["3000 mAh", "4500 mAh", "5000 mAh", "10000 mAh"],
+        "connectivity": ["4G, Wi-Fi 6", "5G, Wi-Fi 6E, Bluetooth 5.3", "5G, NFC, USB-C"],
+    },
+    "computadores": {
+        "brand": ["Lenovo", "HP", "Dell", "ASUS", "Apple", "Logitech"],
+        "processor": ["Intel Core i5-13400", "Intel Core i7-13700H", "AMD Ryzen 7 7840HS", "Apple M3"],
+        "ram_memory": ["8GB", "16GB", "32GB", "64GB"],
+        "storage_type": ["SSD", "NVMe SSD", "HDD"],
+        "storage_capacity": ["256GB", "512GB", "1TB", "2TB"],
+        "graphics_card": ["Intel Iris Xe", "NVIDIA RTX 4060", "NVIDIA RTX 4070", "AMD Radeon 780M"],
+    },
+    "componentes": {
+        "brand": ["Intel", "AMD", "NVIDIA", "Corsair", "Kingston"],
+        "socket_type": ["LGA1700", "AM5", "AM4", "PCIe 4.0", "DDR5 DIMM"],
+        "power_consumption": ["65W", "125W", "170W", "200W", "450W"],
+        "frequency": ["3.5 GHz", "4.2 GHz", "5.0 GHz", "6000 MHz"],
+        "memory_type": ["DDR4", "DDR5", "GDDR6", "GDDR6X"],
+    },
+    "audio_video": {
+        "brand": ["Sony", "LG", "Samsung", "JBL", "Bose"],
+        "screen_resolution": ["1920 x 1080", "3840 x 2160", "7680 x 4320"],
+        "display_technology": ["LED", "QLED", "OLED", "Mini LED"],
+        "refresh_rate": ["60Hz", "120Hz", "144Hz"],
+        "audio_power": ["20W", "40W", "100W", "300W"],
+        "channels": ["2.0", "2.1", "5.1", "7.1"],
+    },
+    "gaming": {
+        "brand": ["Sony", "Microsoft", "Nintendo", "Razer", "Logitech"],
+        "platform_compatibility": ["PS5", "Xbox Series X|S", "Nintendo Switch", "PC"],
+        "genre": ["Acción", "Aventura", "Deportes", "RPG", "Estrategia", "Carreras"],
+        "age_rating": ["E", "T", "M", "+12", "+18"],
+    },
+}
+
+PRICE_RANGES = {
+    "celulares_tablets": (400_000, 6_000_000),
+    "computadores": (80_000, 12_000_000),
+    "componentes": (150_000, 9_000_000),
+    "audio_video": (100_000, 15_000_000),
+    "gaming": (120_000, 4_000_000),
+}
+
+CITIES = [
+    ("Medellín", "Antioquia"),
+    ("Bogotá", "Cundinamarca"),
+    ("Cali", "Valle del Cauca"),
+    ("Barranquilla", "Atlántico"),
+    ("Bucaramanga", "Santander"),
+    ("Pereira", "Risaralda"),
+]
+
+CARD_BRANDS = ["visa", "mastercard", "amex"]
+
+
+class SyntheticDataGenerator:
+    """
+    Genera volumen realista por etapas. Cada etapa depende de las anteriores
+    (productos -> categorías, órdenes -> usuarios y productos, etc.).
+    """
+
+    def __init__(
+        self,
+        seed: int = 42,
+        batch_size: int = 5000,
+        days: int = 180,
+        progress: Optional[Callable[[str], None]] = None,
+    ):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.days = days
+        self.progress = progress
+        self.now = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+        self.Category = apps.get_model("catalog", "Category")
+        self.Product = apps.get_model("catalog", "Product")
+        self.ProductSpecification = apps.get_model("catalog", "ProductSpecification")
+        self.User = apps.get_model("authx", "User")
+        self.Cart = apps.get_model("cart", "Cart")
+        self.CartItem = apps.get_model("cart", "CartItem")
+        self.Order = apps.get_model("order", "Order")
+        self.OrderItem = apps.get_model("order", "OrderItem")
+        self.OrderStatusEvent = apps.get_model("order", "OrderStatusEvent")
+        self.Payment = apps.get_model("payment", "Payment")
+        self.ProductSalesAggregate = apps.get_model("analytics", "ProductSalesAggregate")
+        self.ProcessedOrder = apps.get_model("analytics", "ProcessedOrder")
+        self.ProductView = apps.get_model("analytics", "ProductView")
+        self.ProductViewAggregate = apps.get_model("analytics", "ProductViewAggregate")
+
+        # Estado generado que usan las etapas siguientes
+        self.leaf_categories: list[tuple[int, str]] = []  # (id, category_type)
+        self.product_first_id = 0
+        self.product_prices = array("q")  # precio en pesos, indexado por offset de producto
+        self.user_ids: list[int] = []
+
+    # --- Etapas ---
+
+    def categories(self, count: int) -> None:
+        """Una categoría padre por tipo y el resto como subcategorías repartidas entre ellas."""
+        types = [t for t, _ in self.Category.CATEGORY_TYPES]
+        next_id = self._next_id(self.Category)
+        objs, parents = [], []
+        for i in range(count):
+            pk = next_id + i
+            if i < len(types):
+                category_type, parent_id = types[i], None
+                parents.append((pk, category_type))
+            else:
+                parent_id, category_type = parents[i % len(parents)]
+            objs.append(self.Category(
+                id=pk,
+                name=f"Sintética {pk}",
+                slug=f"synth-cat-{pk}",
+                category_type=category_type,
+                parent_id=parent_id,
+            ))
+        self._bulk(self.Category, objs)
+        leafs = [(o.id, o.category_type) for o in objs if o.parent_id is not None]
+        self.leaf_categories = leafs or [(o.id, o.category_type) for o in objs]
+
+    def products(self, count: int) -> None:
+        """Productos con especificaciones acordes al tipo de su categoría."""
+        if not self.leaf_categories:
+            raise ValueError("Genera categorías antes que productos")
+        rng = self.rng
+        self.product_first_id = self._next_id(self.Product)
+        spec_next_id = self._next_id(self.ProductSpecification)
+
+        def rows():
+            for i in range(count):
+                pk = self.product_first_id + i
+                category_id, category_type = rng.choice(self.leaf_categories)
+                low, high = PRICE_RANGES[category_type]
+                price = rng.randrange(low, high, 1000)
+                self.product_prices.append(price)
+                values = {f: rng.choice(opts) for f, opts in SPEC_VALUES[category_type].items()}
+                product = self.Product(
+                    id=pk,
+                    name=f"{values['brand']} {category_type.split('_')[0].title()} {pk}",
+                    slug=f"synth-{pk}",
+                    short_description=f"Producto sintético {pk}",
+                    price=Decimal(price),
+                    category_id=category_id,
+                    is_active=rng.random() > 0.03,
+                    is_featured=rng.random() < 0.05,
+                    stock_quantity=rng.randint(0, 500),
+                )
+                spec = self.ProductSpecification(
+                    id=spec_next_id + i,
+                    product_id=pk,
+                    model=f"SYN-{pk}",
+                    **self._spec_extras(category_type),
+                    **values,
+                )
+                yield product, spec
+
+        self._bulk_pairs(rows(), count, "productos")
+
+    def users(self, count: int) -> None:
+        """Clientes con la misma contraseña pre-hasheada (hashear cada una es lo más costoso)."""
+        password = make_password("synthetic-pass")
+        next_id = self._next_id(self.User)
+        objs = (
+            self.User(
+                id=next_id + i,
+                username=f"synth{next_id + i}",
+                email=f"synth{next_id + i}@example.com",
+                first_name="Cliente",
+                last_name=f"Sintético {next_id + i}",
+                password=password,
+            )
+            for i in range(count)
+        )
+        self._bulk(self.User, objs, count)
+        self.user_ids = list(range(next_id, next_id + count))
+
+    def carts(self, count: int) -> None:
+        """Carritos activos: la mitad de usuarios y la mitad anónimos, con 1 a 4 items."""
+        self._require_products()
+        rng = self.rng
+        cart_next_id = self._next_id(self.Cart)
+        item_next_id = self._next_id(self.CartItem)
+        user_pool = list(self.user_ids)
+        rng.shuffle(user_pool)
+
+        def rows():
+            item_id = item_next_id
+            for i in range(count):
+                pk = cart_next_id + i
+                user_id = user_pool.pop() if user_pool and rng.random() < 0.5 else None
+                cart = self.Cart(
+                    id=pk,
+                    user_id=user_id,
+                    session_key="" if user_id else f"{rng.getrandbits(128):032x}",
+                    created_at=self._random_past(),
+                )
+                items = []
+                for offset in self._distinct_products(rng.randint(1, 4)):
+                    items.append(self.CartItem(
+                        id=item_id,
+                        cart_id=pk,
+                        product_id=self.product_first_id + offset,
+                        quantity=rng.randint(1, 3),
+                        unit_price=Decimal(self.product_prices[offset]),
+                    ))
+                    item_id += 1
+                # Totales desnormalizados consistentes con los items
+                cart.item_count = sum(it.quantity for it in items)
+                cart.total_amount = sum((it.unit_price * it.quantity for it in items), Decimal("0"))
+                yield cart, items
+
+        self._bulk_pairs(rows(), count, "carritos")
+
+    def orders(self, count: int) -> None:
+        """Órdenes (85% pagadas) con items, pagos y acumulados de ventas consistentes."""
+        self._require_products()
+        if not self.user_ids:
+            raise ValueError("Genera usuarios antes que órdenes")
+        rng = self.rng
+        order_next_id = self._next_id(self.Order)
+        item_next_id = self._next_id(self.OrderItem)
+        payment_next_id = self._next_id(self.Payment)
+        shipping = Decimal("15.00")
+        sales: dict[int, list] = {}  # product_id -> [unidades, revenue, último pago]
+
+        def rows():
+            item_id = item_next_id
+            for i in range(count):
+                pk = order_next_id + i
+                created_at = self._random_past()
+                roll = rng.random()
+                status = "paid" if roll < 0.85 else ("pending" if roll < 0.95 else "canceled")
+                city, state = rng.choice(CITIES)
+
+                items, subtotal = [], Decimal("0")
+                for offset in self._distinct_products(rng.randint(1, 4)):
+                    product_id = self.product_first_id + offset
+                    quantity = rng.randint(1, 3)
+                    unit_price = Decimal(self.product_prices[offset])
+                    line_total = unit_price * quantity
+                    subtotal += line_total
+                    items.append(self.OrderItem(
+                        id=item_id,
+                        order_id=pk,
+                        product_id=product_id,
+                        quantity=quantity,
+                        unit_price=unit_price,
+                        line_total=line_total,
+                    ))
+                    item_id += 1
+                    if status == "paid":
+                        agg = sales.setdefault(product_id, [0, Decimal("0"), created_at])
+                        agg[0] += quantity
+                        agg[1] += line_total
+                        agg[2] = max(agg[2], created_at)
+
+                user_id = rng.choice(self.user_ids)
+                order = self.Order(
+                    id=pk,
+                    user_id=user_id,
+                    email=f"synth{user_id}@example.com",
+                    full_name=f"Cliente Sintético {user_id}",
+                    phone=f"300{rng.randint(1000000, 9999999)}",
+                    address_line1=f"Calle {rng.randint(1, 120)} #{rng.randint(1, 99)}-{rng.randint(1, 99)}",
+                    city=city,
+                    state=state,
+                    postal_code=f"05{rng.randint(0, 9999):04d}",
+                    subtotal_amount=subtotal,
+                    shipping_amount=shipping,
+                    total_amount=subtotal + shipping,
+                    status=status,
+                    created_at=created_at,
+                )
+                extra = list(items)
+                if status != "pending":
+                    extra.append(self.Payment(
+                        id=payment_next_id + i,
+                        order_id=pk,
+                        amount=order.total_amount,
+                        status="captured" if status == "paid" else "failed",
+                        brand=rng.choice(CARD_BRANDS),
+                        last4=f"{rng.randint(0, 9999):04d}",
+                        auth_code=f"A{rng.randint(0, 9999):04d}OK" if status == "paid" else "",
+                        error_code="" if status == "paid" else "do_not_honor",
+                        created_at=created_at + timedelta(minutes=rng.randint(1, 30)),
+                    ))
+                    extra.append(self.OrderStatusEvent(
+                        order_id=pk, from_status="pending", to_status=status, created_at=created_at
+                    ))
+                if status == "paid":
+                    extra.append(self.ProcessedOrder(order_id=pk, processed_at=created_at))
+                yield order, extra
+
+        self._bulk_pairs(rows(), count, "órdenes")
+
+        self._bulk(self.ProductSalesAggregate, (
+            self.ProductSalesAggregate(
+                product_id=product_id, units_sold=units, revenue=revenue, last_paid_at=last_paid_at
+            )
+            for product_id, (units, revenue, last_paid_at) in sales.items()
+        ), len(sales))
+
+    def views(self, count: int) -> None:
+        """Eventos de vista con popularidad sesgada hacia pocos productos, más su agregado."""
+        self._require_products()
+        rng = self.rng
+        views_per_product = array("q", bytes(8 * len(self.product_prices)))
+        last_view = {}
+
+        def objs():
+            for _ in range(count):
+                offset = self._popular_product()
+                created_at = self._random_past()
+                views_per_product[offset] += 1
+                if offset not in last_view or created_at > last_view[offset]:
+                    last_view[offset] = created_at
+                user_id = rng.choice(self.user_ids) if self.user_ids and rng.random() < 0.3 else None
+                yield self.ProductView(
+                    product_id=self.product_first_id + offset,
+                    user_id=user_id,
+                    session_key=f"{rng.getrandbits(128):032x}",
+                    ip_address=f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                    created_at=created_at,
+                )
+
+        self._bulk(self.ProductView, objs(), count)
+        self._bulk(self.ProductViewAggregate, (
+            self.ProductViewAggregate(
+                product_id=self.product_first_id + offset,
+                views_count=views_per_product[offset],
+                last_view_at=last_at,
+            )
+            for offset, last_at in last_view.items()
+        ), len(last_view))
+
+    def finish(self) -> None:
+        """Ajusta las secuencias de ids tras insertar pk explícitos (Postgres)."""
+        models = [
+            self.Category, self.Product, self.ProductSpecification, self.User, self.Cart,
+            self.CartItem, self.Order, self.OrderItem, self.Payment,
+        ]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    # --- Utilidades ---
+
+    def _spec_extras(self, category_type: str) -> dict:
+        rng = self.rng
+        if category_type == "celulares_tablets":
+            return {"screen_size": Decimal(rng.randint(55, 130)) / 10}
+        if category_type == "computadores":
+            return {"weight": Decimal(rng.randint(80, 350)) / 100}
+        if category_type == "audio_video":
+            return {"screen_size": Decimal(rng.choice([32, 43, 55, 65, 75]))}
+        if category_type == "gaming":
+            return {"multiplayer": rng.random() < 0.6}
+        return {}
+
+    def _require_products(self) -> None:
+        if not self.product_prices:
+            raise ValueError("Genera productos antes que carritos, órdenes o vistas")
+
+    def _popular_product(self) -> int:
+        # Sesgo tipo ley de potencias: los primeros productos concentran la mayoría
+        return int(len(self.product_prices) * self.rng.random() ** 3)
+
+    def _distinct_products(self, k: int) -> set[int]:
+        k = min(k, len(self.product_prices))
+        picked: set[int] = set()
+        while len(picked) < k:
+            picked.add(self._popular_product())
+        return picked
+
+    def _random_past(self):
+        return self.now - timedelta(seconds=self.rng.randint(0, self.days * 24 * 60 * 60))
+
+    def _next_id(self, model) -> int:
+        return (model.objects.aggregate(m=Max("id"))["m"] or 0) + 1
+
+    def _bulk(self, model, objs, total: Optional[int] = None) -> None:
+        """Inserta un iterable de instancias en lotes, reportando filas/s."""
+        started = time.monotonic()
+        batch, inserted = [], 0
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                inserted += self._insert_batch({model: batch})
+                batch = []
+                self._report(model._meta.verbose_name_plural, inserted, total, started)
+        if batch:
+            inserted += self._insert_batch({model: batch})
+        self._report(model._meta.verbose_name_plural, inserted, total, started)
+
+    def _bulk_pairs(self, rows, total: int, label: str) -> None:
+        """Inserta pares (padre, hijos) en lotes; los padres siempre antes que los hijos."""
+        started = time.monotonic()
+        parents, children, done = [], [], 0
+        for parent, extra in rows:
+            parents.append(parent)
+            children.extend(extra if isinstance(extra, list) else [extra])
+            if len(parents) >= self.batch_size:
+                done += len(parents)
+                self._insert_batch({type(parent): parents}, children)
+                parents, children = [], []
+                self._report(label, done, total, started)
+        if parents:
+            done += len(parents)
+            self._insert_batch({type(parents[0]): parents}, children)
+        self._report(label, done, total, started)
+
+    def _insert_batch(self, groups: dict, children: Optional[list] = None) -> int:
+        by_model = dict(groups)
+        for obj in children or []:
+            by_model.setdefault(type(obj), []).append(obj)
+        with transaction.atomic():
+            for model, objs in by_model.items():
+                model.objects.bulk_create(objs, batch_size=self.batch_size)
+        return sum(len(objs) for objs in groups.values())
+
+    def _report(self, label: str, done: int, total: Optional[int], started: float) -> None:
+        if not self.progress:
+            return
+        rate = done / max(time.monotonic() - started, 1e-6)
+        suffix = f"/{total}" if total is not None else ""
+        self.progress(f"{label}: {done}{suffix} ({rate:,.0f} filas/s)")
@@ -1,3 +1,85 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.apps import apps
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+
+from .http import get_client_ip
+
+
+class SeedSyntheticTests(TestCase):
+    """Pruebas del generador de datos sintéticos."""
+
+    ARGS = {
+        "categories": 8,
+        "products": 60,
+        "users": 10,
+        "carts": 5,
+        "orders": 20,
+        "views": 200,
+        "batch_size": 7,
+        "seed": 7,
+    }
+
+    def _seed(self):
+        call_command("seed_synthetic", stdout=StringIO(), **self.ARGS)
+
+    def test_generates_consistent_volume(self):
+        self._seed()
+        Product = apps.get_model("catalog", "Product")
+        Order = apps.get_model("order", "Order")
+        ProductView = apps.get_model("analytics", "ProductView")
+        ProductSalesAggregate = apps.get_model("analytics", "ProductSalesAggregate")
+        ProcessedOrder = apps.get_model("analytics", "ProcessedOrder")
+
+        self.assertEqual(Product.objects.count(), 60)
+        self.assertEqual(Product.objects.filter(specifications__isnull=False).count(), 60)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(ProductView.objects.count(), 200)
+
+        # Cada orden pagada tiene pago capturado, marca de analytics y suma de items = subtotal
+        paid = Order.objects.filter(status="paid").prefetch_related("items", "payments")
+        self.assertEqual(ProcessedOrder.objects.count(), paid.count())
+        for order in paid:
+            self.assertEqual(order.payments.get().status, "captured")
+            self.assertEqual(sum(i.line_total for i in order.items.all()), order.subtotal_amount)
+        units = sum(a.units_sold for a in ProductSalesAggregate.objects.all())
+        self.assertEqual(units, sum(i.quantity for o in paid for i in o.items.all()))
+
+    def test_same_seed_same_data(self):
+        Product = apps.get_model("catalog", "Product")
+        self._seed()
+        first = list(Product.objects.order_by("id").values_list("name", "price", "category__slug"))
+        self._wipe()
+        self._seed()
+        second = list(Product.objects.order_by("id").values_list("name", "price", "category__slug"))
+        self.assertEqual(first, second)
+
+    def _wipe(self):
+        for label in (
+            "analytics.ProductView", "analytics.ProductViewAggregate", "analytics.ProductSalesAggregate",
+            "analytics.ProcessedOrder", "payment.Payment", "order.OrderItem", "order.Order",
+            "cart.CartItem", "cart.Cart", "catalog.ProductSpecification", "catalog.Product",
+            "catalog.Category", "authx.User",
+        ):
+            apps.get_model(label).objects.all().delete()
+
+
+class ClientIpTests(TestCase):
+    """Pruebas de la IP del cliente detrás de proxies."""
+
+    def _request(self, xff=None):
+        extra = {"REMOTE_ADDR": "10.0.0.1"}
+        if xff is not None:
+            extra["HTTP_X_FORWARDED_FOR"] = xff
+        return RequestFactory().get("/", **extra)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_uses_the_address_added_by_the_trusted_proxy(self):
+        # El cliente falsifica la primera entrada; Nginx agrega la real al final
+        self.assertEqual(get_client_ip(self._request("1.1.1.1, 200.1.2.3")), "200.1.2.3")
+        self.assertEqual(get_client_ip(self._request()), "10.0.0.1")
+
+    @override_settings(TRUSTED_PROXY_COUNT=0)
+    def test_ignores_forwarded_header_without_proxies(self):
+        self.assertEqual(get_client_ip(self._request("1.1.1.1")), "10.0.0.1")
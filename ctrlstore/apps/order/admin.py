@@ -1,13 +1,53 @@
-from django.contrib import admin
-from .models import Order, OrderItem
+from django.contrib import admin, messages
+from ctrlstore.apps.common.exceptions import OrderError
+from .models import Order, OrderItem, OrderStatusEvent, ShippingRate, StockReservation
+from .services import OrderStateMachine
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
 
+
+class OrderStatusEventInline(admin.TabularInline):
+    model = OrderStatusEvent
+    extra = 0
+    can_delete = False
+    readonly_fields = ("from_status", "to_status", "reason", "created_at")
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "email", "total_amount", "status", "created_at")
     list_filter = ("status", "created_at")
     search_fields = ("id", "user__username", "email", "full_name")
-    inlines = [OrderItemInline]
+    # El estado solo cambia con OrderStateMachine (valida y registra la transición)
+    readonly_fields = ("status",)
+    inlines = [OrderItemInline, OrderStatusEventInline]
+    actions = ["cancel_orders"]
+
+    @admin.action(description="Cancelar órdenes seleccionadas")
+    def cancel_orders(self, request, queryset):
+        canceled = 0
+        for order in queryset:
+            try:
+                canceled += OrderStateMachine.transition(order, "canceled", reason=f"admin:{request.user.pk}")
+            except OrderError as e:
+                self.message_user(request, e.message, level=messages.WARNING)
+        self.message_user(request, f"{canceled} orden(es) cancelada(s).")
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "product", "quantity", "status", "expires_at")
+    list_filter = ("status",)
+    search_fields = ("order__id", "product__name")
+    raw_id_fields = ("order", "order_item", "product")
+
+
+@admin.register(ShippingRate)
+class ShippingRateAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "base_amount", "per_kg_amount", "is_active", "updated_at")
+    list_filter = ("is_active", "country")
+    search_fields = ("country", "state", "city")
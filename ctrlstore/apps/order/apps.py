@@ -4,3 +4,7 @@ class OrderConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ctrlstore.apps.order"
     verbose_name = "Orders"
+
+    def ready(self):
+        # Registra signals
+        from . import receivers  # noqa: F401
@@ -2,6 +2,11 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 
 class CheckoutForm(forms.Form):
+    # Token por formulario (ver Order.idempotency_key); lo genera la vista en el GET
+    idempotency_key = forms.CharField(max_length=64, required=False, widget=forms.HiddenInput)
+    # Envío que el cliente vio en pantalla; si el destino cotiza distinto se vuelve a mostrar
+    quoted_shipping = forms.DecimalField(max_digits=10, decimal_places=2, required=False, widget=forms.HiddenInput)
+
     full_name = forms.CharField(label=_("Nombre completo"), max_length=120)
     email = forms.EmailField(label=_("Correo"))
     phone = forms.CharField(label=_("Teléfono"), max_length=30, required=False)
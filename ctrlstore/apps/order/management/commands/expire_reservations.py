@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from ctrlstore.apps.order.services import StockReservationService
+
+
+class Command(BaseCommand):
+    help = "Marca como vencidas las reservas de stock cuyo plazo ya pasó"
+
+    def handle(self, *args, **options):
+        expired = StockReservationService.expire_stale()
+        self.stdout.write(self.style.SUCCESS(f"✓ {expired} reserva(s) marcadas como vencidas"))
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("order", "0003_order_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShippingRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("country", models.CharField(blank=True, max_length=60)),
+                (
+                    "state",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Departamento/Estado"
+                    ),
+                ),
+                ("city", models.CharField(blank=True, max_length=100)),
+                (
+                    "min_weight",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=8, verbose_name="Peso mínimo (kg)"
+                    ),
+                ),
+                (
+                    "max_weight",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=2,
+                        help_text="Vacío = sin límite",
+                        max_digits=8,
+                        null=True,
+                        verbose_name="Peso máximo (kg)",
+                    ),
+                ),
+                ("base_amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("per_kg_amount", models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ("is_active", models.BooleanField(default=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["country", "state", "city", "min_weight"],
+            },
+        ),
+    ]
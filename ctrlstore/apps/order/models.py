@@ -32,10 +32,51 @@ class Order(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Token del formulario de checkout: un reenvío con el mismo token retorna esta orden
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "idempotency_key"],
+                name="order_unique_user_idempotency_key",
+            ),
+        ]
+        indexes = [
+            # Reportes de ventas: status="paid" en un rango de created_at
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} – {self.user} – {self.status}"
 
 
+class OrderStatusEvent(models.Model):
+    """
+    Transición de estado de una orden.
+
+    La escribe ``OrderStateMachine.transition`` en la misma transacción que cambia
+    ``Order.status``; la tabla es de solo inserción.
+    """
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="status_events")
+    from_status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    reason = models.CharField(max_length=120, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.from_status} → {self.to_status}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("OrderStatusEvent es de solo inserción")
+        super().save(*args, **kwargs)
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey("catalog.Product", on_delete=models.PROTECT)
@@ -45,3 +86,67 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product} x{self.quantity}"
+
+
+class StockReservation(models.Model):
+    """
+    Reserva temporal de stock de un OrderItem entre el checkout y el pago.
+
+    Una reserva cuenta contra el stock disponible mientras esté activa y no haya
+    vencido (``expires_at``); al capturar el pago se convierte en descuento de stock.
+    """
+
+    STATUS_CHOICES = [
+        ("active", "Activa"),
+        ("converted", "Convertida"),
+        ("released", "Liberada"),
+        ("expired", "Vencida"),
+    ]
+
+    order_item = models.OneToOneField(OrderItem, on_delete=models.CASCADE, related_name="reservation")
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey("catalog.Product", on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="active")
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Suma de reservas activas por producto (stock disponible)
+            models.Index(fields=["product", "status", "expires_at"]),
+            models.Index(fields=["status", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"Reserva {self.product_id} x{self.quantity} ({self.status})"
+
+
+class ShippingRate(models.Model):
+    """
+    Tarifa de envío por destino y rango de peso.
+
+    ``country``, ``state`` y ``city`` vacíos actúan como comodín; gana la tarifa más
+    específica (ciudad > departamento > país > general) cuyo rango de peso contenga
+    el peso del pedido. Costo = ``base_amount + per_kg_amount * peso``.
+    """
+
+    country = models.CharField(max_length=60, blank=True)
+    state = models.CharField("Departamento/Estado", max_length=100, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    min_weight = models.DecimalField("Peso mínimo (kg)", max_digits=8, decimal_places=2, default=0)
+    max_weight = models.DecimalField(
+        "Peso máximo (kg)", max_digits=8, decimal_places=2, null=True, blank=True,
+        help_text="Vacío = sin límite",
+    )
+    base_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    per_kg_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["country", "state", "city", "min_weight"]
+
+    def __str__(self):
+        where = " / ".join(p for p in (self.country, self.state, self.city) if p) or "General"
+        return f"{where} [{self.min_weight}-{self.max_weight or '∞'} kg]"
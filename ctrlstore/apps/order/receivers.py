@@ -0,0 +1,14 @@
+# ctrlstore/apps/order/receivers.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ShippingRate
+from .shipping import bump_rates_version
+
+
+@receiver(post_save, sender=ShippingRate)
+@receiver(post_delete, sender=ShippingRate)
+def invalidate_shipping_rates(sender, **kwargs):
+    """Cambia la versión de la tabla de tarifas cuando se confirma la transacción."""
+    transaction.on_commit(bump_rates_version)
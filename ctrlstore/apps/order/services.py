@@ -0,0 +1,462 @@
+"""
+Servicios de órdenes.
+Implementa la lógica de negocio siguiendo el principio "Thin Views, Fat Services".
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, replace
+from functools import partial
+from datetime import timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from ctrlstore.apps.cart.services import CartService
+from ctrlstore.apps.catalog.services import decrement_stock
+from ctrlstore.apps.common.exceptions import OrderError, StockError
+
+from .models import Order, OrderItem, OrderStatusEvent, StockReservation
+from .shipping import get_shipping_engine
+from .signals import order_paid
+
+logger = logging.getLogger(__name__)
+
+
+class StockReservationService:
+    """Reservas de stock con vencimiento entre el checkout y el pago."""
+
+    @staticmethod
+    def ttl() -> timedelta:
+        """Duración de una reserva (``STOCK_RESERVATION_TTL_MINUTES``, 15 por defecto)."""
+        return timedelta(minutes=getattr(settings, "STOCK_RESERVATION_TTL_MINUTES", 15))
+
+    @staticmethod
+    def active_holds_filter(prefix: str = "", exclude_order: Order | None = None) -> Q:
+        """Condición de reserva vigente (activa y sin vencer), relativa a ``prefix``."""
+        condition = Q(**{f"{prefix}status": "active", f"{prefix}expires_at__gt": timezone.now()})
+        if exclude_order is not None:
+            condition &= ~Q(**{f"{prefix}order": exclude_order})
+        return condition
+
+    @staticmethod
+    def available_stock(
+        product_ids: Iterable[int],
+        exclude_order: Order | None = None,
+    ) -> dict[int, int]:
+        """
+        Stock disponible por producto: ``stock_quantity`` menos las reservas vigentes.
+
+        Se resuelve con una sola consulta agregada apoyada en el índice
+        (product, status, expires_at) de StockReservation.
+
+        Args:
+            product_ids: Productos a consultar
+            exclude_order: Orden cuyas reservas no se descuentan (la propia al pagar)
+
+        Returns:
+            Diccionario product_id -> unidades disponibles
+        """
+        Product = apps.get_model("catalog", "Product")
+        held = Sum(
+            "reservations__quantity",
+            filter=StockReservationService.active_holds_filter("reservations__", exclude_order),
+        )
+        rows = (
+            Product.objects.filter(pk__in=list(product_ids))
+            .annotate(available=F("stock_quantity") - Coalesce(held, 0))
+            .values_list("pk", "available")
+        )
+        return dict(rows)
+
+    @staticmethod
+    def reserve_for_order(
+        order: Order,
+        items: Optional[list[OrderItem]] = None,
+    ) -> list[StockReservation]:
+        """
+        Crea una reserva por cada OrderItem de la orden.
+
+        Las filas de producto se bloquean solo durante esta transacción corta; a partir
+        de ahí la reserva garantiza las unidades hasta que venza, sin mantener locks.
+
+        Args:
+            order: Orden recién creada
+            items: Items ya creados de la orden (se consultan si no se pasan)
+
+        Returns:
+            Reservas creadas
+
+        Raises:
+            StockError: Si algún producto no tiene unidades disponibles
+        """
+        Product = apps.get_model("catalog", "Product")
+        items = list(order.items.all()) if items is None else items
+        product_ids = sorted({it.product_id for it in items})
+
+        with transaction.atomic():
+            # Orden estable de locks para evitar deadlocks entre checkouts concurrentes
+            list(
+                Product.objects.select_for_update()
+                .filter(pk__in=product_ids)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            available = StockReservationService.available_stock(product_ids)
+
+            requested: dict[int, int] = {}
+            for it in items:
+                requested[it.product_id] = requested.get(it.product_id, 0) + it.quantity
+            missing = {
+                pid: {"available": max(available.get(pid, 0), 0), "requested": qty}
+                for pid, qty in requested.items()
+                if qty > available.get(pid, 0)
+            }
+            if missing:
+                raise StockError(
+                    "No hay stock suficiente para reservar la orden",
+                    error_code="out_of_stock",
+                    details={"products": missing},
+                )
+
+            expires_at = timezone.now() + StockReservationService.ttl()
+            reservations = StockReservation.objects.bulk_create([
+                StockReservation(
+                    order_item=it,
+                    order=order,
+                    product_id=it.product_id,
+                    quantity=it.quantity,
+                    expires_at=expires_at,
+                )
+                for it in items
+            ])
+
+        logger.info(
+            "Stock reservado para la orden",
+            extra={
+                "order_id": order.id,
+                "items": len(reservations),
+                "expires_at": expires_at.isoformat(),
+            },
+        )
+        return reservations
+
+    @staticmethod
+    def commit_for_order(order: Order) -> None:
+        """
+        Convierte las reservas de la orden en descuentos de stock al capturar el pago.
+
+        Debe ejecutarse dentro de la transacción de captura. Si todas las reservas de
+        la orden siguen vigentes, las unidades ya están garantizadas y basta el UPDATE
+        condicional de ``decrement_stock``, sin bloqueos previos. Si alguna venció, se
+        bloquean los productos y se vuelve a validar contra el stock no reservado por
+        otras órdenes.
+
+        Raises:
+            StockError: Si el stock ya no alcanza para la orden
+        """
+        Product = apps.get_model("catalog", "Product")
+        items = list(order.items.all())
+        requested: dict[int, int] = {}
+        for it in items:
+            requested[it.product_id] = requested.get(it.product_id, 0) + it.quantity
+
+        held = StockReservation.objects.filter(
+            StockReservationService.active_holds_filter(), order=order
+        ).count()
+        if held < len(items):
+            # Bloquea filas de producto para evitar carreras
+            names = dict(
+                Product.objects.select_for_update()
+                .filter(pk__in=sorted(requested))
+                .order_by("pk")
+                .values_list("pk", "name")
+            )
+            available = StockReservationService.available_stock(requested, exclude_order=order)
+
+            missing = [
+                _("%(product)s (stock: %(stock)s, requerido: %(req)s)") % {
+                    "product": names.get(pid, pid),
+                    "stock": max(available.get(pid, 0), 0),
+                    "req": qty,
+                }
+                for pid, qty in requested.items()
+                if qty > available.get(pid, 0)
+            ]
+            if missing:
+                raise StockError(
+                    _("Stock insuficiente para: %(items)s") % {"items": ", ".join(missing)},
+                    error_code="out_of_stock",
+                )
+
+        # Descontar stock con un único UPDATE condicional (stock_quantity >= n)
+        decrement_stock(requested)
+
+        StockReservation.objects.filter(
+            order=order, status__in=["active", "expired"]
+        ).update(status="converted")
+
+    @staticmethod
+    def release_for_order(order: Order) -> int:
+        """Libera las reservas activas de una orden (p. ej. al cancelarla)."""
+        return StockReservation.objects.filter(
+            order=order, status="active"
+        ).update(status="released")
+
+    @staticmethod
+    def expire_stale() -> int:
+        """
+        Marca como vencidas las reservas activas cuyo ``expires_at`` ya pasó.
+
+        El stock disponible ya ignora las reservas vencidas; esto solo mantiene el
+        estado al día para reportes y consultas administrativas.
+
+        Returns:
+            Número de reservas marcadas
+        """
+        return StockReservation.objects.filter(
+            status="active", expires_at__lte=timezone.now()
+        ).update(status="expired")
+
+
+
+def _send_order_paid(order: Order) -> None:
+    """
+    Envía ``order_paid`` tras el commit sin propagar errores de los receivers.
+
+    El pago ya está confirmado: un receiver que falla (p. ej. analytics) no debe
+    convertirse en un 500 para el cliente ni cortar un lote del webhook.
+    ``reconcile_payments`` repara lo que haya quedado sin aplicar.
+    """
+    for receiver, response in order_paid.send_robust(sender=Order, order=order):
+        if isinstance(response, Exception):
+            logger.error(
+                f"Receiver {getattr(receiver, '__qualname__', receiver)} de order_paid falló "
+                f"para la orden {order.pk}: {response}",
+                exc_info=response,
+            )
+
+class OrderStateMachine:
+    """
+    Transiciones válidas de ``Order.status``.
+
+    Cada cambio es un UPDATE condicional sobre el estado de origen: si otra transacción
+    ya movió la orden, el UPDATE no afecta filas y la transición no se repite. Por eso
+    ``OrderStatusEvent`` tiene una fila por transición y ``order_paid`` se envía una
+    sola vez por orden.
+    """
+
+    TRANSITIONS: dict[str, frozenset[str]] = {
+        "pending": frozenset({"paid", "canceled"}),
+        "paid": frozenset(),
+        "canceled": frozenset(),
+    }
+
+    @staticmethod
+    def can_transition(from_status: str, to_status: str) -> bool:
+        return to_status in OrderStateMachine.TRANSITIONS.get(from_status, frozenset())
+
+    @staticmethod
+    def transition(order: Order, to_status: str, reason: str = "") -> bool:
+        """
+        Cambia el estado de la orden y registra la transición.
+
+        Pasar a ``paid`` envía ``order_paid`` al confirmarse la transacción; pasar a
+        ``canceled`` libera las reservas de stock activas.
+
+        Args:
+            order: Orden a actualizar (se sincroniza ``order.status``)
+            to_status: Estado destino
+            reason: Motivo de la transición (p. ej. ``payment:12``)
+
+        Returns:
+            True si hubo transición, False si la orden ya estaba en ``to_status``
+
+        Raises:
+            OrderError: Si la transición no es válida desde el estado actual
+        """
+        with transaction.atomic():
+            from_status = order.status
+            now = timezone.now()
+            updated = 0
+            if OrderStateMachine.can_transition(from_status, to_status):
+                updated = Order.objects.filter(pk=order.pk, status=from_status).update(
+                    status=to_status, updated_at=now
+                )
+            if not updated:
+                # El estado en memoria no era válido o quedó viejo: se decide con el de la BD
+                current = Order.objects.filter(pk=order.pk).values_list("status", flat=True).first()
+                order.status = current or from_status
+                if current == to_status:
+                    return False
+                if current is None or not OrderStateMachine.can_transition(current, to_status):
+                    raise OrderError(
+                        f"La orden {order.pk} no puede pasar de '{order.status}' a '{to_status}'.",
+                        error_code="invalid_transition",
+                        details={"order_id": order.pk, "from": order.status, "to": to_status},
+                    )
+                return OrderStateMachine.transition(order, to_status, reason)
+
+            order.status = to_status
+            order.updated_at = now
+            OrderStatusEvent.objects.create(
+                order=order, from_status=from_status, to_status=to_status, reason=reason[:120]
+            )
+            if to_status == "canceled":
+                StockReservationService.release_for_order(order)
+            elif to_status == "paid":
+                transaction.on_commit(partial(_send_order_paid, order))
+
+        logger.info(f"Orden {order.pk}: {from_status} -> {to_status} {reason}".rstrip())
+        return True
+
+
+@dataclass(frozen=True)
+class CheckoutLine:
+    """Línea del carrito congelada al momento del checkout."""
+
+    product_id: int
+    name: str
+    quantity: int
+    unit_price: Decimal
+    weight: Decimal  # kg por unidad
+
+    @property
+    def line_total(self) -> Decimal:
+        return self.unit_price * self.quantity
+
+
+@dataclass(frozen=True)
+class CheckoutSnapshot:
+    """
+    Foto inmutable del carrito para el checkout.
+
+    Subtotal, total, campos de la Order y filas de OrderItem se derivan de aquí,
+    así las líneas del carrito se leen una sola vez por petición.
+    """
+
+    cart_id: int
+    lines: tuple[CheckoutLine, ...]
+    shipping: Decimal
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.lines
+
+    @property
+    def subtotal(self) -> Decimal:
+        return sum((line.line_total for line in self.lines), Decimal("0"))
+
+    @property
+    def total(self) -> Decimal:
+        return self.subtotal + self.shipping
+
+    @property
+    def weight(self) -> Decimal:
+        return sum((line.weight * line.quantity for line in self.lines), Decimal("0"))
+
+    def order_items(self, order: Order) -> list[OrderItem]:
+        return [
+            OrderItem(
+                order=order,
+                product_id=line.product_id,
+                quantity=line.quantity,
+                unit_price=line.unit_price,
+                line_total=line.line_total,
+            )
+            for line in self.lines
+        ]
+
+
+class CheckoutService:
+    """Servicio del checkout: del carrito a la orden pendiente de pago."""
+
+    @staticmethod
+    def snapshot(cart, city: str = "", state: str = "", country: str = "") -> CheckoutSnapshot:
+        """
+        Carga las líneas del carrito (con el peso de cada producto) en una sola consulta
+        y cotiza el envío al destino indicado.
+
+        Args:
+            cart: Carrito del usuario
+            city, state, country: Destino del envío
+
+        Returns:
+            Snapshot inmutable del carrito
+        """
+        default_weight = Decimal(str(getattr(settings, "SHIPPING_DEFAULT_ITEM_WEIGHT_KG", "0.5")))
+        rows = cart.items.order_by("id").values_list(
+            "product_id", "product__name", "quantity", "unit_price", "product__specifications__weight"
+        )
+        lines = tuple(
+            CheckoutLine(pid, name, qty, price, weight if weight is not None else default_weight)
+            for pid, name, qty, price, weight in rows
+        )
+        snapshot = CheckoutSnapshot(cart_id=cart.id, lines=lines, shipping=Decimal("0"))
+        return CheckoutService.with_destination(snapshot, city=city, state=state, country=country)
+
+    @staticmethod
+    def with_destination(
+        snapshot: CheckoutSnapshot, city: str = "", state: str = "", country: str = ""
+    ) -> CheckoutSnapshot:
+        """Copia del snapshot con el envío cotizado para otro destino (sin consultas)."""
+        shipping = get_shipping_engine().quote(snapshot.weight, city=city, state=state, country=country)
+        return replace(snapshot, shipping=shipping)
+
+    @staticmethod
+    def place_order(request, snapshot: CheckoutSnapshot, data: dict) -> Order:
+        """
+        Crea la orden, sus items y las reservas de stock, y vacía el carrito.
+
+        Todo ocurre en una transacción: si falta stock no queda nada escrito.
+
+        Args:
+            request: Request HTTP (para vaciar el carrito)
+            snapshot: Snapshot del carrito
+            data: Datos validados del formulario de checkout
+
+        Returns:
+            Orden creada en estado pending
+
+        Raises:
+            StockError: Si no hay stock para reservar la orden
+            IntegrityError: Si el idempotency_key ya se usó (reenvío concurrente)
+        """
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=request.user,
+                idempotency_key=data.get("idempotency_key") or None,
+                email=data["email"],
+                full_name=data["full_name"],
+                phone=data.get("phone", ""),
+                address_line1=data["address_line1"],
+                address_line2=data.get("address_line2", ""),
+                city=data["city"],
+                state=data.get("state", ""),
+                postal_code=data.get("postal_code", ""),
+                country=data.get("country", "Colombia"),
+                subtotal_amount=snapshot.subtotal,
+                shipping_amount=snapshot.shipping,
+                total_amount=snapshot.total,
+                status="pending",
+            )
+            items = OrderItem.objects.bulk_create(snapshot.order_items(order))
+
+            # Reservar stock hasta el pago (vence si no se paga a tiempo)
+            StockReservationService.reserve_for_order(order, items)
+
+            CartService.clear_cart(request)
+
+        logger.info(
+            "Orden creada desde el checkout",
+            extra={"order_id": order.id, "lines": len(items), "total": str(order.total_amount)},
+        )
+        return order
@@ -0,0 +1,132 @@
+"""
+Cálculo de tarifas de envío.
+
+El motor se elige con ``settings.SHIPPING_RATE_ENGINE`` (ruta a una clase con el método
+``quote``). El motor por defecto usa las tarifas de ``ShippingRate`` cargadas en una
+tabla en memoria del proceso; la tabla tiene una versión guardada en el caché
+compartido que cambia cada vez que se edita una tarifa, así cada proceso recarga solo
+cuando hace falta y cotizar un envío no consulta la base de datos.
+
+Con varios procesos el caché debe ser compartido (``CACHE_URL`` apuntando a
+redis/memcached): con el caché en memoria por defecto cada proceso guarda su propia
+versión y solo se entera de los cambios de tarifas hechos por él mismo.
+"""
+import logging
+import threading
+import unicodedata
+import uuid
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Envío plano si no hay ninguna tarifa aplicable
+DEFAULT_SHIPPING = Decimal("15.00")
+
+RATES_VERSION_KEY = "order:shipping:rates-version"
+
+
+def _normalize(value: str) -> str:
+    """Normaliza un nombre de lugar: sin tildes, sin espacios extra y en minúsculas."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).strip().casefold()
+
+
+def bump_rates_version() -> None:
+    """Invalida las tablas en memoria de todos los procesos."""
+    cache.set(RATES_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def _current_version() -> str:
+    return cache.get_or_set(RATES_VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+class ShippingRateTable:
+    """
+    Tarifas activas indexadas por destino normalizado ``(country, state, city)``.
+
+    Cada llave guarda sus rangos de peso ordenados por ``min_weight``.
+    """
+
+    def __init__(self, rates):
+        self.rates: dict[tuple[str, str, str], list] = {}
+        for rate in rates:
+            key = (_normalize(rate.country), _normalize(rate.state), _normalize(rate.city))
+            self.rates.setdefault(key, []).append(rate)
+        for bands in self.rates.values():
+            bands.sort(key=lambda r: r.min_weight)
+
+    def __len__(self) -> int:
+        return sum(len(bands) for bands in self.rates.values())
+
+    def find(self, weight: Decimal, city: str = "", state: str = "", country: str = ""):
+        """Tarifa más específica para el destino cuyo rango contenga ``weight``."""
+        country, state, city = _normalize(country), _normalize(state), _normalize(city)
+        candidates = [
+            (country, state, city),
+            (country, "", city),
+            (country, state, ""),
+            (country, "", ""),
+            ("", "", ""),
+        ]
+        for key in candidates:
+            for rate in self.rates.get(key, ()):
+                if rate.min_weight <= weight and (rate.max_weight is None or weight < rate.max_weight):
+                    return rate
+        return None
+
+
+class TableShippingEngine:
+    """Motor por defecto: tabla de ``ShippingRate`` versionada y cacheada por proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table: Optional[ShippingRateTable] = None
+        self._version: Optional[str] = None
+
+    def table(self) -> ShippingRateTable:
+        version = _current_version()
+        if self._table is None or version != self._version:
+            with self._lock:
+                if self._table is None or version != self._version:
+                    from .models import ShippingRate
+
+                    self._table = ShippingRateTable(ShippingRate.objects.filter(is_active=True))
+                    self._version = version
+                    logger.info(f"Tabla de tarifas de envío cargada ({len(self._table)} tarifas)")
+        return self._table
+
+    def quote(self, weight: Decimal, city: str = "", state: str = "", country: str = "") -> Decimal:
+        """
+        Costo de envío para un pedido.
+
+        Args:
+            weight: Peso total del pedido en kg
+            city, state, country: Destino
+
+        Returns:
+            Costo del envío (``DEFAULT_SHIPPING`` si ninguna tarifa aplica)
+        """
+        rate = self.table().find(weight, city=city, state=state, country=country)
+        if rate is None:
+            return DEFAULT_SHIPPING
+        return (rate.base_amount + rate.per_kg_amount * weight).quantize(Decimal("0.01"))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_shipping_engine():
+    """Instancia (única por proceso) del motor configurado en ``SHIPPING_RATE_ENGINE``."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                path = getattr(settings, "SHIPPING_RATE_ENGINE", f"{__name__}.TableShippingEngine")
+                _engine = import_string(path)()
+    return _engine
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Se envía una sola vez por orden, al confirmarse la transacción que la pasa a "paid".
+# Argumentos: order
+order_paid = Signal()
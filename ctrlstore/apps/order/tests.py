@@ -1,3 +1,369 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ctrlstore.apps.cart.models import Cart, CartItem
+from ctrlstore.apps.catalog.models import Category, Product, ProductSpecification
+from ctrlstore.apps.analytics.models import ProcessedOrder
+from ctrlstore.apps.common.exceptions import OrderError, StockError
+
+from .models import Order, OrderItem, OrderStatusEvent, ShippingRate, StockReservation
+from .services import CheckoutService, OrderStateMachine, StockReservationService
+from .signals import order_paid
+from .shipping import bump_rates_version, get_shipping_engine
+
+User = get_user_model()
+
+
+class StockReservationTests(TestCase):
+    """Pruebas de las reservas de stock entre checkout y pago."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.product = Product.objects.create(
+            name="Consola", slug="consola", price=Decimal("100.00"), category=category, stock_quantity=5
+        )
+        self.user = User.objects.create_user(
+            username="cliente", email="cliente@example.com", password="clave-segura-123"
+        )
+
+    def _order(self, quantity):
+        order = Order.objects.create(
+            user=self.user, email="cliente@example.com", full_name="Cliente",
+            address_line1="Calle 1", city="Medellín", total_amount=Decimal("100.00") * quantity,
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=quantity,
+            unit_price=Decimal("100.00"), line_total=Decimal("100.00") * quantity,
+        )
+        return order
+
+    def _available(self, **kwargs):
+        return StockReservationService.available_stock([self.product.pk], **kwargs)[self.product.pk]
+
+    def test_holds_reduce_available_stock(self):
+        first = self._order(3)
+        StockReservationService.reserve_for_order(first)
+
+        self.assertEqual(self._available(), 2)
+        self.assertEqual(self._available(exclude_order=first), 5)
+        with self.assertRaises(StockError):
+            StockReservationService.reserve_for_order(self._order(3))
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_expired_holds_do_not_count(self):
+        StockReservationService.reserve_for_order(self._order(5))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self._available(), 5)
+        self.assertEqual(StockReservationService.expire_stale(), 1)
+        self.assertEqual(StockReservation.objects.get().status, "expired")
+
+    def test_commit_converts_holds_into_stock_decrement(self):
+        order = self._order(2)
+        StockReservationService.reserve_for_order(order)
+
+        StockReservationService.commit_for_order(order)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+        self.assertEqual(StockReservation.objects.get().status, "converted")
+        self.assertEqual(self._available(), 3)
+
+    def test_commit_with_expired_hold_revalidates_stock(self):
+        order = self._order(4)
+        StockReservationService.reserve_for_order(order)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        StockReservationService.reserve_for_order(self._order(3))
+
+        with self.assertRaises(StockError):
+            StockReservationService.commit_for_order(order)
+
+
+class CheckoutIdempotencyTests(TestCase):
+    """Pruebas del checkout idempotente."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.product = Product.objects.create(
+            name="Consola", slug="consola", price=Decimal("100.00"), category=category, stock_quantity=5
+        )
+        self.user = User.objects.create_user(
+            username="cliente", email="cliente@example.com", password="clave-segura-123"
+        )
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("cart:api"),
+            data=json.dumps({"operations": [{"product_id": self.product.pk, "quantity": 2}]}),
+            content_type="application/json",
+        )
+        self.url = reverse("order:checkout")
+
+    def _form_data(self, key):
+        return {
+            "idempotency_key": key,
+            "full_name": "Cliente Prueba",
+            "email": "cliente@example.com",
+            "address_line1": "Calle 1 # 2-3",
+            "city": "Medellín",
+            "country": "Colombia",
+            "quoted_shipping": "15.00",
+        }
+
+    def test_get_renders_idempotency_token(self):
+        resp = self.client.get(self.url)
+        key = resp.context["form"].initial["idempotency_key"]
+        self.assertEqual(len(key), 32)
+        self.assertContains(resp, f'value="{key}"')
+
+    def test_replayed_post_returns_existing_order(self):
+        key = self.client.get(self.url).context["form"].initial["idempotency_key"]
+
+        first = self.client.post(self.url, self._form_data(key))
+        second = self.client.post(self.url, self._form_data(key))
+
+        order = Order.objects.get()
+        self.assertEqual(order.idempotency_key, key)
+        self.assertEqual(order.items.count(), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+        self.assertRedirects(first, reverse("order:pay", args=[order.id]), fetch_redirect_response=False)
+        self.assertRedirects(second, reverse("order:pay", args=[order.id]), fetch_redirect_response=False)
+
+    def test_stock_error_rolls_back_order_and_keeps_cart(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=1)
+
+        resp = self.client.post(self.url, self._form_data("token-sin-stock"))
+
+        self.assertRedirects(resp, reverse("cart:detail"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.client.get(reverse("cart:api")).json()["item_count"], 2)
+
+    def test_changed_shipping_is_shown_before_charging(self):
+        ShippingRate.objects.create(country="Colombia", city="Medellín", base_amount=Decimal("5.00"))
+        bump_rates_version()
+        self.addCleanup(bump_rates_version)
+
+        # El GET cotizó solo con el país (15.00); la ciudad cambia el envío a 5.00
+        resp = self.client.post(self.url, self._form_data("token-envio"))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(resp.context["grand_total"], Decimal("205.00"))
+        self.assertContains(resp, 'name="quoted_shipping" value="5.00"')
+
+        resp = self.client.post(self.url, {**self._form_data("token-envio"), "quoted_shipping": "5.00"})
+
+        order = Order.objects.get()
+        self.assertRedirects(resp, reverse("order:pay", args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(order.total_amount, Decimal("205.00"))
+
+
+class CheckoutQueryCountTests(TestCase):
+    """El checkout lee las líneas del carrito una sola vez, sin importar cuántas sean."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}", slug=f"producto-{i}", price=Decimal("10.00"),
+                category=category, stock_quantity=50,
+            )
+            for i in range(12)
+        ]
+        self.url = reverse("order:checkout")
+
+    def _login_with_cart(self, username, lines):
+        user = User.objects.create_user(
+            username=username, email=f"{username}@example.com", password="clave-segura-123"
+        )
+        self.client.force_login(user)
+        self.client.post(
+            reverse("cart:api"),
+            data=json.dumps({"operations": [
+                {"product_id": p.pk, "quantity": 2} for p in self.products[:lines]
+            ]}),
+            content_type="application/json",
+        )
+        self.client.get(self.url)  # calienta la sesión con el id del carrito
+
+    def _count(self, method, *args):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = getattr(self.client, method)(self.url, *args)
+        return resp, len(ctx.captured_queries)
+
+    def _post_data(self, key):
+        return {
+            "idempotency_key": key, "full_name": "Cliente", "email": "c@example.com",
+            "address_line1": "Calle 1", "city": "Medellín", "country": "Colombia",
+            "quoted_shipping": "15.00",
+        }
+
+    def test_get_query_count_is_constant(self):
+        self._login_with_cart("uno", 1)
+        resp, small = self._count("get")
+        self.assertContains(resp, "Producto 0")
+
+        self._login_with_cart("doce", 12)
+        resp, large = self._count("get")
+        self.assertContains(resp, "Producto 11")
+        self.assertEqual(resp.context["subtotal"], Decimal("240.00"))
+
+        self.assertEqual(small, large)
+
+    def test_post_query_count_is_constant(self):
+        self._login_with_cart("uno", 1)
+        resp, small = self._count("post", self._post_data("k1"))
+        self.assertEqual(resp.status_code, 302)
+
+        self._login_with_cart("doce", 12)
+        resp, large = self._count("post", self._post_data("k12"))
+        self.assertEqual(resp.status_code, 302)
+
+        order = Order.objects.get(idempotency_key="k12")
+        self.assertEqual(order.items.count(), 12)
+        self.assertEqual(order.total_amount, Decimal("255.00"))
+        self.assertEqual(small, large)
+
+
+class ShippingRateTests(TestCase):
+    """Pruebas del motor de tarifas de envío."""
+
+    def setUp(self):
+        # La tabla vive en memoria del proceso: se invalida al entrar y al salir
+        bump_rates_version()
+        self.addCleanup(bump_rates_version)
+        ShippingRate.objects.bulk_create([
+            ShippingRate(base_amount=Decimal("20.00")),
+            ShippingRate(country="Colombia", base_amount=Decimal("12.00"), per_kg_amount=Decimal("2.00")),
+            ShippingRate(
+                country="Colombia", city="Medellín", max_weight=Decimal("10"),
+                base_amount=Decimal("5.00"), per_kg_amount=Decimal("1.00"),
+            ),
+        ])
+        self.engine = get_shipping_engine()
+
+    def test_most_specific_rate_wins(self):
+        self.assertEqual(self.engine.quote(Decimal("2"), city="medellin", country="colombia"), Decimal("7.00"))
+        self.assertEqual(self.engine.quote(Decimal("2"), city="Cali", country="Colombia"), Decimal("16.00"))
+        self.assertEqual(self.engine.quote(Decimal("2"), city="Lima", country="Perú"), Decimal("20.00"))
+        # Fuera del rango de peso de la tarifa de ciudad
+        self.assertEqual(self.engine.quote(Decimal("12"), city="Medellín", country="Colombia"), Decimal("36.00"))
+
+    def test_quotes_need_no_queries_until_rates_change(self):
+        self.engine.quote(Decimal("1"), country="Colombia")
+        with self.assertNumQueries(0):
+            self.engine.quote(Decimal("1"), city="Medellín", country="Colombia")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ShippingRate.objects.filter(city="Medellín").update(base_amount=Decimal("8.00"))
+            ShippingRate.objects.get(city="Medellín").save()
+
+        self.assertEqual(self.engine.quote(Decimal("1"), city="Medellín", country="Colombia"), Decimal("9.00"))
+
+    def test_checkout_snapshot_uses_specification_weight(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        heavy = Product.objects.create(
+            name="Portátil", slug="portatil", price=Decimal("100.00"), category=category, stock_quantity=5
+        )
+        ProductSpecification.objects.create(product=heavy, weight=Decimal("2.50"))
+        light = Product.objects.create(
+            name="Juego", slug="juego", price=Decimal("10.00"), category=category, stock_quantity=5
+        )
+        cart = Cart.objects.create(session_key="envio")
+        CartItem.objects.create(cart=cart, product=heavy, quantity=2, unit_price=heavy.price)
+        CartItem.objects.create(cart=cart, product=light, quantity=1, unit_price=light.price)
+
+        with self.assertNumQueries(2):  # líneas del carrito + carga inicial de la tabla
+            snapshot = CheckoutService.snapshot(cart, city="Medellín", country="Colombia")
+
+        self.assertEqual(snapshot.weight, Decimal("5.50"))  # 2 x 2.5 + 0.5 por defecto
+        self.assertEqual(snapshot.shipping, Decimal("10.50"))
+        self.assertEqual(snapshot.total, Decimal("220.50"))
+
+
+class OrderStateMachineTests(TestCase):
+    """Pruebas de las transiciones de estado de la orden."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.product = Product.objects.create(
+            name="Consola", slug="consola", price=Decimal("100.00"), category=category, stock_quantity=5
+        )
+        user = User.objects.create_user(
+            username="cliente", email="cliente@example.com", password="clave-segura-123"
+        )
+        self.order = Order.objects.create(
+            user=user, email="cliente@example.com", full_name="Cliente",
+            address_line1="Calle 1", city="Medellín", total_amount=Decimal("200.00"),
+        )
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2,
+            unit_price=Decimal("100.00"), line_total=Decimal("200.00"),
+        )
+
+        self.paid_signals = []
+
+        def listener(sender, order, **kwargs):
+            self.paid_signals.append(order.pk)
+
+        order_paid.connect(listener)
+        self.addCleanup(order_paid.disconnect, listener)
+
+    def test_paid_transition_is_logged_and_signaled_once(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(OrderStateMachine.transition(self.order, "paid", reason="payment:1"))
+            # Otra copia de la misma orden llega tarde: no repite la transición
+            self.assertFalse(OrderStateMachine.transition(stale, "paid", reason="payment:1"))
+
+        self.assertEqual(self.paid_signals, [self.order.pk])
+        event = OrderStatusEvent.objects.get()
+        self.assertEqual((event.from_status, event.to_status, event.reason), ("pending", "paid", "payment:1"))
+        self.assertEqual(ProcessedOrder.objects.filter(order=self.order).count(), 1)
+
+        # Un save() cualquiera de la orden pagada ya no vuelve a contabilizarla
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.order.full_name = "Cliente Actualizado"
+            self.order.save()
+        self.assertEqual(callbacks, [])
+
+    def test_failing_receiver_does_not_break_the_transition(self):
+        def broken(sender, order, **kwargs):
+            raise RuntimeError("analytics caído")
+
+        order_paid.connect(broken)
+        self.addCleanup(order_paid.disconnect, broken)
+
+        with self.assertLogs("ctrlstore.apps.order.services", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                OrderStateMachine.transition(self.order, "paid")
+
+        self.assertEqual(self.paid_signals, [self.order.pk])
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, "paid")
+
+    def test_invalid_transition_is_rejected(self):
+        OrderStateMachine.transition(self.order, "canceled")
+        with self.assertRaises(OrderError) as ctx:
+            OrderStateMachine.transition(self.order, "paid")
+
+        self.assertEqual(ctx.exception.error_code, "invalid_transition")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "canceled")
+        self.assertEqual(OrderStatusEvent.objects.count(), 1)
+        self.assertEqual(self.paid_signals, [])
+
+    def test_cancel_releases_stock_holds(self):
+        StockReservationService.reserve_for_order(self.order)
+        OrderStateMachine.transition(self.order, "canceled", reason="cliente")
 
-# Create your tests here.
+        self.assertEqual(StockReservation.objects.get().status, "released")
+        self.assertEqual(
+            StockReservationService.available_stock([self.product.pk])[self.product.pk], 5
+        )
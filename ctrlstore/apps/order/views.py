@@ -1,12 +1,15 @@
-from decimal import Decimal
+import uuid
 
 from django.contrib import messages
+from django.db import IntegrityError
 from django.shortcuts import redirect, render, resolve_url, get_object_or_404
 from django.urls import reverse, NoReverseMatch
 
 from ctrlstore.apps.cart.utils import get_or_create_cart
+from ctrlstore.apps.common.exceptions import StockError
 from .forms import CheckoutForm
-from .models import Order, OrderItem
+from .models import Order
+from .services import CheckoutService
 
 # i18n
 from django.utils.translation import gettext as _
@@ -32,25 +35,48 @@ def _require_logged_in(request):
     return None
 
 
-def _cart_must_have_items(cart, request):
-    if cart.items.count() == 0:
+def _cart_must_have_items(snapshot, request):
+    if snapshot.is_empty:
         messages.info(request, _("Tu carrito está vacío."))
         return redirect("cart:detail")
     return None
 
 
+def _replayed_order(request):
+    """Orden ya creada con el idempotency_key del formulario enviado (o None)."""
+    key = request.POST.get("idempotency_key")
+    if not key:
+        return None
+    return Order.objects.filter(user=request.user, idempotency_key=key).first()
+
+
+def _render_checkout(request, form, cart, snapshot):
+    """Página de checkout con el resumen del snapshot (envío incluido)."""
+    context = {
+        "form": form,
+        "cart": cart,
+        "items": snapshot.lines,
+        "subtotal": snapshot.subtotal,
+        "shipping": snapshot.shipping,
+        "grand_total": snapshot.total,
+    }
+    return render(request, "order/checkout.html", context)
+
+
 def checkout(request):
     # 1) Requiere login (redirige a authx:login con ?next=/order/checkout/)
     maybe_redirect = _require_logged_in(request)
     if maybe_redirect:
         return maybe_redirect
 
-    # 2) Traer carrito y validar que tenga ítems
-    cart = get_or_create_cart(request)
-    maybe_redirect = _cart_must_have_items(cart, request)
-    if maybe_redirect:
-        return maybe_redirect
+    # Reenvío del mismo formulario (doble clic o reintento): se retorna la orden ya
+    # creada antes de mirar el carrito, que para entonces ya fue vaciado
+    if request.method == "POST":
+        replayed = _replayed_order(request)
+        if replayed:
+            return redirect("order:pay", order_id=replayed.id)
 
+    # 2) Traer carrito, congelar sus líneas (una sola consulta) y validar que tenga ítems
     # 3) Prefill con datos del usuario (correo visible y editable solo si tú quieres)
     initial = {
         "email": getattr(request.user, "email", "") or "",
@@ -58,62 +84,51 @@ def checkout(request):
         "country": "Colombia",
     }
 
-    shipping = Decimal("15.00")  # ajusta tu lógica de envío si aplica
-    
+    cart = get_or_create_cart(request)
+    snapshot = CheckoutService.snapshot(cart, country=initial["country"])
+    maybe_redirect = _cart_must_have_items(snapshot, request)
+    if maybe_redirect:
+        return maybe_redirect
+
     if request.method == "POST":
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            # 4) Calcular totales
-            subtotal = sum(i.subtotal for i in cart.items.select_related("product"))
-            total = subtotal + shipping
-
-            # 5) Crear Order + OrderItems
-            order = Order.objects.create(
-                user=request.user,
-                email=form.cleaned_data["email"],
-                full_name=form.cleaned_data["full_name"],
-                phone=form.cleaned_data.get("phone", ""),
-                address_line1=form.cleaned_data["address_line1"],
-                address_line2=form.cleaned_data.get("address_line2", ""),
-                city=form.cleaned_data["city"],
-                state=form.cleaned_data.get("state", ""),
-                postal_code=form.cleaned_data.get("postal_code", ""),
-                country=form.cleaned_data.get("country", "Colombia"),
-                subtotal_amount=subtotal,
-                shipping_amount=shipping,
-                total_amount=total,
-                status="pending",
+            # 4) Cotizar el envío al destino del formulario (tabla en memoria, sin consultas)
+            data = form.cleaned_data
+            snapshot = CheckoutService.with_destination(
+                snapshot, city=data["city"], state=data.get("state", ""), country=data.get("country", "")
             )
 
-            OrderItem.objects.bulk_create([
-                OrderItem(
-                    order=order,
-                    product=ci.product,
-                    quantity=ci.quantity,
-                    unit_price=ci.unit_price,
-                    line_total=ci.unit_price * ci.quantity,
+            # El GET solo conoce el país: si el envío al destino real cambia el total, se
+            # vuelve a mostrar el resumen con el nuevo total antes de cobrar
+            if data.get("quoted_shipping") != snapshot.shipping:
+                form = CheckoutForm({**request.POST.dict(), "quoted_shipping": snapshot.shipping})
+                messages.warning(
+                    request, _("El costo de envío cambió para tu dirección. Revisa el total y confirma de nuevo.")
                 )
-                for ci in cart.items.select_related("product")
-            ])
-
-            # (Opcional) Vaciar carrito
-            cart.items.all().delete()
+                return _render_checkout(request, form, cart, snapshot)
+
+            # 5) Crear Order + OrderItems desde el snapshot, reservar stock y vaciar el carrito
+            try:
+                order = CheckoutService.place_order(request, snapshot, form.cleaned_data)
+            except StockError:
+                messages.error(request, _("No hay stock suficiente para algunos productos de tu carrito."))
+                return redirect("cart:detail")
+            except IntegrityError:
+                # Otra petición con el mismo token ganó la carrera: se retorna su orden
+                replayed = _replayed_order(request)
+                if replayed is None:
+                    raise
+                return redirect("order:pay", order_id=replayed.id)
 
             messages.success(request, _("Orden creada correctamente. Continúa con el pago."))
             return redirect("order:pay", order_id=order.id)
     else:
-        form = CheckoutForm(initial=initial)
+        form = CheckoutForm(
+            initial={**initial, "idempotency_key": uuid.uuid4().hex, "quoted_shipping": snapshot.shipping}
+        )
 
-    items = cart.items.select_related("product")
-    context = {
-        "form": form,
-        "cart": cart,
-        "items": items,
-        "subtotal": cart.total,
-        "shipping": Decimal("15.00"),
-        "grand_total": cart.total + shipping,  # suma shipping si lo aplicas
-    }
-    return render(request, "order/checkout.html", context)
+    return _render_checkout(request, form, cart, snapshot)
 
 
 def pay(request, order_id):
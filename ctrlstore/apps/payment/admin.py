@@ -1,3 +1,17 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import PaymentEvent
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = (
+        "event_id", "event_type", "payment_ref", "received_at", "processed_at", "result", "attempts"
+    )
+    list_filter = ("event_type", "result")
+    search_fields = ("event_id",)
+    readonly_fields = [f.name for f in PaymentEvent._meta.fields]
+
+    def has_change_permission(self, request, obj=None):
+        # Solo inserción: los eventos no se editan
+        return False
@@ -0,0 +1,215 @@
+"""
+Validación de tarjetas por lotes.
+
+Versión vectorizada de ``luhn_check``, ``validate_card_number``, ``detect_brand`` y
+``validate_expiry`` para screening offline de millones de números (tokens importados,
+reglas de fraude). Retorna un resultado por fila con los mismos mensajes que las
+funciones escalares, sin lanzar excepciones.
+
+Si NumPy está instalado, Luhn y expiración se calculan sobre matrices de dígitos
+agrupadas por longitud; si no, se usa una implementación en Python puro con tablas
+precalculadas. Las marcas se detectan con un trie de prefijos compilado una sola vez.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Sequence
+
+try:  # Dependencia opcional
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+from .services import luhn_check
+
+# Mensajes idénticos a los de services.validate_card_number / validate_expiry
+ERR_DIGITS = "El número de tarjeta debe contener solo dígitos."
+ERR_LENGTH = "El número de tarjeta debe tener entre 13 y 19 dígitos."
+ERR_LUHN = "Número de tarjeta inválido (Luhn)."
+ERR_YEAR = "Año de expiración inválido."
+ERR_MONTH = "Mes de expiración inválido."
+ERR_EXPIRED = "La tarjeta está expirada."
+
+# Dígito duplicado según Luhn (2d, restando 9 si pasa de 9)
+_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
+
+
+def _brand_prefixes() -> dict[str, tuple[str, int]]:
+    """
+    Prefijos equivalentes a las reglas de ``detect_brand``.
+
+    Cada prefijo lleva la marca y la longitud mínima del número para aplicarla.
+    """
+    prefixes = {"4": "visa", "34": "amex", "37": "amex", "6011": "discover", "65": "discover"}
+    prefixes.update({p: "mastercard" for p in ("51", "52", "53", "54", "55")})
+    entries = {prefix: (brand, len(prefix)) for prefix, brand in prefixes.items()}
+    # Rango 2221-2720 expresado como prefijos; detect_brand solo lo mira con 4 dígitos o más
+    mastercard_2 = [str(n) for n in range(2221, 2230)]
+    mastercard_2 += [str(n) for n in range(223, 230)]
+    mastercard_2 += [str(n) for n in range(23, 27)]
+    mastercard_2 += ["270", "271", "2720"]
+    entries.update({p: ("mastercard", 4) for p in mastercard_2})
+    return entries
+
+
+class BrandTrie:
+    """Trie de prefijos -> marca; gana el prefijo más largo que cumpla su longitud mínima."""
+
+    __slots__ = ("_root",)
+
+    def __init__(self, prefixes: dict[str, tuple[str, int]]):
+        self._root: dict = {}
+        for prefix, entry in prefixes.items():
+            node = self._root
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node[None] = entry
+
+    def lookup(self, number: str, default: str = "card") -> str:
+        node = self._root
+        found = default
+        for ch in number:
+            node = node.get(ch)
+            if node is None:
+                break
+            entry = node.get(None)
+            if entry is not None and len(number) >= entry[1]:
+                found = entry[0]
+        return found
+
+
+BRAND_TRIE = BrandTrie(_brand_prefixes())
+
+
+@dataclass(frozen=True)
+class CardCheck:
+    """Resultado de validar un número: ``error`` es None si es válido."""
+
+    brand: str
+    error: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+
+def detect_brands(numbers: Sequence[str]) -> list[str]:
+    lookup = BRAND_TRIE.lookup
+    return [lookup(n) for n in numbers]
+
+
+def _luhn_python(numbers: Sequence[str]) -> list[bool]:
+    out = []
+    for number in numbers:
+        parity = len(number) % 2
+        total = 0
+        for i, ch in enumerate(number):
+            d = ord(ch) - 48
+            total += _DOUBLED[d] if i % 2 == parity else d
+        out.append(total % 10 == 0)
+    return out
+
+
+def _luhn_numpy(numbers: Sequence[str]) -> list[bool]:
+    result = np.zeros(len(numbers), dtype=bool)
+    doubled = np.array(_DOUBLED, dtype=np.uint8)
+    by_length: dict[int, list[int]] = {}
+    for i, number in enumerate(numbers):
+        by_length.setdefault(len(number), []).append(i)
+
+    for length, rows in by_length.items():
+        raw = "".join(numbers[i] for i in rows).encode("ascii")
+        digits = np.frombuffer(raw, dtype=np.uint8).reshape(len(rows), length) - 48
+        # Mismas posiciones que luhn_check: i % 2 == len % 2
+        cols = np.arange(length) % 2 == length % 2
+        digits = digits.copy()
+        digits[:, cols] = doubled[digits[:, cols]]
+        result[rows] = digits.sum(axis=1, dtype=np.int64) % 10 == 0
+    return result.tolist()
+
+
+def luhn_batch(numbers: Sequence[str]) -> list[bool]:
+    """Luhn de números compuestos solo por dígitos ASCII."""
+    if np is not None and len(numbers) > 0:
+        return _luhn_numpy(numbers)
+    return _luhn_python(numbers)
+
+
+def validate_card_numbers(numbers: Sequence[str]) -> list[CardCheck]:
+    """
+    Valida un lote de números de tarjeta.
+
+    Args:
+        numbers: Números sin espacios (como los deja ``CardPaymentForm``)
+
+    Returns:
+        Un ``CardCheck`` por número, en el mismo orden
+    """
+    brands = detect_brands(numbers)
+    errors: list[Optional[str]] = [None] * len(numbers)
+
+    candidates: list[int] = []
+    for i, number in enumerate(numbers):
+        if not number.isdigit():
+            errors[i] = ERR_DIGITS
+        elif not (13 <= len(number) <= 19):
+            errors[i] = ERR_LENGTH
+        elif not number.isascii():
+            # Dígitos Unicode (raros): se delega en la función escalar
+            try:
+                passed = luhn_check(number)
+            except ValueError:
+                passed = False
+            if not passed:
+                errors[i] = ERR_LUHN
+        else:
+            candidates.append(i)
+
+    ok = luhn_batch([numbers[i] for i in candidates])
+    for i, passed in zip(candidates, ok):
+        if not passed:
+            errors[i] = ERR_LUHN
+    return [CardCheck(brand, error) for brand, error in zip(brands, errors)]
+
+
+def validate_expiries(
+    months: Sequence[int],
+    years: Sequence[int],
+    now: Optional[datetime] = None,
+) -> list[Optional[str]]:
+    """
+    Valida fechas de expiración (año YY o YYYY) con las reglas de ``validate_expiry``.
+
+    Returns:
+        Por fila, None si es válida o el mensaje de error
+    """
+    if len(months) != len(years):
+        raise ValueError("months y years deben tener la misma longitud")
+    now = now or datetime.utcnow()
+    current = now.year * 12 + now.month
+
+    if np is not None and len(months) > 0:
+        month = np.asarray(months, dtype=np.int64)
+        year = np.asarray(years, dtype=np.int64)
+        year = np.where(year < 100, year + 2000, year)
+        bad_year = (year < 2000) | (year > 2100)
+        bad_month = (month < 1) | (month > 12)
+        expired = year * 12 + month < current
+        codes = np.select([bad_year, bad_month, expired], [1, 2, 3], default=0)
+        messages = (None, ERR_YEAR, ERR_MONTH, ERR_EXPIRED)
+        return [messages[c] for c in codes.tolist()]
+
+    out: list[Optional[str]] = []
+    for month, year in zip(months, years):
+        if year < 100:
+            year += 2000
+        if not (2000 <= year <= 2100):
+            out.append(ERR_YEAR)
+        elif not (1 <= month <= 12):
+            out.append(ERR_MONTH)
+        elif year * 12 + month < current:
+            out.append(ERR_EXPIRED)
+        else:
+            out.append(None)
+    return out
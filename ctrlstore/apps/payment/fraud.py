@@ -0,0 +1,291 @@
+"""
+Puntaje de fraude previo a la autorización.
+
+Las reglas se configuran en ``settings.PAYMENT_FRAUD["RULES"]`` como rutas a clases con
+sus opciones; cada regla que se activa suma puntos. Con ``REVIEW_SCORE`` el pago sigue
+pero queda marcado para revisión; con ``BLOCK_SCORE`` se rechaza sin llamar a la pasarela.
+
+Los contadores de velocidad (intentos por usuario, tarjeta e IP) viven en el caché como
+ventanas deslizantes divididas en ``WINDOW_BUCKETS`` buckets: evaluar todas las reglas es
+una sola lectura ``get_many`` y registrar el intento un ``incr`` por regla, sin
+consultas a la base de datos. El promedio de compra del usuario también se guarda en
+el caché y solo se calcula en la BD cuando no está.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS: dict[str, Any] = {
+    "ENABLED": True,
+    "REVIEW_SCORE": 50,
+    "BLOCK_SCORE": 80,
+    "WINDOW_BUCKETS": 10,
+    "RULES": [],
+}
+
+# Promedio de compras capturadas por usuario: (cantidad, total)
+AVERAGE_TTL = 60 * 60 * 24
+
+
+@dataclass(frozen=True)
+class FraudContext:
+    """Datos del intento de pago que evalúan las reglas."""
+
+    user_id: int
+    amount: Decimal
+    card: str  # marca:last4
+    ip: str = ""
+
+    def dimension(self, name: str) -> str:
+        return {"user": str(self.user_id), "card": self.card, "ip": self.ip}[name]
+
+
+@dataclass
+class FraudAssessment:
+    score: int = 0
+    reasons: list[str] = field(default_factory=list)
+    decision: str = "allow"  # allow | review | block
+
+
+def _config() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, "PAYMENT_FRAUD", {})}
+
+
+def _bucket_key(dimension: str, size: int, value: str, bucket: int) -> str:
+    return f"fraud:v:{dimension}:{size}:{value}:{bucket}"
+
+
+def _average_keys(user_id: int) -> tuple[str, str]:
+    """Llaves de (cantidad, total en centavos) de las compras capturadas del usuario."""
+    return f"fraud:avg:{user_id}:n", f"fraud:avg:{user_id}:cents"
+
+
+class FraudRule(ABC):
+    """Regla de fraude: declara las llaves de caché que necesita y se evalúa con ellas."""
+
+    score = 0
+
+    def cache_keys(self, ctx: FraudContext, now: float) -> list[str]:
+        return []
+
+    @abstractmethod
+    def evaluate(self, ctx: FraudContext, values: dict[str, Any], now: float) -> Optional[str]:
+        """Retorna el motivo si la regla se activa, None si no."""
+
+
+class VelocityRule(FraudRule):
+    """
+    Más de ``limit`` intentos en ``window`` segundos para una dimensión.
+
+    Args:
+        dimension: ``user``, ``card`` (marca + last4) o ``ip``
+        window: Ventana deslizante en segundos
+        limit: Intentos permitidos en la ventana (sin contar el actual)
+        score: Puntos que suma
+    """
+
+    buckets = DEFAULTS["WINDOW_BUCKETS"]
+
+    def __init__(self, dimension: str, window: int, limit: int, score: int):
+        self.dimension = dimension
+        self.window = window
+        self.limit = limit
+        self.score = score
+
+    @property
+    def bucket_size(self) -> int:
+        return max(math.ceil(self.window / self.buckets), 1)
+
+    def bucket_key(self, ctx: FraudContext, now: float) -> Optional[str]:
+        """Bucket actual, donde se cuenta el intento."""
+        value = ctx.dimension(self.dimension)
+        if not value:
+            return None
+        return _bucket_key(self.dimension, self.bucket_size, value, int(now // self.bucket_size))
+
+    def cache_keys(self, ctx, now):
+        value = ctx.dimension(self.dimension)
+        if not value:
+            return []
+        current = int(now // self.bucket_size)
+        return [
+            _bucket_key(self.dimension, self.bucket_size, value, b)
+            for b in range(current - self.buckets + 1, current + 1)
+        ]
+
+    def evaluate(self, ctx, values, now):
+        attempts = sum(values.get(k, 0) for k in self.cache_keys(ctx, now))
+        if attempts >= self.limit:
+            return f"velocity:{self.dimension}:{attempts}/{self.window}s"
+        return None
+
+
+class AmountOverAverageRule(FraudRule):
+    """
+    Monto mayor a ``multiplier`` veces el promedio de compras capturadas del usuario.
+
+    Args:
+        multiplier: Veces el promedio a partir de las que se activa
+        min_history: Compras previas necesarias para confiar en el promedio
+        score: Puntos que suma
+    """
+
+    def __init__(self, multiplier: float, min_history: int, score: int):
+        self.multiplier = Decimal(str(multiplier))
+        self.min_history = min_history
+        self.score = score
+
+    def cache_keys(self, ctx, now):
+        return list(_average_keys(ctx.user_id))
+
+    def evaluate(self, ctx, values, now):
+        count_key, cents_key = _average_keys(ctx.user_id)
+        if count_key in values and cents_key in values:
+            count, cents = values[count_key], values[cents_key]
+        else:
+            count, cents = load_user_average(ctx.user_id)
+        if count < self.min_history:
+            return None
+        average = Decimal(cents) / 100 / count
+        if ctx.amount > average * self.multiplier:
+            return f"amount_over_average:{ctx.amount}>{self.multiplier}x{average.quantize(Decimal('0.01'))}"
+        return None
+
+
+class CardBrandRule(FraudRule):
+    """
+    Marcas de tarjeta de mayor riesgo.
+
+    Args:
+        brands: Marcas que suman puntos (``visa``, ``amex``, ``card``...)
+        score: Puntos que suma
+    """
+
+    def __init__(self, brands: list[str], score: int):
+        self.brands = set(brands)
+        self.score = score
+
+    def evaluate(self, ctx, values, now):
+        brand = ctx.card.split(":", 1)[0]
+        return f"brand:{brand}" if brand in self.brands else None
+
+
+def _cents(amount) -> int:
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def load_user_average(user_id: int) -> tuple[int, int]:
+    """Calcula (cantidad, total en centavos) de las compras capturadas del usuario y lo cachea."""
+    from django.db.models import Count, Sum
+
+    from .models import Payment
+
+    agg = Payment.objects.filter(order__user_id=user_id, status="captured").aggregate(
+        n=Count("id"), total=Sum("amount")
+    )
+    count, cents = agg["n"] or 0, _cents(agg["total"] or 0)
+    count_key, cents_key = _average_keys(user_id)
+    cache.set_many({count_key: count, cents_key: cents}, AVERAGE_TTL)
+    return count, cents
+
+
+def record_capture(user_id: int, amount: Decimal) -> None:
+    """
+    Suma una compra capturada al promedio cacheado del usuario (si está cargado).
+
+    Cantidad y total son llaves separadas que se actualizan con ``incr`` (atómico en el
+    caché), así las capturas concurrentes no se pisan.
+    """
+    count_key, cents_key = _average_keys(user_id)
+    try:
+        cache.incr(count_key)
+        cache.incr(cents_key, _cents(amount))
+    except ValueError:
+        # Promedio no cargado (o vencido): se recalcula completo en la próxima evaluación
+        cache.delete_many([count_key, cents_key])
+
+
+class FraudEngine:
+    """Evalúa las reglas configuradas y registra el intento en las ventanas de velocidad."""
+
+    def __init__(self, config: dict[str, Any]):
+        self.enabled = config["ENABLED"]
+        self.review_score = config["REVIEW_SCORE"]
+        self.block_score = config["BLOCK_SCORE"]
+        self.rules: list[FraudRule] = [
+            import_string(rule["RULE"])(**rule.get("OPTIONS", {})) for rule in config["RULES"]
+        ]
+        for rule in self.rules:
+            if isinstance(rule, VelocityRule):
+                rule.buckets = config["WINDOW_BUCKETS"]
+
+    def assess(self, ctx: FraudContext) -> FraudAssessment:
+        """
+        Puntúa un intento de pago y lo cuenta en las ventanas de velocidad.
+
+        Returns:
+            Puntaje, motivos y decisión (allow, review o block)
+        """
+        assessment = FraudAssessment()
+        if not self.enabled:
+            return assessment
+
+        now = time.time()
+        keys = [k for rule in self.rules for k in rule.cache_keys(ctx, now)]
+        values = cache.get_many(keys) if keys else {}
+
+        for rule in self.rules:
+            reason = rule.evaluate(ctx, values, now)
+            if reason:
+                assessment.score += rule.score
+                assessment.reasons.append(reason)
+
+        if assessment.score >= self.block_score:
+            assessment.decision = "block"
+        elif assessment.score >= self.review_score:
+            assessment.decision = "review"
+
+        self.record_attempt(ctx, now)
+        return assessment
+
+    def record_attempt(self, ctx: FraudContext, now: Optional[float] = None) -> None:
+        now = now or time.time()
+        for rule in self.rules:
+            if not isinstance(rule, VelocityRule):
+                continue
+            key = rule.bucket_key(ctx, now)
+            if key is None:
+                continue
+            # add() crea el bucket si no existe; si ya existe, incr() es atómico
+            timeout = rule.window + rule.bucket_size
+            if not cache.add(key, 1, timeout):
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.set(key, 1, timeout)
+
+
+_engine: Optional[FraudEngine] = None
+_engine_config: Optional[dict] = None
+
+
+def get_fraud_engine() -> FraudEngine:
+    """Motor del proceso; se reconstruye solo si cambia ``settings.PAYMENT_FRAUD``."""
+    global _engine, _engine_config
+    config = getattr(settings, "PAYMENT_FRAUD", None)
+    if _engine is None or config is not _engine_config:
+        _engine = FraudEngine(_config())
+        _engine_config = config
+    return _engine
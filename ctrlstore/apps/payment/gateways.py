@@ -0,0 +1,138 @@
+"""
+Pasarelas de pago.
+
+La pasarela se elige con ``settings.PAYMENT_GATEWAY``:
+
+- ``ENGINE``: ruta a una subclase de ``PaymentGateway``.
+- ``OPTIONS``: argumentos del constructor.
+- ``ASYNC``: si es True la autorización corre en un pool de hilos y la petición del
+  cliente retorna de inmediato; la página de estado del pago consulta el resultado.
+
+``SimulatorGateway`` reproduce las reglas de ``simulate_authorize`` (0005, 3333, 6666)
+con latencia y tasa de fallos configurables, para pruebas de carga sin servicios
+externos.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from .services import AuthResult, capture_payment, simulate_authorize
+
+logger = logging.getLogger(__name__)
+
+# Pool compartido para autorizaciones en segundo plano
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=getattr(settings, "PAYMENT_GATEWAY_WORKERS", 8),
+    thread_name_prefix="payment-gateway",
+)
+
+
+class PaymentGateway(ABC):
+    """Interfaz de una pasarela: autoriza un cargo y retorna un ``AuthResult``."""
+
+    @abstractmethod
+    def authorize(self, number: str, amount: float | int, currency: str = "COP") -> AuthResult:
+        """Autoriza el cargo; no debe lanzar excepciones por rechazos de la pasarela."""
+
+
+class SimulatorGateway(PaymentGateway):
+    """
+    Pasarela local simulada.
+
+    Args:
+        latency: Segundos de espera promedio por autorización
+        jitter: Variación máxima (+/-) de la latencia en segundos
+        failure_rate: Probabilidad (0-1) de que el procesador no responda
+        seed: Semilla para resultados reproducibles
+    """
+
+    def __init__(self, latency: float = 0, jitter: float = 0, failure_rate: float = 0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def authorize(self, number: str, amount: float | int, currency: str = "COP") -> AuthResult:
+        with self._rng_lock:
+            delay = max(self.latency + self._rng.uniform(-self.jitter, self.jitter), 0)
+            fails = self._rng.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if fails:
+            return AuthResult(False, error_code="gateway_error", msg="El procesador de pagos no respondió.")
+        return simulate_authorize(number, amount, currency=currency)
+
+
+_gateway: PaymentGateway | None = None
+_gateway_lock = threading.Lock()
+
+
+def _config() -> dict:
+    return {
+        "ENGINE": f"{__name__}.SimulatorGateway",
+        "OPTIONS": {},
+        "ASYNC": False,
+        **getattr(settings, "PAYMENT_GATEWAY", {}),
+    }
+
+
+def get_gateway() -> PaymentGateway:
+    """Instancia (única por proceso) de la pasarela configurada."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                config = _config()
+                _gateway = import_string(config["ENGINE"])(**config["OPTIONS"])
+    return _gateway
+
+
+def is_async() -> bool:
+    return bool(_config()["ASYNC"])
+
+
+def _authorize_and_capture(payment_id: int, number: str, amount, currency: str):
+    try:
+        result = get_gateway().authorize(number, float(amount), currency=currency)
+    except Exception as e:
+        logger.error(f"Error de la pasarela al autorizar el pago {payment_id}: {e}")
+        result = AuthResult(False, error_code="gateway_error", msg="El procesador de pagos no respondió.")
+    return capture_payment(payment_id, result)
+
+
+def _authorize_in_background(payment_id: int, number: str, amount, currency: str) -> None:
+    try:
+        _authorize_and_capture(payment_id, number, amount, currency)
+    except Exception as e:
+        logger.error(f"Error inesperado al capturar el pago {payment_id}: {e}")
+    finally:
+        # Los hilos del pool no pasan por el ciclo request/response
+        close_old_connections()
+
+
+def _spawn(target, *args) -> None:
+    _EXECUTOR.submit(target, *args)
+
+
+def authorize_payment(payment, number: str):
+    """
+    Autoriza y captura un pago ``initiated``.
+
+    En modo asíncrono la autorización se encola en el pool y el número de tarjeta solo
+    vive en memoria hasta entonces (nunca se guarda); retorna None y el resultado se
+    consulta en la página de estado. En modo síncrono retorna el pago ya resuelto.
+    """
+    if is_async():
+        _spawn(_authorize_in_background, payment.id, number, payment.amount, payment.currency)
+        return None
+    return _authorize_and_capture(payment.id, number, payment.amount, payment.currency)
@@ -0,0 +1,208 @@
+"""
+Facturas PDF pre-renderizadas.
+
+La factura de un pago capturado no cambia, así que el PDF se genera una vez (al capturar
+o en la primera descarga) y se guarda en ``MEDIA_ROOT/invoices/<payment_id>-<hash>.pdf``.
+``hash`` es el SHA-256 del HTML de la factura: si cambia la plantilla, los datos o el
+idioma, cambia el archivo. Servir una factura ya generada solo renderiza el HTML (rápido)
+para obtener su hash; xhtml2pdf no se ejecuta.
+
+Entrega configurable con ``settings.INVOICE_SENDFILE``:
+
+- ``""`` (por defecto): Django envía el archivo.
+- ``"x-sendfile"``: cabecera ``X-Sendfile`` con la ruta absoluta (Apache/lighttpd).
+- ``"x-accel-redirect"``: cabecera ``X-Accel-Redirect`` con ``INVOICE_ACCEL_PREFIX``
+  más el nombre del archivo (location ``internal`` de Nginx).
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import FileResponse, HttpRequest, HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+INVOICE_TEMPLATE = "payment/invoice.html"
+
+# Datos del emisor (ajusta a tu negocio; valores de dato, no traducibles)
+COMPANY = {
+    "name": "Ctrl+Store S.A.S.",
+    "tax_id": "NIT 900.000.000-1",
+    "address": "Calle 123 #45-67, Medellín, Colombia",
+    "email": "facturacion@ctrlstore.com",
+    "phone": "+57 300 000 0000",
+}
+
+# Pool pequeño para generar facturas fuera de la petición que captura el pago
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="invoice-pdf")
+
+
+def invoice_dir() -> Path:
+    return Path(settings.MEDIA_ROOT) / "invoices"
+
+
+def invoice_number(payment) -> str:
+    """Número de la factura emitida (billing) o, para pagos anteriores, el derivado del pago."""
+    invoice = getattr(payment, "invoice", None)
+    if invoice is not None:
+        return invoice.code
+    created_local = timezone.localtime(payment.created_at)
+    return f"INV-{payment.id}-{created_local.strftime('%Y%m%d')}"
+
+
+def invoice_context(payment, items=None) -> dict[str, Any]:
+    """Contexto de la plantilla de factura (``items`` se consulta si no se pasa)."""
+    order = payment.order
+    if items is None:
+        items = order.items.select_related("product")
+    return {
+        "invoice_number": invoice_number(payment),
+        "created_at": timezone.localtime(payment.created_at),
+        "payment": payment,
+        "order": order,
+        "items": items,
+        "company": COMPANY,
+    }
+
+
+def render_invoice_html(payment, items=None) -> str:
+    return render_to_string(INVOICE_TEMPLATE, invoice_context(payment, items))
+
+
+def html_to_pdf(html: str) -> Optional[bytes]:
+    """Convierte HTML a PDF con xhtml2pdf (None si la dependencia no está o falla)."""
+    try:
+        from xhtml2pdf import pisa  # type: ignore
+    except Exception:
+        return None
+    result = io.BytesIO()
+    pdf = pisa.CreatePDF(io.BytesIO(html.encode("utf-8")), dest=result, encoding="utf-8")
+    if pdf.err:
+        return None
+    return result.getvalue()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Escribe en un temporal y lo renombra: nunca se sirve un PDF a medio escribir."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def invoice_path(payment, html: str) -> tuple[Path, str]:
+    """Ruta del PDF y hash de contenido que corresponden al HTML de una factura."""
+    digest = hashlib.sha256(html.encode("utf-8")).hexdigest()[:32]
+    return invoice_dir() / f"{payment.id}-{digest}.pdf", digest
+
+
+def write_invoice_pdf(path: Path, html: str) -> bool:
+    """
+    Convierte y guarda un PDF. No usa la base de datos ni settings, así que puede
+    ejecutarse en procesos del pool de ``generate_invoices``.
+    """
+    data = html_to_pdf(html)
+    if data is None:
+        return False
+    _write_atomic(Path(path), data)
+    return True
+
+
+def prune_invoice_versions(payment_id: int, keep: Path) -> None:
+    """Borra las versiones del PDF de un pago distintas de ``keep``."""
+    for old in invoice_dir().glob(f"{payment_id}-*.pdf"):
+        if old != keep:
+            old.unlink(missing_ok=True)
+
+
+def ensure_invoice_pdf(payment, items=None, force: bool = False, prune: bool = False) -> Optional[tuple[Path, str]]:
+    """
+    Retorna el PDF de la factura de un pago capturado, generándolo si no existe.
+
+    Args:
+        payment: Pago capturado (con ``order`` cargada o consultable)
+        items: Items de la orden ya cargados (opcional)
+        force: Regenera aunque el archivo exista
+        prune: Borra las versiones anteriores de la factura de este pago
+
+    Returns:
+        Tupla (ruta del PDF, hash de contenido) o None si no se pudo generar
+    """
+    html = render_invoice_html(payment, items)
+    path, digest = invoice_path(payment, html)
+
+    if force or not path.exists():
+        if not write_invoice_pdf(path, html):
+            logger.error(f"No se pudo generar el PDF de la factura del pago {payment.id}")
+            return None
+        logger.info(f"Factura del pago {payment.id} generada")
+
+    if prune:
+        prune_invoice_versions(payment.id, path)
+    return path, digest
+
+
+def _prerender(payment_id: int) -> None:
+    from .models import Payment
+
+    try:
+        payment = Payment.objects.select_related("order", "invoice").get(
+            pk=payment_id, status="captured"
+        )
+        ensure_invoice_pdf(payment)
+    except Exception as e:
+        logger.error(f"Error pre-renderizando la factura del pago {payment_id}: {e}")
+    finally:
+        close_old_connections()
+
+
+def _spawn(target, *args) -> None:
+    _EXECUTOR.submit(target, *args)
+
+
+def schedule_invoice(payment_id: int) -> None:
+    """Genera la factura en segundo plano (``INVOICE_PRERENDER``, activo por defecto)."""
+    if getattr(settings, "INVOICE_PRERENDER", True):
+        _spawn(_prerender, payment_id)
+
+
+def serve_invoice(request: HttpRequest, path: Path, digest: str, filename: str) -> HttpResponse:
+    """Respuesta de descarga con ETag, respetando If-None-Match y el modo de sendfile."""
+    etag = f'"{digest}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        response: HttpResponse = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    mode = getattr(settings, "INVOICE_SENDFILE", "").lower()
+    if mode == "x-sendfile":
+        response = HttpResponse(content_type="application/pdf")
+        response["X-Sendfile"] = str(path)
+    elif mode == "x-accel-redirect":
+        prefix = getattr(settings, "INVOICE_ACCEL_PREFIX", "/protected/invoices/")
+        response = HttpResponse(content_type="application/pdf")
+        response["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{path.name}"
+    else:
+        # FileResponse agrega Content-Length a partir del archivo
+        response = FileResponse(path.open("rb"), content_type="application/pdf")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=86400"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from ctrlstore.apps.payment.services import expire_stale_payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca como fallidos (gateway_timeout) los pagos que siguen en autorización "
+        "después de PAYMENT_AUTHORIZATION_TIMEOUT"
+    )
+
+    def handle(self, *args, **options):
+        expired = expire_stale_payments()
+        self.stdout.write(self.style.SUCCESS(f"✓ {expired} pago(s) marcados como vencidos"))
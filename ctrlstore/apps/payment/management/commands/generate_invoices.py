@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from ctrlstore.apps.order.models import OrderItem
+from ctrlstore.apps.payment.invoices import (
+    invoice_number,
+    invoice_path,
+    render_invoice_html,
+    write_invoice_pdf,
+)
+from ctrlstore.apps.payment.models import Payment
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {value} (usa AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera en paralelo los PDF de factura de los pagos capturados en un rango de fechas; "
+        "omite las facturas que ya existen, así que se puede reanudar"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", required=True, help="Fecha inicial (AAAA-MM-DD)")
+        parser.add_argument("--to", dest="date_to", required=True, help="Fecha final inclusive (AAAA-MM-DD)")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Procesos de render (por defecto, uno por núcleo)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Pagos leídos por consulta (por defecto 500)",
+        )
+        parser.add_argument("--zip", dest="zip_path", help="Empaqueta las facturas del rango en este ZIP")
+
+    def handle(self, *args, **options):
+        date_from = _parse_date(options["date_from"])
+        date_to = _parse_date(options["date_to"])
+        if date_from > date_to:
+            raise CommandError("--from debe ser anterior o igual a --to")
+
+        payments = (
+            Payment.objects.filter(
+                status="captured",
+                created_at__date__gte=date_from,
+                created_at__date__lte=date_to,
+            )
+            .select_related("order", "invoice")
+            .prefetch_related(
+                Prefetch("order__items", queryset=OrderItem.objects.select_related("product"))
+            )
+            .order_by("pk")
+        )
+
+        generated = skipped = failed = 0
+        bundle: list[tuple[str, str]] = []  # (ruta, nombre dentro del ZIP)
+
+        # El proceso principal arma el HTML (barato, necesita la BD); el pool solo convierte
+        # a PDF, que es lo costoso y no toca la BD.
+        with ProcessPoolExecutor(max_workers=max(options["workers"], 1)) as pool:
+            last_pk = 0
+            while True:
+                batch = list(payments.filter(pk__gt=last_pk)[: options["batch_size"]])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                pending: list[tuple[str, str]] = []
+                for payment in batch:
+                    html = render_invoice_html(payment, payment.order.items.all())
+                    path, _ = invoice_path(payment, html)
+                    bundle.append((str(path), f"{invoice_number(payment)}.pdf"))
+                    if path.exists():
+                        skipped += 1
+                    else:
+                        pending.append((str(path), html))
+
+                if pending:
+                    paths, htmls = zip(*pending)
+                    chunksize = max(len(pending) // (options["workers"] * 4), 1)
+                    for ok in pool.map(write_invoice_pdf, paths, htmls, chunksize=chunksize):
+                        if ok:
+                            generated += 1
+                        else:
+                            failed += 1
+                self.stdout.write(f"  … {generated + skipped + failed} pago(s) revisados")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ {generated} factura(s) generadas, {skipped} ya existían")
+        )
+        if failed:
+            self.stdout.write(self.style.WARNING(f"⚠ {failed} factura(s) no se pudieron generar"))
+
+        if options["zip_path"]:
+            written = 0
+            # Los PDF ya vienen comprimidos: se guardan sin volver a comprimir
+            with zipfile.ZipFile(options["zip_path"], "w", compression=zipfile.ZIP_STORED) as zf:
+                for path, arcname in bundle:
+                    if os.path.exists(path):
+                        zf.write(path, arcname)
+                        written += 1
+            self.stdout.write(self.style.SUCCESS(f"✓ {written} factura(s) empaquetadas en {options['zip_path']}"))
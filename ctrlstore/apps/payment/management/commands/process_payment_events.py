@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from ctrlstore.apps.payment.services import process_payment_events
+
+
+class Command(BaseCommand):
+    help = "Aplica a pagos y órdenes los eventos pendientes del webhook de la pasarela"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Eventos por lote (por defecto 100)",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Sigue esperando eventos nuevos en lugar de terminar al vaciar la cola",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1,
+            help="Segundos de espera con la cola vacía en modo --loop (por defecto 1)",
+        )
+
+    def handle(self, *args, **options):
+        totals: Counter = Counter()
+        try:
+            while True:
+                counts = process_payment_events(batch_size=options["batch_size"])
+                totals.update(counts)
+                processed = sum(n for result, n in counts.items() if result != "deferred")
+                if counts and options["loop"]:
+                    self.stdout.write(f"Lote: {dict(counts)}")
+                if not processed:
+                    if not options["loop"]:
+                        break
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            pass
+
+        summary = ", ".join(f"{result}: {n}" for result, n in sorted(totals.items())) or "sin eventos"
+        self.stdout.write(self.style.SUCCESS(f"✓ Eventos procesados ({summary})"))
+        if totals.get("error"):
+            self.stdout.write(
+                self.style.WARNING(f"⚠ {totals['error']} evento(s) fallaron y se reintentarán más tarde")
+            )
+        if totals.get("deferred"):
+            self.stdout.write(
+                self.style.WARNING(f"⚠ {totals['deferred']} evento(s) en espera por pagos bloqueados")
+            )
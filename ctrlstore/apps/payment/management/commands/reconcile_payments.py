@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import csv
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from ctrlstore.apps.order.models import Order
+from ctrlstore.apps.payment.reconciliation import CHECKS, ReconciliationService
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {value} (usa AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia pagos capturados, órdenes pagadas, descuentos de stock y analytics "
+        "por particiones de fecha; reporta las diferencias y opcionalmente las repara"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="Fecha inicial (por defecto, la primera orden)")
+        parser.add_argument("--to", dest="date_to", help="Fecha final inclusive (por defecto, hoy)")
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=1,
+            help="Días por partición (por defecto 1)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Filas leídas por consulta (por defecto 1000)",
+        )
+        parser.add_argument("--repair", action="store_true", help="Repara las diferencias que lo permiten")
+        parser.add_argument("--report", dest="report_path", help="Escribe cada diferencia en este CSV")
+
+    def handle(self, *args, **options):
+        if options["date_from"]:
+            date_from = _parse_date(options["date_from"])
+        else:
+            first = Order.objects.aggregate(first=Min("created_at"))["first"]
+            if first is None:
+                self.stdout.write(self.style.SUCCESS("✓ No hay órdenes que conciliar"))
+                return
+            date_from = timezone.localdate(first)
+        date_to = _parse_date(options["date_to"]) if options["date_to"] else timezone.localdate()
+        if date_from > date_to:
+            raise CommandError("--from debe ser anterior o igual a --to")
+
+        report = open(options["report_path"], "w", newline="") if options["report_path"] else None
+        try:
+            writer = None
+            if report is not None:
+                writer = csv.writer(report)
+                writer.writerow(["check", "order_id", "payment_id", "repaired", "detail"])
+
+            def on_mismatch(m):
+                # Se escribe a medida que aparece: el reporte no se acumula en memoria
+                if writer is not None:
+                    writer.writerow([m.check, m.order_id, m.payment_id or "", int(m.repaired), m.detail])
+
+            counts = ReconciliationService.run(
+                date_from,
+                date_to,
+                days=max(options["days"], 1),
+                repair=options["repair"],
+                batch_size=max(options["batch_size"], 1),
+                on_mismatch=on_mismatch,
+            )
+        finally:
+            if report is not None:
+                report.close()
+
+        total = sum(counts[name] for name, *_ in CHECKS)
+        if not total:
+            self.stdout.write(self.style.SUCCESS(f"✓ Sin diferencias entre {date_from} y {date_to}"))
+            return
+
+        for name, _, _, fix in CHECKS:
+            if not counts[name]:
+                continue
+            line = f"  {name}: {counts[name]}"
+            if options["repair"] and fix is not None:
+                line += f" ({counts[f'{name}:repaired']} reparadas)"
+            self.stdout.write(line)
+
+        pending = total - sum(counts[f"{name}:repaired"] for name, *_ in CHECKS)
+        if pending:
+            self.stdout.write(self.style.WARNING(f"⚠ {pending} diferencia(s) sin reparar de {total}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✓ {total} diferencia(s) reparadas"))
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from ctrlstore.apps.order.models import OrderItem
+from ctrlstore.apps.payment.invoices import ensure_invoice_pdf, invoice_dir
+from ctrlstore.apps.payment.models import Payment
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera los PDF de factura de pagos capturados (p. ej. tras cambiar la plantilla) "
+        "y borra las versiones anteriores"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Incluye pagos que aún no tienen PDF (por defecto solo los ya generados)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Vuelve a generar aunque el PDF vigente ya exista",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Pagos por lote (por defecto 200)",
+        )
+
+    def handle(self, *args, **options):
+        payments = Payment.objects.filter(status="captured").select_related("order", "invoice").order_by("pk")
+        if not options["all"]:
+            generated = {
+                int(p.name.split("-", 1)[0])
+                for p in invoice_dir().glob("*-*.pdf")
+                if p.name.split("-", 1)[0].isdigit()
+            }
+            payments = payments.filter(pk__in=generated)
+
+        items = Prefetch("order__items", queryset=OrderItem.objects.select_related("product"))
+        done = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(payments.filter(pk__gt=last_pk).prefetch_related(items)[: options["batch_size"]])
+            if not batch:
+                break
+            for payment in batch:
+                result = ensure_invoice_pdf(
+                    payment, items=payment.order.items.all(), force=options["force"], prune=True
+                )
+                if result is None:
+                    failed += 1
+                else:
+                    done += 1
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {done} factura(s) al día en {invoice_dir()}"))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"⚠ {failed} factura(s) no se pudieron generar"))
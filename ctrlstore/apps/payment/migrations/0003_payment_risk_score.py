@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payment", "0002_paymentevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="risk_reasons",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="risk_score",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
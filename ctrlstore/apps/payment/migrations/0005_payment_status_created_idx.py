@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("order", "0005_orderstatusevent"),
+        ("payment", "0004_paymentevent_retries"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["status", "created_at"], name="payment_status_created_idx"),
+        ),
+    ]
@@ -32,14 +32,61 @@ class Payment(models.Model):
     error_code = models.CharField(max_length=32, blank=True)
     error_message = models.CharField(max_length=255, blank=True)
 
+    # Puntaje de fraude previo a la autorización (ver fraud.py)
+    risk_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    risk_reasons = models.JSONField(default=list, blank=True)
+
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Conciliación por rango de fechas y barrido de pagos "initiated" vencidos
+            models.Index(fields=["status", "created_at"], name="payment_status_created_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Payment #{self.pk} - {self.status}"
 
     def save(self, *args: Any, **kwargs: Any) -> None:
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class PaymentEvent(models.Model):
+    """
+    Evento crudo recibido por el webhook de la pasarela.
+
+    La tabla es de solo inserción: el webhook guarda el evento y responde de inmediato;
+    ``process_payment_events`` aplica luego las transiciones y marca ``processed_at``
+    con un UPDATE. ``event_id`` es único para descartar reintentos.
+
+    Un evento que falla queda pendiente: se cuenta en ``attempts`` y no se reintenta
+    antes de ``next_attempt_at``. ``claimed_until`` es el plazo del worker que lo tomó.
+    """
+
+    event_id = models.CharField(max_length=64, unique=True)
+    event_type = models.CharField(max_length=40)
+    # ID del Payment según la pasarela; sin FK para guardar el evento aunque no coincida
+    payment_ref = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(default=timezone.now)
+
+    processed_at = models.DateTimeField(null=True, blank=True)
+    result = models.CharField(max_length=32, blank=True)
+
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["processed_at", "id"], name="payment_event_pending_idx")]
+
+    def __str__(self) -> str:
+        return f"PaymentEvent {self.event_id} ({self.event_type})"
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        if not self._state.adding:
+            raise ValueError("PaymentEvent es de solo inserción")
+        super().save(*args, **kwargs)
@@ -0,0 +1,204 @@
+"""
+Conciliación de pagos, órdenes, stock y analytics.
+
+Cada verificación es un anti-join (``Exists``/``~Exists``) que la base de datos resuelve
+por partición de fechas; las filas se recorren por keyset en lotes de tamaño fijo, así
+la memoria no crece con el número de filas y no queda un cursor abierto mientras se
+reparan las diferencias.
+
+Verificaciones (en este orden, para que una reparación alimente la siguiente):
+
+- ``captured_unpaid``: pago capturado cuya orden no está pagada. Repara pasando la orden
+  a ``paid`` con ``OrderStateMachine`` (que a su vez la contabiliza en analytics).
+- ``paid_without_capture``: orden pagada sin ningún pago capturado. Solo se reporta.
+- ``stock_not_committed``: orden pagada con reservas de stock sin convertir (el
+  descuento de stock no ocurrió). Repara descontando y convirtiendo las reservas.
+- ``missing_analytics``: orden pagada sin ``ProcessedOrder``. Repara contabilizándola.
+- ``analytics_unpaid``: ``ProcessedOrder`` de una orden no pagada. Solo se reporta.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Iterator, Optional
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, QuerySet
+from django.utils import timezone
+
+from ctrlstore.apps.analytics.models import ProcessedOrder
+from ctrlstore.apps.analytics.services import record_order_paid
+from ctrlstore.apps.catalog.services import decrement_stock
+from ctrlstore.apps.common.exceptions import OrderError, StockError
+from ctrlstore.apps.order.models import Order, StockReservation
+from ctrlstore.apps.order.services import OrderStateMachine
+
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+PENDING_HOLDS = ("active", "expired", "released")
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    check: str
+    order_id: int
+    payment_id: Optional[int] = None
+    repaired: bool = False
+    detail: str = ""
+
+
+def _captured_unpaid(start: datetime, end: datetime) -> QuerySet:
+    return Payment.objects.filter(
+        status="captured", created_at__gte=start, created_at__lt=end
+    ).exclude(order__status="paid")
+
+
+def _paid_without_capture(start: datetime, end: datetime) -> QuerySet:
+    captured = Payment.objects.filter(order=OuterRef("pk"), status="captured")
+    return Order.objects.filter(
+        status="paid", created_at__gte=start, created_at__lt=end
+    ).filter(~Exists(captured))
+
+
+def _stock_not_committed(start: datetime, end: datetime) -> QuerySet:
+    holds = StockReservation.objects.filter(order=OuterRef("pk"), status__in=PENDING_HOLDS)
+    return Order.objects.filter(
+        status="paid", created_at__gte=start, created_at__lt=end
+    ).filter(Exists(holds))
+
+
+def _missing_analytics(start: datetime, end: datetime) -> QuerySet:
+    processed = ProcessedOrder.objects.filter(order=OuterRef("pk"))
+    return Order.objects.filter(
+        status="paid", created_at__gte=start, created_at__lt=end
+    ).filter(~Exists(processed))
+
+
+# Estados distintos de "paid" como IN (no negación) para usar el índice (status, created_at)
+UNPAID_STATUSES = [code for code, _ in Order.STATUS_CHOICES if code != "paid"]
+
+
+def _analytics_unpaid(start: datetime, end: datetime) -> QuerySet:
+    processed = ProcessedOrder.objects.filter(order=OuterRef("pk"))
+    return Order.objects.filter(
+        status__in=UNPAID_STATUSES, created_at__gte=start, created_at__lt=end
+    ).filter(Exists(processed))
+
+
+def _repair_captured_unpaid(payment_id: int, order_id: int) -> str:
+    order = Order.objects.get(pk=order_id)
+    try:
+        OrderStateMachine.transition(order, "paid", reason=f"reconcile:payment:{payment_id}")
+    except OrderError as e:
+        return e.message
+    return ""
+
+
+def _repair_stock(payment_id: Optional[int], order_id: int) -> str:
+    with transaction.atomic():
+        holds = list(
+            StockReservation.objects.select_for_update()
+            .filter(order_id=order_id, status__in=PENDING_HOLDS)
+            .values_list("pk", "product_id", "quantity")
+        )
+        quantities: dict[int, int] = {}
+        for _, product_id, quantity in holds:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        try:
+            decrement_stock(quantities)
+        except StockError as e:
+            return e.message
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in holds]).update(status="converted")
+    return ""
+
+
+def _repair_analytics(payment_id: Optional[int], order_id: int) -> str:
+    record_order_paid(order_id)
+    return ""
+
+
+# (nombre, consulta por partición, columnas (order_id, payment_id), reparación)
+CHECKS: list[tuple[str, Callable, tuple[str, Optional[str]], Optional[Callable]]] = [
+    ("captured_unpaid", _captured_unpaid, ("order_id", "pk"), _repair_captured_unpaid),
+    ("paid_without_capture", _paid_without_capture, ("pk", None), None),
+    ("stock_not_committed", _stock_not_committed, ("pk", None), _repair_stock),
+    ("missing_analytics", _missing_analytics, ("pk", None), _repair_analytics),
+    ("analytics_unpaid", _analytics_unpaid, ("pk", None), None),
+]
+
+
+class ReconciliationService:
+    """Conciliación por particiones de fecha con reparación opcional."""
+
+    @staticmethod
+    def partitions(date_from: date, date_to: date, days: int = 1) -> Iterator[tuple[datetime, datetime]]:
+        """Rangos ``[inicio, fin)`` en la zona horaria local que cubren las fechas dadas."""
+        tz = timezone.get_current_timezone()
+        current = date_from
+        while current <= date_to:
+            upper = min(current + timedelta(days=days), date_to + timedelta(days=1))
+            yield (
+                timezone.make_aware(datetime.combine(current, time.min), tz),
+                timezone.make_aware(datetime.combine(upper, time.min), tz),
+            )
+            current = upper
+
+    @staticmethod
+    def _rows(qs: QuerySet, columns: tuple[str, Optional[str]], batch_size: int) -> Iterator[tuple]:
+        """Recorre ``qs`` por keyset en lotes: memoria constante y sin cursores abiertos."""
+        order_col, payment_col = columns
+        fields = ["pk", order_col] + ([payment_col] if payment_col else [])
+        last = 0
+        while True:
+            batch = list(qs.filter(pk__gt=last).order_by("pk").values_list(*fields)[:batch_size])
+            if not batch:
+                return
+            for row in batch:
+                yield row[1], (row[2] if payment_col else None)
+            last = batch[-1][0]
+
+    @staticmethod
+    def run(
+        date_from: date,
+        date_to: date,
+        days: int = 1,
+        repair: bool = False,
+        batch_size: int = 1000,
+        on_mismatch: Optional[Callable[[Mismatch], None]] = None,
+    ) -> Counter:
+        """
+        Ejecuta todas las verificaciones partición por partición.
+
+        Args:
+            date_from, date_to: Rango de fechas (inclusive) de creación de pagos/órdenes
+            days: Días por partición
+            repair: Repara las diferencias que tienen reparación segura
+            batch_size: Filas por lote dentro de cada partición
+            on_mismatch: Callback por cada diferencia (para el reporte)
+
+        Returns:
+            Conteo de diferencias por verificación (y ``<check>:repaired``)
+        """
+        counts: Counter = Counter()
+        for start, end in ReconciliationService.partitions(date_from, date_to, days):
+            for name, query, columns, fix in CHECKS:
+                for order_id, payment_id in ReconciliationService._rows(query(start, end), columns, batch_size):
+                    counts[name] += 1
+                    repaired, detail = False, ""
+                    if repair and fix is not None:
+                        try:
+                            detail = fix(payment_id, order_id)
+                        except Exception as e:
+                            detail = str(e)
+                        repaired = not detail
+                        if repaired:
+                            counts[f"{name}:repaired"] += 1
+                        else:
+                            logger.warning(f"No se pudo reparar {name} en la orden {order_id}: {detail}")
+                    if on_mismatch is not None:
+                        on_mismatch(Mismatch(name, order_id, payment_id, repaired, detail))
+        return counts
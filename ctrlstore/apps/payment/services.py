@@ -1,6 +1,24 @@
 # ctrlstore/apps/payment/services.py
-from datetime import datetime
+import hashlib
+import hmac
+import json
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import partial
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from ctrlstore.apps.common.exceptions import OrderError, PaymentError, StockError
+
+from .fraud import record_capture
+from .invoices import schedule_invoice
+
+logger = logging.getLogger(__name__)
 
 def luhn_check(number: str) -> bool:
     digits = [int(d) for d in number if d.isdigit()]
@@ -73,4 +91,329 @@ def simulate_authorize(number: str, amount: float | int, currency: str = "COP")
         return AuthResult(False, error_code="do_not_honor", msg="Transacción rechazada por el emisor.")
     if number.endswith("6666"):
         return AuthResult(False, error_code="suspected_fraud", msg="Transacción sospechosa.")
-    return AuthResult(True, auth_code=f"A{last4}OK")
\ No newline at end of file
+    return AuthResult(True, auth_code=f"A{last4}OK")
+
+
+# --- Captura ---
+def capture_payment(payment_id: int, result: AuthResult):
+    """
+    Aplica el resultado de la autorización a un pago ``initiated``.
+
+    Si la autorización fue aprobada, convierte las reservas de stock de la orden y marca
+    pago y orden como exitosos en una sola transacción. La fila del pago se bloquea y
+    se ignora si ya no está ``initiated``, así el resultado se aplica una única vez
+    aunque llegue desde un hilo de la pasarela.
+
+    Args:
+        payment_id: ID del pago
+        result: Resultado de la pasarela
+
+    Returns:
+        Pago actualizado
+    """
+    from ctrlstore.apps.billing.services import InvoiceService
+    from ctrlstore.apps.order.services import OrderStateMachine, StockReservationService
+    from .models import Payment
+
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().select_related("order").get(pk=payment_id)
+        if payment.status != "initiated":
+            return payment
+
+        if not result.ok:
+            payment.status = "failed"
+            payment.error_code = result.error_code or "error"
+            payment.error_message = result.msg or "No fue posible procesar el pago."
+            payment.save(update_fields=["status", "error_code", "error_message", "updated_at"])
+            return payment
+
+        order = payment.order
+        try:
+            with transaction.atomic():
+                # Validar stock y convertir las reservas de la orden en descuentos
+                StockReservationService.commit_for_order(order)
+
+                payment.status = "captured"
+                payment.auth_code = result.auth_code or "OK"
+                payment.error_code = ""
+                payment.error_message = ""
+                payment.save(
+                    update_fields=["status", "auth_code", "error_code", "error_message", "updated_at"]
+                )
+
+                OrderStateMachine.transition(order, "paid", reason=f"payment:{payment.id}")
+
+                # Número consecutivo y libro de líneas en la misma transacción
+                InvoiceService.issue_for_payment(payment)
+
+            # La factura no cambia: se pre-renderiza una vez confirmada la captura
+            transaction.on_commit(partial(schedule_invoice, payment.id))
+            transaction.on_commit(partial(record_capture, order.user_id, payment.amount))
+        except StockError as e:
+            payment.status = "failed"
+            payment.error_code = "out_of_stock"
+            payment.error_message = (str(e) or _("No hay stock suficiente."))[:255]
+            payment.save(update_fields=["status", "error_code", "error_message", "updated_at"])
+        except OrderError as e:
+            # La orden ya no admite pago (p. ej. fue cancelada)
+            payment.status = "failed"
+            payment.error_code = "order_not_payable"
+            payment.error_message = e.message[:255]
+            payment.save(update_fields=["status", "error_code", "error_message", "updated_at"])
+
+    logger.info(f"Pago {payment.id} procesado: {payment.status}")
+    return payment
+
+
+def authorization_timeout() -> timedelta:
+    """Plazo de un pago ``initiated`` (``PAYMENT_AUTHORIZATION_TIMEOUT``, 120 s por defecto)."""
+    return timedelta(seconds=getattr(settings, "PAYMENT_AUTHORIZATION_TIMEOUT", 120))
+
+
+def _timeout_result() -> AuthResult:
+    return AuthResult(
+        False,
+        error_code="gateway_timeout",
+        msg="La pasarela no respondió a tiempo. Intenta de nuevo.",
+    )
+
+
+def expire_if_stale(payment):
+    """
+    Marca como fallido (``gateway_timeout``) un pago ``initiated`` que superó el plazo.
+
+    Cubre un worker de la pasarela que murió o una tarea que el pool descartó: sin esto
+    la orden quedaría esperando ese pago para siempre. Si la pasarela responde después,
+    ``capture_payment`` ignora el resultado porque el pago ya no está ``initiated``.
+
+    Returns:
+        El pago, actualizado si venció
+    """
+    if payment.status == "initiated" and payment.created_at < timezone.now() - authorization_timeout():
+        return capture_payment(payment.id, _timeout_result())
+    return payment
+
+
+def expire_stale_payments(batch_size: int = 500) -> int:
+    """
+    Marca como fallidos todos los pagos ``initiated`` que superaron el plazo.
+
+    Returns:
+        Cantidad de pagos vencidos
+    """
+    from .models import Payment
+
+    cutoff = timezone.now() - authorization_timeout()
+    stale = Payment.objects.filter(status="initiated", created_at__lt=cutoff).order_by("pk")
+    expired = last_pk = 0
+    while True:
+        ids = list(stale.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return expired
+        last_pk = ids[-1]
+        for payment_id in ids:
+            if capture_payment(payment_id, _timeout_result()).error_code == "gateway_timeout":
+                expired += 1
+
+
+# --- Webhook de la pasarela ---
+WEBHOOK_SIGNATURE_HEADER = "HTTP_X_CTRLSTORE_SIGNATURE"
+
+
+def sign_webhook(body: bytes, secret: str) -> str:
+    """Firma HMAC-SHA256 del cuerpo crudo, en el formato ``sha256=<hex>``."""
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_webhook_signature(body: bytes, signature: str) -> bool:
+    """Compara en tiempo constante la firma recibida con ``PAYMENT_WEBHOOK_SECRET``."""
+    secret = getattr(settings, "PAYMENT_WEBHOOK_SECRET", "")
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_webhook(body, secret), signature)
+
+
+def record_webhook_event(body: bytes) -> bool:
+    """
+    Guarda un evento del webhook tal como llegó, sin tocar Payment ni Order.
+
+    Formato: ``{"id": "...", "type": "payment.captured", "data": {"payment_id": 1, ...}}``.
+
+    Args:
+        body: Cuerpo crudo de la petición (ya verificado)
+
+    Returns:
+        True si el evento es nuevo, False si ``id`` ya se había recibido
+
+    Raises:
+        PaymentError: Si el cuerpo no es un evento válido
+    """
+    from .models import PaymentEvent
+
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise PaymentError("El cuerpo no es JSON válido", error_code="invalid_payload")
+    if not isinstance(data, dict):
+        raise PaymentError("El evento debe ser un objeto JSON", error_code="invalid_payload")
+
+    event_id = str(data.get("id") or "")
+    event_type = str(data.get("type") or "")
+    if not event_id or not event_type or len(event_id) > 64 or len(event_type) > 40:
+        raise PaymentError("El evento requiere 'id' y 'type'", error_code="invalid_payload")
+
+    obj = data.get("data") if isinstance(data.get("data"), dict) else {}
+    try:
+        payment_ref = int(obj.get("payment_id"))
+    except (TypeError, ValueError):
+        payment_ref = None
+
+    try:
+        with transaction.atomic():
+            PaymentEvent.objects.create(
+                event_id=event_id,
+                event_type=event_type,
+                payment_ref=payment_ref,
+                payload=data,
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+# Plazo de un evento reclamado por un worker y espera entre reintentos (exponencial)
+EVENT_CLAIM_TTL = timedelta(minutes=5)
+EVENT_RETRY_BASE_SECONDS = 30
+EVENT_RETRY_MAX_SECONDS = 60 * 60
+
+
+def _apply_event(event, status: str) -> str:
+    """Aplica un evento sobre su pago (ya bloqueado, en ``status``) y retorna el resultado."""
+    from .models import Payment
+
+    ref = event.payment_ref
+    obj = event.payload.get("data") or {}
+    if event.event_type in ("payment.captured", "payment.failed"):
+        if status != "initiated":
+            return "ignored"
+        if event.event_type == "payment.captured":
+            result = AuthResult(True, auth_code=obj.get("auth_code"))
+        else:
+            result = AuthResult(
+                False,
+                error_code=obj.get("error_code") or "declined",
+                msg=obj.get("message") or "Transacción rechazada por la pasarela.",
+            )
+        capture_payment(ref, result)
+        return "applied"
+
+    if event.event_type == "payment.refunded":
+        if status != "captured":
+            return "ignored"
+        Payment.objects.filter(pk=ref).update(status="refunded", updated_at=timezone.now())
+        return "applied"
+
+    return "unsupported"
+
+
+def _claim_payment_events(batch_size: int) -> list:
+    """
+    Reclama eventos pendientes en una transacción corta (solo la fila del evento).
+
+    De cada pago solo se toma su evento pendiente más antiguo: los siguientes esperan
+    a que se aplique, aunque esté en espera de reintento.
+    """
+    from .models import PaymentEvent
+
+    now = timezone.now()
+    earlier = PaymentEvent.objects.filter(
+        payment_ref=OuterRef("payment_ref"), processed_at__isnull=True, pk__lt=OuterRef("pk")
+    )
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .filter(~Exists(earlier))
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+            .order_by("id")[:batch_size]
+        )
+        if events:
+            PaymentEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+                claimed_until=now + EVENT_CLAIM_TTL
+            )
+    return events
+
+
+def _process_payment_event(event) -> str:
+    """
+    Aplica un evento reclamado en su propia transacción.
+
+    El pago se bloquea con ``SKIP LOCKED`` y su estado se lee ya bloqueado; si otra
+    transacción lo tiene, el evento se libera y queda para el siguiente lote.
+    """
+    from .models import Payment, PaymentEvent
+
+    with transaction.atomic():
+        status = None
+        if event.payment_ref is not None:
+            status = (
+                Payment.objects.select_for_update(skip_locked=True)
+                .filter(pk=event.payment_ref)
+                .values_list("status", flat=True)
+                .first()
+            )
+            if status is None and Payment.objects.filter(pk=event.payment_ref).exists():
+                PaymentEvent.objects.filter(pk=event.pk).update(claimed_until=None)
+                return "deferred"
+
+        result = "unknown_payment" if status is None else _apply_event(event, status)
+        PaymentEvent.objects.filter(pk=event.pk).update(
+            processed_at=timezone.now(), result=result, claimed_until=None, last_error=""
+        )
+    return result
+
+
+def _schedule_event_retry(event, error: Exception) -> None:
+    """Deja el evento pendiente con espera exponencial hasta el próximo intento."""
+    from .models import PaymentEvent
+
+    attempts = event.attempts + 1
+    delay = min(EVENT_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EVENT_RETRY_MAX_SECONDS)
+    PaymentEvent.objects.filter(pk=event.pk).update(
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        claimed_until=None,
+        last_error=str(error)[:255],
+    )
+
+
+def process_payment_events(batch_size: int = 100) -> Counter:
+    """
+    Aplica un lote de eventos pendientes del webhook en orden de llegada.
+
+    Los eventos se reclaman en una transacción corta con ``SKIP LOCKED`` para que varios
+    workers no se pisen, uno por pago para no aplicarlos fuera de orden. Cada evento se
+    aplica después en su propia transacción, así los locks de pago, orden, productos y
+    factura se sueltan al terminar cada uno. Si una petición del cliente tiene bloqueado
+    el pago, el evento queda pendiente. Un evento que falla (p. ej. un error transitorio
+    de la BD) se reintenta más tarde con espera exponencial.
+
+    Args:
+        batch_size: Máximo de eventos por lote
+
+    Returns:
+        Conteo por resultado (applied, ignored, unknown_payment, unsupported, error, deferred)
+    """
+    counts: Counter = Counter()
+    for event in _claim_payment_events(batch_size):
+        try:
+            result = _process_payment_event(event)
+        except Exception as e:
+            logger.error(f"Error aplicando el evento de pago {event.event_id}: {e}")
+            _schedule_event_retry(event, e)
+            result = "error"
+        counts[result] += 1
+
+    return counts
+
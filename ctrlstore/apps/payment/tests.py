@@ -1,8 +1,29 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from decimal import Decimal
+import io
+import os
+import json
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+import itertools
 import random, string
 from django.contrib.auth import get_user_model
 from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from . import card_batch, gateways, invoices, services
+from .fraud import FraudContext, get_fraud_engine
+from .gateways import SimulatorGateway
+from .models import Payment, PaymentEvent
+from .reconciliation import ReconciliationService
+from .services import process_payment_events, sign_webhook
 
 def _rand_word(n=6):
     rng = random.Random(42)
@@ -109,3 +130,519 @@ class TestFlowIdempotency(TestCase):
             "cvv": f"{cls.rng.randint(100,999)}",
             "zip_code": f"05{cls.rng.randint(0,999):03d}1",
         }
+
+
+class SimulatorGatewayTests(TestCase):
+    """Pruebas de la pasarela simulada."""
+
+    def test_keeps_simulator_rules(self):
+        gateway = SimulatorGateway(seed=1)
+        self.assertTrue(gateway.authorize("4111111111111111", 100).ok)
+        result = gateway.authorize("4000000000070005", 100)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error_code, "insufficient_funds")
+
+    def test_failure_rate_returns_gateway_error(self):
+        result = SimulatorGateway(failure_rate=1, seed=1).authorize("4111111111111111", 100)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error_code, "gateway_error")
+
+
+class PaymentFixtureMixin:
+    """Orden pendiente con stock reservado y cliente autenticado."""
+
+    def setUp(self):
+        # Contadores de fraude limpios entre pruebas
+        cache.clear()
+        Category = apps.get_model("catalog", "Category")
+        Product = apps.get_model("catalog", "Product")
+        Order = apps.get_model("order", "Order")
+        OrderItem = apps.get_model("order", "OrderItem")
+        from ctrlstore.apps.order.services import StockReservationService
+
+        category = Category.objects.create(name="Gaming", slug="gaming", category_type="gaming")
+        self.product = Product.objects.create(
+            name="Consola", slug="consola", price=Decimal("100.00"), category=category, stock_quantity=5
+        )
+        self.user = get_user_model().objects.create_user(
+            username="cliente", email="cliente@example.com", password="clave-segura-123"
+        )
+        self.order = Order.objects.create(
+            user=self.user, email="cliente@example.com", full_name="Cliente",
+            address_line1="Calle 1", city="Medellín", total_amount=Decimal("200.00"),
+        )
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2,
+            unit_price=Decimal("100.00"), line_total=Decimal("200.00"),
+        )
+        StockReservationService.reserve_for_order(self.order)
+        self.client.force_login(self.user)
+        self.url = reverse("payment:process", args=[self.order.id])
+
+    def _form(self, number="4111111111111111"):
+        return {
+            "cardholder_name": "Cliente Prueba",
+            "card_number": number,
+            "expiry": "12/35",
+            "cvv": "123",
+            "zip_code": "050001",
+        }
+
+
+class PaymentProcessTests(PaymentFixtureMixin, TestCase):
+    """Pruebas del flujo de pago síncrono y asíncrono."""
+
+    def test_sync_payment_captures_and_decrements_stock(self):
+        response = self.client.post(self.url, self._form())
+
+        payment = Payment.objects.get()
+        self.assertRedirects(response, reverse("payment:confirm", args=[payment.id]))
+        self.assertEqual(payment.status, "captured")
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, "paid")
+        self.assertEqual(self.product.stock_quantity, 3)
+
+    def test_sync_declined_payment_renders_form(self):
+        response = self.client.post(self.url, self._form("4000000000070005"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Payment.objects.get().status, "failed")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "pending")
+
+    def test_capture_on_canceled_order_fails_without_charging_stock(self):
+        payment = Payment.objects.create(order=self.order, amount=self.order.total_amount, status="initiated")
+        apps.get_model("order", "Order").objects.filter(pk=self.order.pk).update(status="canceled")
+
+        payment = services.capture_payment(payment.id, services.AuthResult(True, auth_code="OK"))
+
+        self.assertEqual((payment.status, payment.error_code), ("failed", "order_not_payable"))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
+
+    @override_settings(PAYMENT_GATEWAY={"ASYNC": True})
+    def test_async_payment_is_polled_until_captured(self):
+        queued = []
+        with mock.patch.object(gateways, "_spawn", lambda target, *args: queued.append((target, args))):
+            response = self.client.post(self.url, self._form())
+
+        payment = Payment.objects.get()
+        status_url = reverse("payment:status", args=[payment.id])
+        api_url = reverse("payment:status_api", args=[payment.id])
+        self.assertRedirects(response, status_url)
+        self.assertEqual(self.client.get(api_url).json()["status"], "initiated")
+        self.assertEqual(self.client.get(status_url).status_code, 200)
+
+        # Un segundo envío no inicia otro cargo mientras el primero sigue en curso
+        self.assertRedirects(self.client.post(self.url, self._form()), status_url)
+        self.assertEqual(len(queued), 1)
+
+        target, args = queued[0]
+        with mock.patch.object(gateways, "close_old_connections"):
+            target(*args)
+
+        data = self.client.get(api_url).json()
+        self.assertEqual(data["status"], "captured")
+        self.assertEqual(data["redirect_url"], reverse("payment:confirm", args=[payment.id]))
+
+    @override_settings(PAYMENT_GATEWAY={"ASYNC": True})
+    def test_stuck_payment_times_out_and_order_can_be_paid_again(self):
+        # El job de la pasarela nunca corre (worker caído)
+        with mock.patch.object(gateways, "_spawn"):
+            self.client.post(self.url, self._form())
+        stuck = Payment.objects.get()
+        Payment.objects.filter(pk=stuck.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        data = self.client.get(reverse("payment:status_api", args=[stuck.id])).json()
+        self.assertEqual(data["status"], "failed")
+        stuck.refresh_from_db()
+        self.assertEqual(stuck.error_code, "gateway_timeout")
+
+        with mock.patch.object(gateways, "_spawn", lambda target, *args: target(*args)), \
+                mock.patch.object(gateways, "close_old_connections"):
+            self.client.post(self.url, self._form())
+        self.assertEqual(Payment.objects.filter(status="captured").count(), 1)
+
+    def test_expire_stale_payments_command(self):
+        old = Payment.objects.create(order=self.order, amount=self.order.total_amount, status="initiated")
+        Payment.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        recent = Payment.objects.create(order=self.order, amount=self.order.total_amount, status="initiated")
+
+        out = io.StringIO()
+        call_command("expire_stale_payments", stdout=out)
+
+        self.assertIn("1 pago(s)", out.getvalue())
+        self.assertEqual(Payment.objects.get(pk=old.pk).error_code, "gateway_timeout")
+        self.assertEqual(Payment.objects.get(pk=recent.pk).status, "initiated")
+
+    def test_gateways_must_implement_authorize(self):
+        with self.assertRaises(TypeError):
+            gateways.PaymentGateway()
+
+    def test_capture_is_applied_once(self):
+        from .services import AuthResult, capture_payment
+
+        self.client.post(self.url, self._form())
+        payment = Payment.objects.get()
+        capture_payment(payment.id, AuthResult(True, auth_code="OTRO"))
+
+        payment.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(payment.auth_code, "A1111OK")
+        self.assertEqual(self.product.stock_quantity, 3)
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET="secreto-de-prueba")
+class PaymentWebhookTests(PaymentFixtureMixin, TestCase):
+    """Pruebas del webhook de la pasarela y su worker."""
+
+    def setUp(self):
+        super().setUp()
+        self.payment = Payment.objects.create(
+            order=self.order, amount=self.order.total_amount, status="initiated", last4="1111"
+        )
+        self.webhook_url = reverse("payment:webhook")
+
+    def _send(self, event, secret="secreto-de-prueba"):
+        body = json.dumps(event).encode()
+        return self.client.post(
+            self.webhook_url, body, content_type="application/json",
+            HTTP_X_CTRLSTORE_SIGNATURE=sign_webhook(body, secret),
+        )
+
+    def _event(self, event_id, event_type, **data):
+        return {"id": event_id, "type": event_type, "data": {"payment_id": self.payment.id, **data}}
+
+    def test_rejects_invalid_signature(self):
+        response = self._send(self._event("evt_1", "payment.captured"), secret="otro")
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_event_is_recorded_once_without_touching_payment(self):
+        event = self._event("evt_1", "payment.captured", auth_code="GW123")
+        self.assertEqual(self._send(event).json(), {"received": True, "duplicate": False})
+        self.assertEqual(self._send(event).json(), {"received": True, "duplicate": True})
+
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "initiated")
+
+    def test_worker_applies_transitions_in_order(self):
+        self._send(self._event("evt_1", "payment.captured", auth_code="GW123"))
+        self._send(self._event("evt_2", "payment.failed", error_code="late"))
+        self._send({"id": "evt_3", "type": "payment.captured", "data": {"payment_id": 999999}})
+
+        # Un evento por pago y lote: el segundo evento del pago va en el lote siguiente
+        self.assertEqual(process_payment_events(), {"applied": 1, "unknown_payment": 1})
+        self.assertEqual(process_payment_events(), {"ignored": 1})
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.auth_code), ("captured", "GW123"))
+        self.assertEqual(self.order.status, "paid")
+        self.assertEqual(self.product.stock_quantity, 3)
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(process_payment_events(), {})
+
+    def test_failed_event_stays_pending_and_is_retried_with_backoff(self):
+        self._send(self._event("evt_1", "payment.captured", auth_code="GW123"))
+        self._send(self._event("evt_2", "payment.refunded"))
+
+        with mock.patch.object(services, "capture_payment", side_effect=RuntimeError("BD no disponible")):
+            counts = process_payment_events()
+        self.assertEqual(counts, {"error": 1})
+        failed = PaymentEvent.objects.get(event_id="evt_1")
+        self.assertIsNone(failed.processed_at)
+        self.assertEqual((failed.attempts, failed.last_error), (1, "BD no disponible"))
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+
+        # Antes de la espera no se reintenta, y el reembolso espera a la captura
+        self.assertEqual(process_payment_events(), {})
+        PaymentEvent.objects.filter(pk=failed.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(process_payment_events(), {"applied": 1})
+        self.assertEqual(process_payment_events(), {"applied": 1})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "refunded")
+
+    def test_events_are_append_only(self):
+        self._send(self._event("evt_1", "payment.captured"))
+        event = PaymentEvent.objects.get()
+        with self.assertRaises(ValueError):
+            event.save()
+
+
+class InvoiceCacheTests(PaymentFixtureMixin, TestCase):
+    """Pruebas de las facturas PDF pre-renderizadas."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        # La conversión HTML -> PDF se simula: solo interesa cuántas veces ocurre
+        patcher = mock.patch.object(invoices, "html_to_pdf", return_value=b"%PDF-1.4 prueba")
+        self.html_to_pdf = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _pay(self):
+        with mock.patch.object(invoices, "_spawn", lambda target, *args: target(*args)), \
+                mock.patch.object(invoices, "close_old_connections"), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self._form())
+        return Payment.objects.get()
+
+    def test_pdf_is_rendered_at_capture_and_served_from_disk(self):
+        payment = self._pay()
+        files = list(invoices.invoice_dir().glob(f"{payment.id}-*.pdf"))
+        self.assertEqual(len(files), 1)
+
+        self.assertEqual(self.html_to_pdf.call_count, 1)
+
+        url = reverse("payment:invoice_pdf", args=[payment.id])
+        response = self.client.get(url)
+        self.assertEqual(self.html_to_pdf.call_count, 1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response["Content-Length"]), files[0].stat().st_size)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+    @override_settings(INVOICE_SENDFILE="x-accel-redirect", INVOICE_ACCEL_PREFIX="/protected/invoices/")
+    def test_accel_redirect_delegates_to_web_server(self):
+        payment = self._pay()
+        response = self.client.get(reverse("payment:invoice_pdf", args=[payment.id]))
+
+        path = next(invoices.invoice_dir().glob(f"{payment.id}-*.pdf"))
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/invoices/{path.name}")
+        self.assertEqual(response.content, b"")
+
+    def test_regenerate_command_prunes_old_versions(self):
+        payment = self._pay()
+        stale = invoices.invoice_dir() / f"{payment.id}-viejo.pdf"
+        stale.write_bytes(b"%PDF-viejo")
+
+        call_command("regenerate_invoices", stdout=io.StringIO())
+
+        self.assertFalse(stale.exists())
+        self.assertEqual(len(list(invoices.invoice_dir().glob(f"{payment.id}-*.pdf"))), 1)
+
+    def test_generate_invoices_is_resumable_and_bundles_zip(self):
+        payments = [
+            Payment.objects.create(order=self.order, amount=self.order.total_amount, status="captured")
+            for _ in range(3)
+        ]
+        invoices.ensure_invoice_pdf(Payment.objects.get(pk=payments[0].pk))
+        today = timezone.localdate(payments[0].created_at).isoformat()
+        bundle = os.path.join(tempfile.mkdtemp(), "facturas.zip")
+        self.addCleanup(shutil.rmtree, os.path.dirname(bundle), ignore_errors=True)
+
+        out = io.StringIO()
+        call_command("generate_invoices", "--from", today, "--to", today, "--workers", "2",
+                     "--zip", bundle, stdout=out)
+
+        self.assertIn("2 factura(s) generadas, 1 ya existían", out.getvalue())
+        with zipfile.ZipFile(bundle) as zf:
+            self.assertEqual(sorted(zf.namelist()), sorted(f"{invoices.invoice_number(p)}.pdf" for p in payments))
+
+        out = io.StringIO()
+        call_command("generate_invoices", "--from", today, "--to", today, stdout=out)
+        self.assertIn("0 factura(s) generadas, 3 ya existían", out.getvalue())
+
+
+def _card_corpus(size, seed):
+    """Números variados: prefijos de marca, longitudes límite, Luhn válidos y basura."""
+    rng = random.Random(seed)
+    prefixes = ["4", "51", "55", "2221", "2720", "2721", "2220", "34", "37", "6011", "65", "3", "9", ""]
+    corpus = []
+    for _ in range(size):
+        prefix = rng.choice(prefixes)
+        length = rng.randint(11, 21)
+        digits = prefix + "".join(rng.choice(string.digits) for _ in range(max(length - len(prefix), 0)))
+        roll = rng.random()
+        if roll < 0.4 and len(digits) > 1:
+            # Ajusta el dígito verificador para que pase Luhn
+            body = digits[:-1]
+            for check in string.digits:
+                if services.luhn_check(body + check):
+                    digits = body + check
+                    break
+        elif roll < 0.5:
+            pos = rng.randrange(len(digits) + 1)
+            digits = digits[:pos] + rng.choice(" -x٣") + digits[pos:]
+        corpus.append(digits)
+    return corpus
+
+
+class CardBatchAgreementTests(TestCase):
+    """La validación por lotes debe coincidir con las funciones escalares."""
+
+    def _scalar_error(self, number):
+        try:
+            services.validate_card_number(number)
+        except ValidationError as e:
+            return e.messages[0]
+        return None
+
+    def _assert_agrees(self):
+        corpus = _card_corpus(20_000, seed=2024)
+        results = card_batch.validate_card_numbers(corpus)
+
+        for number, result in zip(corpus, results):
+            self.assertEqual(result.error, self._scalar_error(number), number)
+            if number.isascii() and number.isdigit():
+                self.assertEqual(result.brand, services.detect_brand(number), number)
+
+        rng = random.Random(7)
+        months = [rng.randint(-1, 14) for _ in range(5_000)]
+        years = [rng.choice([rng.randint(-5, 120), rng.randint(1990, 2110)]) for _ in range(5_000)]
+        for month, year, error in zip(months, years, card_batch.validate_expiries(months, years)):
+            try:
+                services.validate_expiry(month, year)
+                expected = None
+            except ValidationError as e:
+                expected = e.messages[0]
+            self.assertEqual(error, expected, (month, year))
+
+    def test_pure_python_backend_agrees(self):
+        with mock.patch.object(card_batch, "np", None):
+            self._assert_agrees()
+
+    @skipUnless(card_batch.np is not None, "NumPy no está instalado")
+    def test_numpy_backend_agrees(self):
+        self._assert_agrees()
+
+    def test_brands_agree_on_short_numbers(self):
+        # Todos los números de 0 a 4 dígitos: cubre los prefijos incompletos del trie
+        numbers = [""] + ["".join(p) for n in range(1, 5) for p in itertools.product(string.digits, repeat=n)]
+        for number, brand in zip(numbers, card_batch.detect_brands(numbers)):
+            self.assertEqual(brand, services.detect_brand(number), number)
+
+
+FRAUD_RULES = {
+    "REVIEW_SCORE": 30,
+    "BLOCK_SCORE": 80,
+    "RULES": [
+        {
+            "RULE": "ctrlstore.apps.payment.fraud.VelocityRule",
+            "OPTIONS": {"dimension": "user", "window": 600, "limit": 2, "score": 80},
+        },
+        {
+            "RULE": "ctrlstore.apps.payment.fraud.AmountOverAverageRule",
+            "OPTIONS": {"multiplier": 3, "min_history": 1, "score": 30},
+        },
+    ],
+}
+
+
+@override_settings(PAYMENT_FRAUD=FRAUD_RULES)
+class FraudScoringTests(PaymentFixtureMixin, TestCase):
+    """Pruebas del puntaje de fraude previo a la autorización."""
+
+    def _ctx(self, amount="200.00"):
+        return FraudContext(user_id=self.user.id, amount=Decimal(amount), card="visa:1111", ip="10.0.0.1")
+
+    def test_velocity_blocks_without_calling_gateway(self):
+        engine = get_fraud_engine()
+        engine.assess(self._ctx())
+        engine.assess(self._ctx())
+
+        with mock.patch.object(gateways, "_authorize_and_capture") as authorize:
+            response = self.client.post(self.url, self._form())
+            authorize.assert_not_called()
+
+        payment = Payment.objects.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((payment.status, payment.error_code), ("failed", "fraud_suspected"))
+        self.assertEqual(payment.risk_score, 80)
+        self.assertTrue(payment.risk_reasons[0].startswith("velocity:user:2/"))
+
+    def test_scoring_uses_no_queries_once_history_is_cached(self):
+        engine = get_fraud_engine()
+        engine.assess(self._ctx())  # carga el promedio del usuario en el caché
+
+        with self.assertNumQueries(0):
+            assessment = engine.assess(self._ctx())
+        self.assertEqual(assessment.decision, "allow")
+
+    def test_concurrent_captures_update_average_atomically(self):
+        from .fraud import load_user_average, record_capture
+
+        load_user_average(self.user.id)
+        for _ in range(3):
+            record_capture(self.user.id, Decimal("100.50"))
+
+        self.assertEqual(
+            cache.get_many([f"fraud:avg:{self.user.id}:n", f"fraud:avg:{self.user.id}:cents"]),
+            {f"fraud:avg:{self.user.id}:n": 3, f"fraud:avg:{self.user.id}:cents": 30150},
+        )
+
+    def test_rules_must_implement_evaluate(self):
+        from .fraud import FraudRule
+
+        with self.assertRaises(TypeError):
+            FraudRule()
+
+    def test_amount_far_over_user_average_is_flagged(self):
+        self.client.post(self.url, self._form())
+        self.assertEqual(Payment.objects.get().status, "captured")
+        engine = get_fraud_engine()
+        cache.clear()
+
+        assessment = engine.assess(self._ctx("900.00"))
+        self.assertEqual(assessment.decision, "review")
+        self.assertTrue(assessment.reasons[0].startswith("amount_over_average"))
+
+
+
+@override_settings(INVOICE_PRERENDER=False)
+class ReconciliationTests(PaymentFixtureMixin, TestCase):
+    """Pruebas de la conciliación entre pagos, órdenes, stock y analytics."""
+
+    def _run(self, repair=False):
+        today = timezone.localdate()
+        return ReconciliationService.run(today, today, repair=repair, batch_size=1)
+
+    def test_normal_capture_has_no_mismatches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self._form())
+        self.assertEqual(Payment.objects.get().status, "captured")
+        self.assertEqual(sum(self._run().values()), 0)
+
+    def test_captured_payment_with_pending_order_is_repaired(self):
+        # Simula una captura a medias: el pago quedó capturado pero nada más se aplicó
+        Payment.objects.create(order=self.order, amount=self.order.total_amount, status="captured")
+
+        counts = self._run(repair=True)
+        self.assertEqual(counts["captured_unpaid:repaired"], 1)
+        self.assertEqual(counts["stock_not_committed:repaired"], 1)
+
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, "paid")
+        self.assertEqual(self.product.stock_quantity, 3)
+        self.assertTrue(self.order.reservations.filter(status="converted").exists())
+        self.assertTrue(
+            apps.get_model("analytics", "ProcessedOrder").objects.filter(order=self.order).exists()
+        )
+        self.assertEqual(sum(self._run().values()), 0)
+
+    def test_command_reports_paid_order_without_payment(self):
+        apps.get_model("order", "Order").objects.filter(pk=self.order.pk).update(status="paid")
+        report = os.path.join(tempfile.mkdtemp(), "conciliacion.csv")
+        self.addCleanup(shutil.rmtree, os.path.dirname(report), ignore_errors=True)
+
+        out = io.StringIO()
+        call_command("reconcile_payments", "--report", report, stdout=out)
+
+        with open(report) as fh:
+            checks = sorted(row.split(",")[0] for row in fh.read().splitlines()[1:])
+        self.assertEqual(checks, ["missing_analytics", "paid_without_capture", "stock_not_committed"])
+        self.assertIn("3 diferencia(s) sin reparar", out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
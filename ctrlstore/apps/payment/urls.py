@@ -6,6 +6,9 @@ app_name = "payment"
 urlpatterns = [
     path("pay/<int:order_id>/", views.pay, name="pay"),
     path("pay/<int:order_id>/process/", views.process, name="process"),
+    path("status/<int:payment_id>/", views.status, name="status"),
+    path("status/<int:payment_id>/api/", views.status_api, name="status_api"),
+    path("webhook/", views.webhook, name="webhook"),
     path("confirm/<int:payment_id>/", views.confirm, name="confirm"),
     path("invoice/<int:payment_id>/", views.invoice_pdf, name="invoice_pdf"),
 ]
@@ -1,18 +1,15 @@
 from __future__ import annotations
 
+import logging
 from typing import Any
 
-import io
-
-from django.apps import apps
 from django.contrib import messages
 from django.contrib.messages import get_messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.messages import get_messages
-from django.db import transaction
-from django.db.models import F
 from django.http import (
     Http404,
+    JsonResponse,
     HttpRequest,
     HttpResponse,
     HttpResponseBadRequest,
@@ -20,17 +17,25 @@ from django.http import (
 )
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import get_template
-from django.utils import timezone
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
 
+from ctrlstore.apps.common.exceptions import PaymentError
+from ctrlstore.apps.common.http import get_client_ip
 from ctrlstore.apps.order.models import Order
 from .forms import CardPaymentForm
+from .fraud import FraudContext, get_fraud_engine
+from .gateways import authorize_payment
+from .invoices import ensure_invoice_pdf, html_to_pdf, invoice_number, serve_invoice
 from .models import Payment
-from .services import simulate_authorize
+from .services import (
+    WEBHOOK_SIGNATURE_HEADER,
+    expire_if_stale,
+    record_webhook_event,
+    verify_webhook_signature,
+)
 
-from django.db import transaction
-from django.db.models import F
-from django.apps import apps
 
 # i18n
 from django.utils.translation import gettext as _
@@ -38,6 +43,9 @@ from django.utils.translation import gettext as _
 
 
 
+logger = logging.getLogger(__name__)
+
+
 @login_required
 @require_GET
 def pay(request: HttpRequest, order_id: int) -> HttpResponse:
@@ -71,6 +79,12 @@ def process(request: HttpRequest, order_id: int) -> HttpResponse | HttpResponseR
         messages.info(request, _("La orden ya estaba pagada."))
         return redirect("order:checkout")
 
+    # Un pago aún en autorización: no iniciar otro cargo, mostrar su estado.
+    # Si superó el plazo (worker caído) se marca fallido y se permite reintentar.
+    in_flight = order.payments.filter(status="initiated").first()
+    if in_flight is not None and expire_if_stale(in_flight).status == "initiated":
+        return redirect("payment:status", payment_id=in_flight.id)
+
     form = CardPaymentForm(request.POST)
     if not form.is_valid():
         return render(request, "payment/pay.html", {"order": order, "form": form})
@@ -79,6 +93,16 @@ def process(request: HttpRequest, order_id: int) -> HttpResponse | HttpResponseR
     number: str = cd["card_number"]
     brand: str = cd.get("brand", "card")
 
+    # Puntaje de fraude antes de autorizar (contadores en caché, sin consultas)
+    assessment = get_fraud_engine().assess(
+        FraudContext(
+            user_id=request.user.id,
+            amount=order.total_amount,
+            card=f"{brand}:{number[-4:]}",
+            ip=get_client_ip(request),
+        )
+    )
+
     # Crear Payment en estado initiated (sin almacenar PAN/CVV)
     payment = Payment.objects.create(
         order=order,
@@ -88,100 +112,84 @@ def process(request: HttpRequest, order_id: int) -> HttpResponse | HttpResponseR
         status="initiated",
         brand=brand,
         last4=number[-4:],
+        risk_score=assessment.score,
+        risk_reasons=assessment.reasons,
     )
 
-    # Autorizar (simulado)
-    result = simulate_authorize(number, float(order.total_amount), currency="COP")
-
-    if result.ok:
-        # Captura + actualización de inventario (transacción segura)
-        try:
-            with transaction.atomic():
-                Product = apps.get_model("catalog", "Product")
-
-                item_qs = order.items.select_related("product")
-                product_ids = list(item_qs.values_list("product_id", flat=True))
-
-                # Bloquea filas de producto para evitar carreras
-                products = {
-                    p.id: p
-                    for p in Product.objects.select_for_update().filter(id__in=product_ids)
-                }
-
-                # 1) Validar stock suficiente
-                faltantes: list[str] = []
-                for it in item_qs:
-                    p = products.get(it.product_id)
-                    if p is None:
-                        faltantes.append(
-                            _("Producto %(pid)s no existe") % {"pid": it.product_id}
-                        )
-                        continue
-                    if getattr(p, "stock_quantity") < it.quantity:
-                        faltantes.append(
-                            _("%(product)s (stock: %(stock)s, requerido: %(req)s)")
-                            % {
-                                "product": str(p),
-                                "stock": getattr(p, "stock_quantity"),
-                                "req": it.quantity,
-                            }
-                        )
-
-                if faltantes:
-                    raise ValueError(
-                        _("Stock insuficiente para: %(items)s")
-                        % {"items": ", ".join(faltantes)}
-                    )
-
-                # 2) Descontar stock (operación atómica)
-                for it in item_qs:
-                    Product.objects.filter(pk=it.product_id).update(
-                        stock_quantity=F("stock_quantity") - it.quantity
-                    )
-
-                # 3) Marcar pago/orden como exitosos
-                payment.status = "captured"
-                payment.auth_code = result.auth_code or "OK"
-                payment.error_code = ""
-                payment.error_message = ""
-                payment.save(
-                    update_fields=[
-                        "status",
-                        "auth_code",
-                        "error_code",
-                        "error_message",
-                        "updated_at",
-                    ]
-                )
-
-                order.status = "paid"
-                order.save(update_fields=["status", "updated_at"])
-
-        except Exception as e:
-            # Revertir y mostrar error
-            payment.status = "failed"
-            payment.error_code = "out_of_stock"
-            payment.error_message = str(e) or _("No hay stock suficiente.")
-            payment.save(
-                update_fields=["status", "error_code", "error_message", "updated_at"]
-            )
-
-            messages.error(request, payment.error_message)
-            return render(request, "payment/pay.html", {"order": order, "form": form})
+    if assessment.decision == "block":
+        payment.status = "failed"
+        payment.error_code = "fraud_suspected"
+        payment.error_message = _("Transacción rechazada por seguridad.")
+        payment.save(update_fields=["status", "error_code", "error_message", "updated_at"])
+        logger.warning(f"Pago {payment.id} bloqueado por fraude: {assessment.reasons}")
+        messages.error(request, payment.error_message)
+        return render(request, "payment/pay.html", {"order": order, "form": form})
+    if assessment.decision == "review":
+        logger.warning(f"Pago {payment.id} marcado para revisión: {assessment.reasons}")
 
+    # Autorizar y capturar (en segundo plano si la pasarela es asíncrona)
+    resolved = authorize_payment(payment, number)
+    if resolved is None:
+        return redirect("payment:status", payment_id=payment.id)
+
+    payment = resolved
+    if payment.status == "captured":
         messages.success(request, _("Pago realizado con éxito."))
         return redirect("payment:confirm", payment_id=payment.id)
 
-    # Fallo en la autorización
-    payment.status = "failed"
-    payment.error_code = getattr(result, "error_code", None) or "error"
-    payment.error_message = getattr(result, "msg", None) or "No fue posible procesar el pago."
-    payment.save(update_fields=["status", "error_code", "error_message", "updated_at"])
-
     messages.error(request, payment.error_message)
     return render(request, "payment/pay.html", {"order": order, "form": form})
 
 
+def _status_payload(payment: Payment) -> dict[str, Any]:
+    payload: dict[str, Any] = {"id": payment.id, "status": payment.status, "redirect_url": None}
+    if payment.status == "captured":
+        payload["redirect_url"] = reverse("payment:confirm", args=[payment.id])
+    elif payment.status == "failed":
+        # La página de estado muestra el error junto al formulario de pago
+        payload["error_message"] = payment.error_message
+        payload["redirect_url"] = reverse("payment:status", args=[payment.id])
+    return payload
+
+
+@login_required
+@require_GET
+def status(request: HttpRequest, payment_id: int) -> HttpResponse:
+    """Página de espera mientras la pasarela autoriza el pago."""
+    payment = expire_if_stale(get_object_or_404(Payment, pk=payment_id, order__user=request.user))
+    if payment.status == "captured":
+        return redirect("payment:confirm", payment_id=payment.id)
+    if payment.status == "failed":
+        messages.error(request, payment.error_message)
+        return render(request, "payment/pay.html", {"order": payment.order, "form": CardPaymentForm()})
+    return render(request, "payment/status.html", {"payment": payment, "order": payment.order})
+
+
+@login_required
+@require_GET
+def status_api(request: HttpRequest, payment_id: int) -> JsonResponse:
+    """Estado del pago en JSON, consultado periódicamente por la página de espera."""
+    payment = expire_if_stale(get_object_or_404(Payment, pk=payment_id, order__user=request.user))
+    return JsonResponse(_status_payload(payment))
+
+
+@csrf_exempt
+@require_POST
+def webhook(request: HttpRequest) -> JsonResponse:
+    """
+    Callback de la pasarela: verifica la firma, guarda el evento y responde 202.
+
+    Las transiciones de Payment/Order las aplica ``process_payment_events``.
+    """
+    if not verify_webhook_signature(request.body, request.META.get(WEBHOOK_SIGNATURE_HEADER, "")):
+        return JsonResponse({"error": "Firma inválida"}, status=401)
+    try:
+        created = record_webhook_event(request.body)
+    except PaymentError as e:
+        return JsonResponse({"error": e.message, "code": e.error_code}, status=400)
+    return JsonResponse({"received": True, "duplicate": not created}, status=202)
+
+
 @login_required
 @require_GET
 def confirm(request: HttpRequest, payment_id: int) -> HttpResponse:
@@ -193,50 +201,26 @@ def confirm(request: HttpRequest, payment_id: int) -> HttpResponse:
 
 def render_to_pdf(template_src: str, context: dict[str, Any]) -> HttpResponse | None:
     """Helper: render un template HTML a PDF (None si no hay dependencia disponible)."""
-    try:
-        from xhtml2pdf import pisa  # type: ignore
-    except Exception:
+    data = html_to_pdf(get_template(template_src).render(context))
+    if data is None:
         return None
-    template = get_template(template_src)
-    html = template.render(context)
-    result = io.BytesIO()
-    pdf = pisa.CreatePDF(io.BytesIO(html.encode("utf-8")), dest=result, encoding="utf-8")
-    if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type="application/pdf")
-    return None
+    return HttpResponse(data, content_type="application/pdf")
 
 
 @login_required
 @require_GET
 def invoice_pdf(request: HttpRequest, payment_id: int) -> HttpResponse:
-    payment = get_object_or_404(Payment, pk=payment_id, order__user=request.user)
+    payment = get_object_or_404(
+        Payment.objects.select_related("order", "invoice"), pk=payment_id, order__user=request.user
+    )
     if payment.status != "captured":
         return HttpResponseBadRequest(_("La factura solo está disponible para pagos aprobados."))
-    order = payment.order
-    items = order.items.select_related("product")
 
-    created_local = timezone.localtime(payment.created_at)
-    invoice_number = f"INV-{payment.id}-{created_local.strftime('%Y%m%d')}"
-    context: dict[str, Any] = {
-        "invoice_number": invoice_number,
-        "created_at": created_local,
-        "payment": payment,
-        "order": order,
-        "items": items,
-        # Datos del emisor (ajusta a tu negocio; valores de dato, no traducibles)
-        "company": {
-            "name": "Ctrl+Store S.A.S.",
-            "tax_id": "NIT 900.000.000-1",
-            "address": "Calle 123 #45-67, Medellín, Colombia",
-            "email": "facturacion@ctrlstore.com",
-            "phone": "+57 300 000 0000",
-        },
-    }
-
-    pdf_resp = render_to_pdf("payment/invoice.html", context)
-    if pdf_resp is None:
+    # PDF pre-renderizado (se genera aquí solo si aún no existe)
+    invoice = ensure_invoice_pdf(payment)
+    if invoice is None:
         raise Http404(_("No se pudo generar el PDF."))
 
-    filename = (_("Factura") + f"-{invoice_number}.pdf")
-    pdf_resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return pdf_resp
+    path, digest = invoice
+    filename = (_("Factura") + f"-{invoice_number(payment)}.pdf")
+    return serve_invoice(request, path, digest, filename)
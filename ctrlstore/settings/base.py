@@ -84,6 +84,11 @@ DATABASES = {
     }
 }
 
+# Caché: por defecto en memoria; en prod apuntar CACHE_URL a redis/memcached para compartirlo
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -113,3 +118,82 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
 LOCALE_PATHS = [BASE_DIR / "locale"]
+
+# Catálogos de aliados (ver catalog/partners.py); cada llave sobrescribe la config del adaptador
+CATALOG_PARTNERS = {
+    "bloomberry": {
+        "url": env("BLOOMBERRY_API_URL", default=""),
+        "cache_ttl": env.int("BLOOMBERRY_CACHE_TTL", default=300),      # segundos "fresco"
+        "stale_ttl": env.int("BLOOMBERRY_STALE_TTL", default=86400),    # segundos servible obsoleto
+        "timeout": env.float("BLOOMBERRY_TIMEOUT", default=5),
+        "deadline": env.float("BLOOMBERRY_DEADLINE", default=3),        # espera máxima de la página
+        "breaker_threshold": env.int("BLOOMBERRY_BREAKER_THRESHOLD", default=3),
+        "breaker_reset": env.int("BLOOMBERRY_BREAKER_RESET", default=60),
+    },
+}
+
+# Minutos que una orden pendiente retiene su stock reservado (ver order/services.py)
+STOCK_RESERVATION_TTL_MINUTES = env.int("STOCK_RESERVATION_TTL_MINUTES", default=15)
+
+# Envíos (ver order/shipping.py): motor de tarifas y peso por unidad si el producto no lo declara
+SHIPPING_RATE_ENGINE = "ctrlstore.apps.order.shipping.TableShippingEngine"
+SHIPPING_DEFAULT_ITEM_WEIGHT_KG = env("SHIPPING_DEFAULT_ITEM_WEIGHT_KG", default="0.5")
+
+# Pasarela de pagos (ver payment/gateways.py). Con ASYNC la autorización corre en segundo
+# plano y el cliente consulta la página de estado del pago.
+PAYMENT_GATEWAY = {
+    "ENGINE": "ctrlstore.apps.payment.gateways.SimulatorGateway",
+    "OPTIONS": {
+        "latency": env.float("PAYMENT_GATEWAY_LATENCY", default=0),        # segundos
+        "jitter": env.float("PAYMENT_GATEWAY_JITTER", default=0),
+        "failure_rate": env.float("PAYMENT_GATEWAY_FAILURE_RATE", default=0),  # 0-1
+    },
+    "ASYNC": env.bool("PAYMENT_GATEWAY_ASYNC", default=False),
+}
+PAYMENT_GATEWAY_WORKERS = env.int("PAYMENT_GATEWAY_WORKERS", default=8)
+# Segundos que un pago puede seguir "initiated" antes de marcarse fallido (gateway_timeout)
+PAYMENT_AUTHORIZATION_TIMEOUT = env.int("PAYMENT_AUTHORIZATION_TIMEOUT", default=120)
+# Secreto compartido para la firma HMAC del webhook de la pasarela (vacío = webhook deshabilitado)
+PAYMENT_WEBHOOK_SECRET = env("PAYMENT_WEBHOOK_SECRET", default="")
+
+# Facturas PDF (ver payment/invoices.py): pre-render al capturar y entrega vía servidor web
+INVOICE_PRERENDER = env.bool("INVOICE_PRERENDER", default=True)
+INVOICE_SENDFILE = env("INVOICE_SENDFILE", default="")  # "", "x-sendfile" o "x-accel-redirect"
+INVOICE_ACCEL_PREFIX = env("INVOICE_ACCEL_PREFIX", default="/protected/invoices/")
+
+# Facturación (ver billing/services.py): serie por defecto y bloques de numeración por worker.
+# Con BILLING_NUMBER_BLOCK_SIZE=1 los números siguen además el orden de emisión.
+BILLING_DEFAULT_SERIES = env("BILLING_DEFAULT_SERIES", default="FE")
+BILLING_NUMBER_BLOCK_SIZE = env.int("BILLING_NUMBER_BLOCK_SIZE", default=20)
+BILLING_BLOCK_LEASE_SECONDS = env.int("BILLING_BLOCK_LEASE_SECONDS", default=300)
+
+# Proxies inversos delante de Django (Nginx = 1); define qué entrada de X-Forwarded-For
+# es la IP real del cliente (analytics, reglas de fraude por IP)
+TRUSTED_PROXY_COUNT = env.int("TRUSTED_PROXY_COUNT", default=1)
+
+# Puntaje de fraude antes de autorizar (ver payment/fraud.py). Cada regla suma "score"
+# puntos; REVIEW_SCORE marca el pago para revisión y BLOCK_SCORE lo rechaza.
+PAYMENT_FRAUD = {
+    "ENABLED": env.bool("PAYMENT_FRAUD_ENABLED", default=True),
+    "REVIEW_SCORE": 50,
+    "BLOCK_SCORE": 80,
+    "WINDOW_BUCKETS": 10,  # buckets por ventana de velocidad
+    "RULES": [
+        {
+            "RULE": "ctrlstore.apps.payment.fraud.VelocityRule",
+            "OPTIONS": {"dimension": "user", "window": 600, "limit": 5, "score": 40},
+        },
+        {
+            "RULE": "ctrlstore.apps.payment.fraud.VelocityRule",
+            "OPTIONS": {"dimension": "card", "window": 3600, "limit": 8, "score": 40},
+        },
+        {
+            "RULE": "ctrlstore.apps.payment.fraud.VelocityRule",
+            "OPTIONS": {"dimension": "ip", "window": 600, "limit": 10, "score": 50},
+        },
+        {
+            "RULE": "ctrlstore.apps.payment.fraud.AmountOverAverageRule",
+            "OPTIONS": {"multiplier": 5, "min_history": 3, "score": 30},
+        },
+    ],
+}